@@ -0,0 +1,75 @@
+"""
+Measures export throughput and peak memory on a synthetic database.
+
+Each measurement runs in its own interpreter so the peak RSS of one does not hide another's.
+get_all_records (fetchall) is included as the in-memory baseline.
+
+Usage:
+    python -m benchmarks.bench_export --users 2000 --days 365 --messages 3   # about 2.2 million records
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from .synthetic import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_FETCHALL = """
+import json, sys, time, resource
+from lib.database import set_database, get_all_records
+set_database(sys.argv[1])
+started = time.perf_counter()
+rows = len(get_all_records())
+seconds = time.perf_counter() - started
+print(json.dumps({"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+_EXPORT = """
+import json, sys
+from lib.database import set_database
+from lib.database.db_export import export_table
+set_database(sys.argv[1])
+print(json.dumps(export_table("records", sys.argv[2], format=sys.argv[3])))
+"""
+
+
+def _run(code, *args):
+    result = subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark streaming export against fetchall.")
+    parser.add_argument("--database", default="benchmarks/data/export.db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--messages", type=int, default=1)
+    parser.add_argument("--reuse", action="store_true", help="Reuse an existing database instead of regenerating it.")
+    args = parser.parse_args(argv)
+
+    if not (args.reuse and os.path.exists(args.database)):
+        records = generate(args.database, users=args.users, days=args.days, messages=args.messages)
+        print(f"Generated {records} records in {args.database}")
+
+    output = os.path.join(os.path.dirname(args.database), "export")
+    results = {
+        "fetchall": _run(_FETCHALL, args.database),
+        "csv": _run(_EXPORT, args.database, output + ".csv", "csv"),
+        "parquet": _run(_EXPORT, args.database, output + ".parquet", "parquet"),
+    }
+
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:>8}: {result['error']}")
+        else:
+            print(f"{name:>8}: {result['rows']} rows in {result['seconds']:.1f} s, "
+                  f"{result['rows_per_second']:.0f} rows/s, peak RSS {result['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmarks the reminder fan-out against a fake Discord client.
+
+The fake client simulates API latency, a partially warm user cache, occasional 429 and 5xx
+responses and users who block DMs. The old sequential loop is measured for comparison.
+
+Usage:
+    python -m benchmarks.bench_fanout --users 500 --latency 0.15
+"""
+import time
+import random
+import asyncio
+import argparse
+from lib.utility.fanout import fan_out, RateLimiter
+
+
+class FakeHTTPException(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class FakeUser:
+    def __init__(self, client, user_id):
+        self.client = client
+        self.id = user_id
+
+    async def send(self, content):
+        await self.client.request()
+        if self.id in self.client.blocked:
+            raise FakeHTTPException(403)
+        self.client.sent += 1
+
+
+class FakeDiscordClient:
+    """
+    Mimics the parts of discord.Client used by the reminder: get_user, fetch_user and User.send.
+    """
+
+    def __init__(self, user_ids, latency=0.15, cached_fraction=0.8, error_rate=0.02, blocked_fraction=0.01, seed=0):
+        rng = random.Random(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = rng
+        self.cache = {user_id: FakeUser(self, user_id) for user_id in user_ids if rng.random() < cached_fraction}
+        self.blocked = {user_id for user_id in user_ids if rng.random() < blocked_fraction}
+        self.requests = 0
+        self.sent = 0
+
+    async def request(self):
+        self.requests += 1
+        await asyncio.sleep(self.latency * (0.5 + self.rng.random()))
+        roll = self.rng.random()
+        if roll < self.error_rate / 2:
+            raise FakeHTTPException(429, retry_after=0.01)
+        if roll < self.error_rate:
+            raise FakeHTTPException(503)
+
+    def get_user(self, user_id):
+        return self.cache.get(user_id)
+
+    async def fetch_user(self, user_id):
+        await self.request()
+        return FakeUser(self, user_id)
+
+
+async def sequential(client, user_ids):
+    """The reminder loop as it was before fan_out: one fetch and one send per user, in order."""
+    delivered = failed = 0
+    for user_id in user_ids:
+        try:
+            user = await client.fetch_user(user_id)
+            await user.send("Hello! How are you feeling today?")
+            delivered += 1
+        except Exception:
+            failed += 1
+    return delivered, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the reminder fan-out against a fake Discord client.")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.15, help="Mean simulated API latency in seconds.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args(argv)
+
+    user_ids = list(range(1, args.users + 1))
+
+    if not args.skip_sequential:
+        client = FakeDiscordClient(user_ids, latency=args.latency)
+        started = time.perf_counter()
+        delivered, failed = asyncio.run(sequential(client, user_ids))
+        print(f"sequential: {delivered} delivered, {failed} failed, {client.requests} requests, "
+              f"{time.perf_counter() - started:.2f} s")
+
+    client = FakeDiscordClient(user_ids, latency=args.latency)
+    limiter = RateLimiter()
+    summary = asyncio.run(fan_out(user_ids, client.get_user, client.fetch_user,
+                                  lambda user: user.send("Hello! How are you feeling today?"),
+                                  concurrency=args.concurrency, limiter=limiter, backoff=0.05))
+    print(f"fan_out:    {summary['delivered']} delivered, {summary['failed']} failed, {client.requests} requests, "
+          f"{summary['duration']:.2f} s ({summary['fetched']} cache misses)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures sustained check-in insert throughput with and without the write-behind buffer.
+
+A burst like the one after the daily reminder is simulated by several threads calling
+add_data_to_records as fast as they can. Without the buffer every call is its own transaction,
+with it the rows are written in executemany batches.
+
+Usage:
+    python -m benchmarks.bench_writer --writers 8 --inserts 20000
+"""
+import os
+import time
+import random
+import argparse
+import threading
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records,
+    enable_write_behind, disable_write_behind, transaction
+)
+from .synthetic import synthetic_analysis
+
+
+def _reset(path, users):
+    close_connections()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    set_database(path)
+    init_database()
+    with transaction():
+        for user_id in range(1, users + 1):
+            add_user(user_id, f"user{user_id}")
+
+
+def _burst(writers, inserts, users):
+    def writer(seed):
+        rng = random.Random(seed)
+        for _ in range(inserts // writers):
+            add_data_to_records(rng.randint(1, users), synthetic_analysis(rng), "Synthetic check-in")
+
+    threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return started
+
+
+def run(path, writers, inserts, users, buffered, max_rows=500, max_delay=0.5):
+    """
+    :return: dict with rows, seconds and rows_per_second, including the final flush when buffered
+    """
+    _reset(path, users)
+    if buffered:
+        enable_write_behind(max_rows=max_rows, max_delay=max_delay)
+    started = _burst(writers, inserts, users)
+    if buffered:
+        disable_write_behind()
+    seconds = time.perf_counter() - started
+
+    rows = (inserts // writers) * writers
+    return {"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark direct inserts against the write-behind buffer.")
+    parser.add_argument("--database", default="benchmarks/data/writer.db")
+    parser.add_argument("--writers", type=int, default=8, help="Concurrent threads adding check-ins.")
+    parser.add_argument("--inserts", type=int, default=20_000, help="Check-ins added in total.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--max-rows", type=int, default=500)
+    parser.add_argument("--max-delay", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    for name, buffered in (("direct", False), ("buffered", True)):
+        result = run(args.database, args.writers, args.inserts, args.users, buffered, args.max_rows, args.max_delay)
+        print(f"{name:>8}: {result['rows']} inserts in {result['seconds']:.2f} s, "
+              f"{result['rows_per_second']:.0f} inserts/s")
+    close_connections()
+
+
+if __name__ == "__main__":
+    main()
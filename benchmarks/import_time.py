@@ -0,0 +1,83 @@
+"""
+Measures cold import time of the bot's modules with `python -X importtime` and checks it against a budget.
+
+Every module is imported in a fresh interpreter several times and the median cumulative time is reported,
+together with the slowest imports it pulls in. The exit code is 1 if any module exceeds its budget.
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 10 --top 15 lib.database lib.LLM
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), "import_budget.json")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module):
+    """
+    Imports a module in a fresh interpreter.
+
+    :param module: str
+    :return: (total_ms, list of (cumulative_ms, imported_module)) for every import made
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    imports = []
+    total = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_ms = int(cumulative) / 1000
+        imports.append((cumulative_ms, name.strip()))
+        if name.rstrip() == f" {module}":
+            total = cumulative_ms
+
+    return total, imports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check module import times against a budget.")
+    parser.add_argument("modules", nargs="*", help="Modules to measure, defaults to every module in the budget.")
+    parser.add_argument("--budget", default=BUDGET_FILE, help="JSON file mapping modules to a budget in ms.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list per module.")
+    args = parser.parse_args(argv)
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+    modules = args.modules or list(budget)
+
+    over_budget = []
+    for module in modules:
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        median = statistics.median(total for total, _ in runs)
+        limit = budget.get(module)
+
+        status = "no budget" if limit is None else ("OK" if median <= limit else "OVER BUDGET")
+        print(f"{module}: {median:.1f} ms (budget {limit} ms) {status}")
+
+        _, imports = runs[-1]
+        for cumulative_ms, name in sorted(imports, reverse=True)[1:args.top + 1]:
+            print(f"    {cumulative_ms:8.1f} ms  {name}")
+
+        if limit is not None and median > limit:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Over budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
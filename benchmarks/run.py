@@ -0,0 +1,211 @@
+"""
+Benchmark suite for the database, scoring, parsing and plotting hot paths.
+
+A synthetic database is generated first (see benchmarks.synthetic), then every case is run `number`
+times per round for `repeat` rounds and the median round is reported as the time per call. Results
+are written as JSON and compared with a saved baseline; the exit code is 1 if any case got slower
+than the baseline by more than the threshold.
+
+Usage:
+    python -m benchmarks.run --save-baseline              # record benchmarks/baseline.json
+    python -m benchmarks.run                              # compare against it
+    python -m benchmarks.run --filter db. --threshold 0.1
+    python -m benchmarks.run --users 1000 --days 365 --messages 2 --reuse
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import statistics
+from .synthetic import generate, synthetic_analysis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+PLOT_METRICS = ["all", "mood", "sentiment", "well_being", "energy", "productivity", "score"]
+
+LEGACY_RESPONSE = """1. Sentiment: Positive
+2. Mood: Good
+3. Key Topics: work, friends, exercise
+4. Well-being: 7
+5. Energy: 6
+6. Productivity: 8"""
+
+STRUCTURED_RESPONSE = '{"s":1,"m":3,"t":["work","friends","exercise"],"w":7,"e":6,"p":8}'
+
+
+def measure(function, setup=None, number=100, repeat=5):
+    """
+    Times a callable. setup runs before every call and is not timed.
+
+    :param function: callable without arguments
+    :param setup: callable without arguments, optional
+    :param number: int, calls per round
+    :param repeat: int, rounds
+    :return: dict with median and min seconds per call, number and repeat
+    """
+    rounds = []
+    for _ in range(repeat):
+        total = 0.0
+        for _ in range(number):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            function()
+            total += time.perf_counter() - started
+        rounds.append(total / number)
+    return {"median": statistics.median(rounds), "min": min(rounds), "number": number, "repeat": repeat}
+
+
+def build_cases(users):
+    """
+    :param users: int, number of users in the synthetic database
+    :return: dict mapping case names to (function, setup, number)
+    """
+    import lib.database as db
+    from lib.LLM.LLM_message_analyser import parse_llm_response
+    from lib.utility.functions import calculate_composite_score, calculate_composite_scores
+    from lib.plotting.datavisualiser import plot_metric_over_time
+    from lib.plotting.plot_cache import plot_cache
+
+    rng = random.Random(0)
+    user = users // 2 or 1
+    year_ago = datetime.datetime.now() - datetime.timedelta(days=365)
+    analysis = synthetic_analysis(rng)
+    frame = {key: [synthetic_analysis(rng)[key] for _ in range(10_000)]
+             for key in ("sentiment", "mood", "well_being", "energy", "productivity")}
+
+    # Read-only cases first, so the inserts below do not change what they read
+    cases = {
+        "db.get_users": (db.get_users, None, 20),
+        "db.get_user_name": (lambda: db.get_user_name(user), None, 1000),
+        "db.get_last_n_records_for_user": (lambda: db.get_last_n_records_for_user(user, 10), None, 1000),
+        "db.get_last_n_records_for_user[score,365]": (
+            lambda: db.get_last_n_records_for_user(user, 365, "score"), None, 200),
+        "db.get_records_in_range[date+score,365d]": (
+            lambda: db.get_records_in_range(user, start=year_ago, columns=["date", "score"], as_columns=True),
+            None, 200),
+        "db.get_latest_record_id": (lambda: db.get_latest_record_id(user), None, 1000),
+        "db.get_incidents_for_user": (lambda: db.get_incidents_for_user(user), None, 500),
+        "db.get_daily_rollups_for_user": (lambda: db.get_daily_rollups_for_user(user, 365), None, 200),
+        "db.get_all_records": (db.get_all_records, None, 1),
+        "search.search_records[2 words]": (lambda: db.search_records(user, "project meeting"), None, 20),
+        "search.get_topic_counts": (lambda: db.get_topic_counts(user), None, 200),
+        "search.get_topic_counts[all users]": (lambda: db.get_topic_counts(), None, 5),
+        "search.get_topic_count": (lambda: db.get_topic_count(user, "work"), None, 1000),
+        # The analytics cache is cleared before every call, so each one runs its query
+        "analytics.get_weekly_activity[52]": (lambda: db.get_weekly_activity(52), db.clear_analytics_cache, 20),
+        "analytics.get_mood_distribution[30]": (lambda: db.get_mood_distribution(30), db.clear_analytics_cache, 20),
+        "analytics.get_server_summary[30]": (lambda: db.get_server_summary(30), db.clear_analytics_cache, 20),
+        "llm.parse_llm_response[legacy]": (lambda: parse_llm_response(LEGACY_RESPONSE), None, 5000),
+        "llm.parse_llm_response[structured]": (lambda: parse_llm_response(STRUCTURED_RESPONSE), None, 5000),
+        "score.calculate_composite_score": (lambda: calculate_composite_score(dict(analysis)), None, 10_000),
+        "score.calculate_composite_scores[10k]": (lambda: calculate_composite_scores(frame), None, 20),
+    }
+    for metric in PLOT_METRICS:
+        # The cache is cleared before every call, so each one renders
+        cases[f"plot.plot_metric_over_time[{metric}]"] = (
+            lambda metric=metric: plot_metric_over_time(user, metric, 31), plot_cache.invalidate, 3)
+    cases["db.add_data_to_records"] = (
+        lambda: db.add_data_to_records(rng.randint(1, users), analysis, "Benchmark check-in"), None, 500)
+    cases["db.add_incident"] = (lambda: db.add_incident(rng.randint(1, users), "Benchmark incident"), None, 500)
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: list of (name, baseline seconds, current seconds) for cases slower than baseline * (1 + threshold)
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is not None and result["median"] > previous["median"] * (1 + threshold):
+            regressions.append((name, previous["median"], result["median"]))
+    return regressions
+
+
+def _format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:9.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:9.2f} ms"
+    return f"{seconds:9.2f} s "
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare it with a baseline.")
+    parser.add_argument("--database", default="benchmarks/data/bench.db")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--messages", type=int, default=1, help="Check-ins per user per day.")
+    parser.add_argument("--reuse", action="store_true", help="Reuse an existing database instead of regenerating it.")
+    parser.add_argument("--filter", default=None, help="Only run cases whose name contains this text.")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per case.")
+    parser.add_argument("--output", default="benchmarks/data/results.json", help="Where to write the results.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Results to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline, 0.25 meaning 25 %%.")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    if not (args.reuse and os.path.exists(args.database)):
+        records = generate(args.database, users=args.users, days=args.days, messages=args.messages)
+        print(f"Generated {records} records in {args.database}")
+    else:
+        from lib.database import set_database, init_database
+        set_database(args.database)
+        init_database()
+
+    results = {}
+    for name, (function, setup, number) in build_cases(args.users).items():
+        if args.filter and args.filter not in name:
+            continue
+        function()  # Warm up caches and lazy imports outside the measurement
+        results[name] = measure(function, setup, number=number, repeat=args.repeat)
+        print(f"{name:<48}{_format_time(results[name]['median'])}")
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "users": args.users, "days": args.days, "messages": args.messages,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["meta"].get("users") != args.users or baseline["meta"].get("days") != args.days:
+        print("Warning: the baseline was recorded on a database of a different size")
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    for name, before, after in regressions:
+        print(f"REGRESSION {name}: {_format_time(before).strip()} -> {_format_time(after).strip()} "
+              f"({after / before - 1:+.0%})")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Generates a synthetic CheckIn database with users x days x messages per day.
+
+Rows are inserted directly with executemany, then the daily rollups and topic index are rebuilt, which is much
+faster than going through add_data_to_records one check-in at a time.
+
+Usage:
+    python -m benchmarks.synthetic benchmarks/data/synthetic.db --users 1000 --days 365 --messages 2
+"""
+import os
+import random
+import argparse
+import datetime
+from lib.database import init_database, set_database, transaction, rebuild_daily_rollups, rebuild_record_topics
+from lib.utility.functions import calculate_composite_score, SENTIMENT_MAPPING, MOOD_MAPPING
+
+SENTIMENTS = list(SENTIMENT_MAPPING)
+MOODS = list(MOOD_MAPPING)
+TOPICS = ["work", "family", "friends", "sleep", "exercise", "exams", "project", "weather", "health", "music",
+          "travel", "food", "deadline", "meeting", "weekend"]
+WORDS = ["today", "I", "felt", "really", "tired", "happy", "busy", "after", "the", "long", "meeting", "and", "a",
+         "walk", "with", "friends", "finished", "my", "project", "slept", "badly", "good", "day", "at", "work"]
+
+INSERT_BATCH = 10_000
+
+
+def synthetic_analysis(rng):
+    return {
+        "sentiment": rng.choice(SENTIMENTS),
+        "mood": rng.choice(MOODS),
+        "key_topics": rng.sample(TOPICS, rng.randint(1, 3)),
+        "well_being": rng.randint(1, 10),
+        "energy": rng.randint(1, 10),
+        "productivity": rng.randint(1, 10),
+    }
+
+
+def _record_rows(users, days, messages, rng):
+    today = datetime.datetime.now().replace(hour=21, minute=0, second=0, microsecond=0)
+    for day in range(days, 0, -1):
+        for user_id in range(1, users + 1):
+            for message in range(messages):
+                date = today - datetime.timedelta(days=day, minutes=rng.randint(0, 120) + message * 180)
+                data = synthetic_analysis(rng)
+                yield (user_id, date.isoformat(), data["well_being"], data["energy"], data["productivity"],
+                       data["sentiment"], data["mood"], calculate_composite_score(dict(data)),
+                       ", ".join(data["key_topics"]), " ".join(rng.choices(WORDS, k=rng.randint(12, 40))),
+                       int(date.timestamp()))
+
+
+def _insert(cursor, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == INSERT_BATCH:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def generate(path, users=100, days=90, messages=1, incident_rate=0.02, seed=0):
+    """
+    Creates (or replaces) a database filled with synthetic users, records and incidents,
+    and leaves the connection manager pointing at it.
+
+    :param path: str, database file
+    :param users: int
+    :param days: int, days of history per user
+    :param messages: int, check-ins per user per day
+    :param incident_rate: float, probability of an incident per user per day
+    :param seed: int
+    :return: int, number of records created
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    rng = random.Random(seed)
+    set_database(path)
+    init_database()
+
+    with transaction() as cursor:
+        cursor.executemany("INSERT INTO users (id, name) VALUES (?, ?)",
+                           [(user_id, f"User{user_id}") for user_id in range(1, users + 1)])
+        _insert(cursor, """INSERT INTO records (user_id, date, well_being, energy, productivity, sentiment, mood,
+                        score, key_topics, message, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                _record_rows(users, days, messages, rng))
+
+        now = datetime.datetime.now()
+        incidents = ((user_id, (now - datetime.timedelta(days=day)).isoformat(), "Synthetic incident",
+                      int((now - datetime.timedelta(days=day)).timestamp()))
+                     for day in range(days, 0, -1) for user_id in range(1, users + 1) if rng.random() < incident_rate)
+        _insert(cursor, "INSERT INTO incidents (user_id, date, incident, ts) VALUES (?, ?, ?, ?)", incidents)
+
+    rebuild_daily_rollups()
+    rebuild_record_topics()
+    return users * days * messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic CheckIn database.")
+    parser.add_argument("path", help="Database file to create.")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--messages", type=int, default=1, help="Check-ins per user per day.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    records = generate(args.path, users=args.users, days=args.days, messages=args.messages, seed=args.seed)
+    print(f"Created {args.path} with {args.users} users and {records} records")
+
+
+if __name__ == "__main__":
+    main()
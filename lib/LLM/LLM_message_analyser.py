@@ -1,8 +1,201 @@
-from openai import OpenAI
 import re
+import json
+import math
+from .analysis_cache import AnalysisCache
+from lib.utility.metrics import timed
+from lib.utility.functions import SENTIMENT_MAPPING, MOOD_MAPPING
 
-client = OpenAI()
+_client = None
 
+def get_client():
+  """
+  Returns the shared OpenAI client, creating it on first use.
+  The openai package is only imported here, which keeps it out of the bot's import time.
+  """
+  global _client
+  if _client is None:
+    from openai import OpenAI
+    _client = OpenAI()
+  return _client
+
+MODEL = "gpt-4o-mini"
+
+# Bump whenever SYSTEM_PROMPT or the request parameters change, so cached analyses are not reused.
+PROMPT_VERSION = "2"
+
+# With structured output the model answers with compact JSON constrained by a JSON schema,
+# which needs far fewer output tokens than the labelled text of the legacy prompt.
+STRUCTURED_OUTPUT = True
+
+# Ordered from worst to best, so the integer codes of the structured mode index them
+SENTIMENT_LABELS = list(SENTIMENT_MAPPING)
+MOOD_LABELS = list(MOOD_MAPPING)
+MAX_TOPICS = 5
+
+SYSTEM_PROMPT = """Analyze the following message, whatever the content of the message only respond with the following metrics:
+      1. Sentiment (as 'Very Negative', 'Negative', 'Neutral', 'Positive', 'Very Positive')
+      2. Mood (as 'Very Bad', 'Bad', 'Neutral', 'Good', 'Very Good')
+      3. Key Topics (list the key topics mentioned)
+      4. Well-being (rate from 1 to 10)
+      5. Energy (rate from 1 to 10)
+      6. Productivity (rate from 1 to 10)"""
+
+STRUCTURED_SYSTEM_PROMPT = """Analyze the following message, whatever its content, and answer with JSON only:
+      s: sentiment from -2 (very negative) to 2 (very positive)
+      m: mood from 0 (very bad) to 4 (very good)
+      t: up to 5 key topics, one or two words each
+      w, e, p: well-being, energy and productivity, each from 1 to 10"""
+
+_ANALYSIS_SCHEMA = {
+  "type": "object",
+  "properties": {
+    "s": {"type": "integer", "enum": [-2, -1, 0, 1, 2]},
+    "m": {"type": "integer", "enum": [0, 1, 2, 3, 4]},
+    "t": {"type": "array", "items": {"type": "string"}},
+    "w": {"type": "integer"},
+    "e": {"type": "integer"},
+    "p": {"type": "integer"}
+  },
+  "required": ["s", "m", "t", "w", "e", "p"],
+  "additionalProperties": False
+}
+
+_BATCH_SCHEMA = {
+  "type": "object",
+  "properties": {"r": {"type": "array", "items": _ANALYSIS_SCHEMA}},
+  "required": ["r"],
+  "additionalProperties": False
+}
+
+
+class ParseError(ValueError):
+  """Raised when an LLM reply cannot be turned into metrics."""
+
+
+def _response_format(name, schema):
+  return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+def build_request(message):
+  """
+  Builds the chat completion arguments used to analyse a message.
+  Shared by the synchronous analyser and the async analysis service.
+
+  :param message: The message to be analysed.
+  :return: A dictionary of keyword arguments for chat.completions.create.
+  """
+  if STRUCTURED_OUTPUT:
+    return {
+      "model": MODEL,
+      "messages": [
+        {"role": "system", "content": STRUCTURED_SYSTEM_PROMPT},
+        {"role": "user", "content": message}
+      ],
+      "temperature": 0.2,
+      "max_tokens": 80,
+      "response_format": _response_format("analysis", _ANALYSIS_SCHEMA)
+    }
+  return {
+    "model": MODEL,
+    "messages": [
+      {"role": "system", "content": SYSTEM_PROMPT},
+      {"role": "user", "content": message}
+    ],
+    "temperature": 0.2,
+    "max_tokens": 150
+  }
+
+def build_batch_request(messages):
+  """
+  Builds the chat completion arguments used to analyse several messages in one request.
+  With structured output the model answers with one JSON object per message, in order;
+  otherwise with one "### Message <n>" section per message.
+
+  :param messages: A list of messages to be analysed.
+  :return: A dictionary of keyword arguments for chat.completions.create.
+  """
+  numbered = "\n\n".join(f"### Message {i}\n{message}" for i, message in enumerate(messages, start=1))
+  if STRUCTURED_OUTPUT:
+    return {
+      "model": MODEL,
+      "messages": [
+        {"role": "system", "content": STRUCTURED_SYSTEM_PROMPT + """
+      Several messages are given, each starting with a '### Message <n>' header.
+      Analyze each one separately and put one analysis per message, in the same order, in the list r."""},
+        {"role": "user", "content": numbered}
+      ],
+      "temperature": 0.2,
+      "max_tokens": 80 * len(messages),
+      "response_format": _response_format("analyses", _BATCH_SCHEMA)
+    }
+  return {
+    "model": MODEL,
+    "messages": [
+      {"role": "system", "content": SYSTEM_PROMPT + """
+      Several messages are given, each starting with a '### Message <n>' header.
+      Analyze each one separately and start the metrics of each message with the same '### Message <n>' header."""},
+      {"role": "user", "content": numbered}
+    ],
+    "temperature": 0.2,
+    "max_tokens": 150 * len(messages)
+  }
+
+def parse_batch_response(response_text, count):
+  """
+  Splits a batched LLM response into per-message metrics.
+
+  :param response_text: The raw text response from the LLM.
+  :param count: The number of messages in the request.
+  :return: A list with a metrics dictionary, or None if that section was missing or malformed, per message.
+  """
+  results = [None] * count
+
+  if response_text.lstrip().startswith("{"):
+    try:
+      analyses = json.loads(response_text)["r"]
+    except (ValueError, KeyError, TypeError):
+      return results
+    for index, analysis in enumerate(analyses[:count] if isinstance(analyses, list) else []):
+      try:
+        results[index] = _validate_structured(analysis)
+      except ParseError:
+        pass
+    return results
+
+  sections = re.split(r'^\s*#+\s*Message\s+(\d+)\s*$', response_text, flags=re.MULTILINE)
+
+  # re.split alternates between the header number and the section body
+  for number, body in zip(sections[1::2], sections[2::2]):
+    index = int(number) - 1
+    if 0 <= index < count:
+      try:
+        results[index] = parse_llm_response(body)
+      except ParseError:
+        pass
+
+  return results
+
+def analyse_messages_with_LLM(messages):
+  """
+  Analyses several messages with a single request.
+
+  :param messages: A list of messages to be analysed.
+  :return: A list with a metrics dictionary, or None if parsing failed, per message.
+  """
+  assert all(isinstance(message, str) for message in messages), "Messages must be strings."
+
+  if len(messages) == 1:
+    try:
+      return [analyse_message_with_LLM(messages[0])]
+    except ParseError:
+      return [None]
+
+  response = get_client().chat.completions.create(**build_batch_request(messages))
+  return parse_batch_response(response.choices[0].message.content, len(messages))
+
+analysis_cache = AnalysisCache(MODEL, PROMPT_VERSION)
+
+@analysis_cache.cached
+@timed("llm.analyse_message")
 def analyse_message_with_LLM(message):
   """
   Analyses message using gpt-4o-mini model and returns metrics.
@@ -11,83 +204,129 @@ def analyse_message_with_LLM(message):
 
   :return: A dictionary containing the following metrics:
 
-  - sentiment: A float between -1.0 (Very Negative) and 1.0 (Very Positive).
-  - mood: A float between 0.0 (Very Bad) and 1.0 (Very Good).
+  - sentiment: One of SENTIMENT_LABELS.
+  - mood: One of MOOD_LABELS.
   - key_topics: A list of key topics mentioned in the message.
   - well_being: An integer between 1 and 10.
   - energy: An integer between 1 and 10.
   - productivity: An integer between 1 and 10.
+
+  :raises ParseError: if the reply cannot be parsed.
   """
 
   assert isinstance(message, str), "Message must be a string."
 
-  response = client.chat.completions.create(
-    model="gpt-4o-mini",
-    messages=[
-      {"role": "system", "content": """Analyze the following message, whatever the content of the message only respond with the following metrics:
-      1. Sentiment (as 'Very Negative', 'Negative', 'Neutral', 'Positive', 'Very Positive')
-      2. Mood (as 'Very Bad', 'Bad', 'Neutral', 'Good', 'Very Good')
-      3. Key Topics (list the key topics mentioned)
-      4. Well-being (rate from 1 to 10)
-      5. Energy (rate from 1 to 10)
-      6. Productivity (rate from 1 to 10)"""},
-      {"role": "user", "content": message}
-    ],
-    temperature=0.2,
-    max_tokens=150
-  )
+  response = get_client().chat.completions.create(**build_request(message))
   return parse_llm_response(response.choices[0].message.content)
 
 
+def _clamp(value, low, high):
+  return max(low, min(high, value))
+
+def _topics(topics):
+  topics = [topic.strip() for topic in topics if isinstance(topic, str) and topic.strip()]
+  return topics[:MAX_TOPICS]
+
+def _validate_structured(analysis):
+  """
+  Converts a structured analysis object into metrics, clamping out-of-range values.
+
+  :param analysis: dict with the keys of _ANALYSIS_SCHEMA.
+  :return: A dictionary with parsed metrics.
+  :raises ParseError: if a field is missing, has the wrong type or is not a finite number.
+  """
+  if not isinstance(analysis, dict):
+    raise ParseError(f"Expected a JSON object: {analysis!r}")
+  try:
+    sentiment, mood, topics = analysis["s"], analysis["m"], analysis["t"]
+    well_being, energy, productivity = analysis["w"], analysis["e"], analysis["p"]
+  except KeyError as e:
+    raise ParseError(f"Missing field {e.args[0]}: {analysis!r}")
+
+  # bool is a subclass of int, but true/false are not valid scores
+  for number in (sentiment, mood, well_being, energy, productivity):
+    if type(number) not in (int, float):
+      raise ParseError(f"Scores must be numbers: {analysis!r}")
+    # json.loads accepts NaN and Infinity, which round() cannot convert
+    if not math.isfinite(number):
+      raise ParseError(f"Scores must be finite: {analysis!r}")
+  if type(topics) is not list:
+    raise ParseError(f"Topics must be a list: {analysis!r}")
+
+  return {
+    "sentiment": SENTIMENT_LABELS[_clamp(round(sentiment), -2, 2) + 2],
+    "mood": MOOD_LABELS[_clamp(round(mood), 0, 4)],
+    "key_topics": _topics(topics),
+    "well_being": _clamp(round(well_being), 1, 10),
+    "energy": _clamp(round(energy), 1, 10),
+    "productivity": _clamp(round(productivity), 1, 10),
+  }
+
+def parse_structured_response(response_text):
+  """
+  Parses a JSON reply of the structured mode in a single pass.
+
+  :param response_text: The raw text response from the LLM.
+  :return: A dictionary with parsed metrics.
+  :raises ParseError: if the reply is not valid JSON or misses a field.
+  """
+  try:
+    analysis = json.loads(response_text)
+  except ValueError as e:
+    raise ParseError(f"Invalid JSON ({e}): {response_text}")
+  return _validate_structured(analysis)
+
+def _alternatives(labels):
+  # Longest first, so "Very Good" is not matched as "Good"
+  return "|".join(sorted(labels, key=len, reverse=True))
+
+# A single pass over the reply picks up every metric. Each metric has its own named group, so the
+# name of the group that matched tells which one was found. Markdown bold markers are tolerated.
+# The topics end at the end of their line or at the next label, for replies written on a single line.
+_LEGACY_REPLY = re.compile(
+  rf'Sentiment[*\s]*:[*\s]*(?P<sentiment>{_alternatives(SENTIMENT_LABELS)})'
+  rf'|Mood[*\s]*:[*\s]*(?P<mood>{_alternatives(MOOD_LABELS)})'
+  r'|Key Topics[*\s]*:[*\s]*(?P<key_topics>.*?)'
+  r'(?=[*\s]*\b(?:Sentiment|Mood|Key Topics|Well-being|Energy|Productivity)[*\s]*:|\n|\Z)'
+  r'|Well-being[*\s]*:\D*?(?P<well_being>\d+)'
+  r'|Energy[*\s]*:\D*?(?P<energy>\d+)'
+  r'|Productivity[*\s]*:\D*?(?P<productivity>\d+)'
+)
+_LEGACY_FIELDS = ("sentiment", "mood", "key_topics", "well_being", "energy", "productivity")
+
+def parse_legacy_response(response_text):
+  """
+  Parses a labelled text reply ("Sentiment: Positive", ...) of the legacy prompt.
+
+  :param response_text: The raw text response from the LLM.
+  :return: A dictionary with parsed metrics.
+  :raises ParseError: if a metric is missing.
+  """
+  metrics = {}
+
+  for match in _LEGACY_REPLY.finditer(response_text):
+    key = match.lastgroup
+    if key not in metrics:
+      metrics[key] = match.group(key)
+
+  if len(metrics) < len(_LEGACY_FIELDS):
+    missing = [key for key in _LEGACY_FIELDS if key not in metrics]
+    raise ParseError(f"{', '.join(missing)} must be provided: {response_text}")
+
+  metrics["key_topics"] = _topics(metrics["key_topics"].split(','))
+  for key in ("well_being", "energy", "productivity"):
+    metrics[key] = _clamp(int(metrics[key]), 1, 10)
+  return metrics
+
 def parse_llm_response(response_text):
     """
     Parses the LLM response and converts it into a structured dictionary.
+    JSON replies of the structured mode are parsed directly, anything else as a legacy text reply.
 
     :param response_text: The raw text response from the LLM.
     :return: A dictionary with parsed metrics.
+    :raises ParseError: if the reply cannot be parsed.
     """
-
-    metrics = {}
-
-    # Extract sentiment
-    sentiment_match = re.search(r'Sentiment:\s*(Very Negative|Negative|Neutral|Positive|Very Positive)', response_text)
-    if sentiment_match:
-        metrics['sentiment'] = sentiment_match.group(1)
-
-    # Extract mood
-    mood_match = re.search(r'Mood:\s*(Very Bad|Bad|Neutral|Good|Very Good)', response_text)
-    if mood_match:
-        metrics['mood'] = mood_match.group(1)
-
-    # Extract key topics
-    topics_match = re.search(r'Key Topics:\s*(.*)', response_text)
-    if topics_match:
-        metrics['key_topics'] = [topic.strip() for topic in topics_match.group(1).split(',')]
-
-    # Extract well-being, energy, productivity
-    well_being_match = re.search(r'Well-being:\s*(\d+)', response_text)
-    energy_match = re.search(r'Energy:\s*(\d+)', response_text)
-    productivity_match = re.search(r'Productivity:\s*(\d+)', response_text)
-
-    if well_being_match:
-        metrics['well_being'] = int(well_being_match.group(1))
-    if energy_match:
-        metrics['energy'] = int(energy_match.group(1))
-    if productivity_match:
-        metrics['productivity'] = int(productivity_match.group(1))
-
-    assert 'sentiment' in metrics, f"Sentiment must be provided: {response_text}"
-    assert 'mood' in metrics, f"Mood must be provided: {response_text}"
-    assert 'key_topics' in metrics, f"Key topics must be provided: {response_text}"
-    assert 'well_being' in metrics, f"Well-being must be provided: {response_text}"
-    assert 'energy' in metrics, f"Energy must be provided: {response_text}"
-    assert 'productivity' in metrics, f"Productivity must be provided: {response_text}"
-
-    assert isinstance(metrics['sentiment'], str), f"Sentiment must be a str: {response_text}"
-    assert isinstance(metrics['mood'], str), f"Mood must be a str: {response_text}"
-    assert isinstance(metrics['key_topics'], list), f"Key topics must be a list: {response_text}"
-    assert isinstance(metrics['well_being'], int), f"Well-being must be an integer: {response_text}"
-    assert isinstance(metrics['energy'], int), f"Energy must be an integer: {response_text}"
-    assert isinstance(metrics['productivity'], int), f"Productivity must be an integer: {response_text}"
-
-    return metrics
\ No newline at end of file
+    if response_text.lstrip().startswith("{"):
+        return parse_structured_response(response_text)
+    return parse_legacy_response(response_text)
@@ -1 +1,4 @@
-from .LLM_message_analyser import analyse_message_with_LLM
\ No newline at end of file
+from .LLM_message_analyser import analyse_message_with_LLM, analysis_cache, ParseError
+from .analysis_service import AnalysisService
+from .local_analyser import analyse_message_locally
+from .hedging import HedgedCheckIn
\ No newline at end of file
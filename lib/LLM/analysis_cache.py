@@ -0,0 +1,188 @@
+import re
+import copy
+import json
+import time
+import hashlib
+import threading
+import functools
+import unicodedata
+from collections import OrderedDict
+import lib.database as db
+
+# Part of every key, so entries stored under an earlier normalize_message are not reused
+NORMALIZATION_VERSION = "2"
+
+
+def normalize_message(message):
+    """
+    Normalizes a message so that trivially different texts share a cache entry.
+    Case, whitespace and trailing full stops or exclamation marks are ignored. Other punctuation
+    is kept, since it can change the analysis, e.g. "good :)" and "good :(" or "not bad?".
+
+    :param message: str
+    :return: str
+    """
+    message = " ".join(unicodedata.normalize("NFKC", message).casefold().split())
+    return re.sub(r"(?<=\w)[.!]+$", "", message)
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for LLM analysis results.
+
+    Entries are keyed by a hash of the normalized message, the prompt version and the model.
+    An in-memory LRU sits in front of the analysis_cache table, which keeps results across restarts.
+    """
+
+    def __init__(self, model, prompt_version, max_items=1024, ttl=30 * 24 * 3600, max_entries=100_000,
+                 evict_every=500):
+        """
+        :param model: str, model name included in the key
+        :param prompt_version: str, prompt version included in the key
+        :param max_items: int, entries kept in memory
+        :param ttl: float, seconds an entry stays valid
+        :param max_entries: int, entries kept in the database table
+        :param evict_every: int, number of stores between database evictions
+        """
+        self.model = model
+        self.prompt_version = prompt_version
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def key(self, message):
+        """
+        :param message: str
+        :return: str, hex digest identifying the message under the current prompt and model
+        """
+        content = "\0".join((NORMALIZATION_VERSION, self.prompt_version, self.model, normalize_message(message)))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            result, latency, created_at = entry
+            if created_at < time.time() - self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self.saved_seconds += latency
+            return copy.deepcopy(result)
+
+    def _memory_put(self, key, result, latency, created_at):
+        with self._lock:
+            self._memory[key] = (result, latency, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _from_disk(self, key, fetch):
+        if fetch is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        result, latency, created_at = json.loads(fetch[0]), fetch[1], fetch[2]
+        # Promoted with its original creation time, so the entry still expires ttl seconds after it was stored
+        self._memory_put(key, result, latency, created_at)
+        with self._lock:
+            self.disk_hits += 1
+            self.saved_seconds += latency
+        return copy.deepcopy(result)
+
+    def _should_evict(self):
+        with self._lock:
+            self._stores += 1
+            return self._stores % self.evict_every == 0
+
+    def get(self, key):
+        """
+        :param key: str, as returned by key()
+        :return: dict, the cached analysis, or None on a miss
+        """
+        result = self._memory_get(key)
+        if result is not None:
+            return result
+        return self._from_disk(key, db.get_cached_analysis(key, time.time() - self.ttl))
+
+    def put(self, key, result, latency):
+        """
+        :param key: str, as returned by key()
+        :param result: dict, the analysis to cache
+        :param latency: float, seconds the analysis took, counted as saved on every later hit
+        """
+        created_at = time.time()
+        self._memory_put(key, copy.deepcopy(result), latency, created_at)
+        db.store_cached_analysis(key, json.dumps(result), latency, created_at)
+        if self._should_evict():
+            db.evict_cached_analyses(created_at - self.ttl, self.max_entries)
+
+    async def aget(self, key):
+        """
+        Same as get(), but reads the database tier on the database thread.
+        """
+        result = self._memory_get(key)
+        if result is not None:
+            return result
+        return self._from_disk(key, await db.aio.get_cached_analysis(key, time.time() - self.ttl))
+
+    async def aput(self, key, result, latency):
+        """
+        Same as put(), but writes the database tier on the database thread.
+        """
+        created_at = time.time()
+        self._memory_put(key, copy.deepcopy(result), latency, created_at)
+        await db.aio.store_cached_analysis(key, json.dumps(result), latency, created_at)
+        if self._should_evict():
+            await db.aio.evict_cached_analyses(created_at - self.ttl, self.max_entries)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        """
+        :return: dict with hit/miss counters, hit rate and the LLM time saved by hits
+        """
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "memory_items": len(self._memory),
+            }
+
+    def cached(self, function):
+        """
+        Decorator caching a function that takes a message and returns its analysis.
+        The undecorated function stays available as `.uncached`.
+        """
+        @functools.wraps(function)
+        def wrapper(message):
+            key = self.key(message)
+            result = self.get(key)
+            if result is not None:
+                return result
+
+            started = time.perf_counter()
+            result = function(message)
+            self.put(key, result, time.perf_counter() - started)
+            return result
+
+        wrapper.uncached = function
+        return wrapper
@@ -0,0 +1,130 @@
+import time
+import asyncio
+import logging
+from .LLM_message_analyser import build_request, parse_llm_response
+from lib.utility.metrics import timed
+
+
+class AnalysisService:
+    """
+    Runs LLM analyses concurrently without blocking the event loop.
+
+    Requests go through a bounded queue served by a fixed number of workers, so at most
+    `concurrency` calls are in flight and callers wait in `analyse` once `queue_size`
+    requests are already queued (backpressure).
+
+    Usage:
+        service = AnalysisService(concurrency=8)
+        await service.start()
+        metrics = await service.analyse(message)
+        await service.stop()
+    """
+
+    def __init__(self, concurrency=8, queue_size=64, timeout=30.0, client=None, base_url=None, api_key=None,
+                 cache=None):
+        """
+        :param concurrency: int, maximum number of requests in flight
+        :param queue_size: int, maximum number of queued requests before callers wait
+        :param timeout: float, seconds allowed for a single LLM request
+        :param client: AsyncOpenAI, optional preconfigured client
+        :param base_url: str, optional OpenAI-compatible endpoint (e.g. a local stub)
+        :param api_key: str, optional API key, defaults to the OPENAI_API_KEY environment variable
+        :param cache: AnalysisCache, optional cache consulted before queueing a request
+        """
+        assert isinstance(concurrency, int) and concurrency > 0, "Concurrency must be a positive integer."
+        assert isinstance(queue_size, int) and queue_size > 0, "Queue size must be a positive integer."
+
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._client = client
+        self._base_url = base_url
+        self._api_key = api_key
+        self.cache = cache
+        self._queue = None
+        self._workers = []
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """
+        Creates the client and worker tasks. Must be called from a running event loop.
+        """
+        if self._workers:
+            return
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(base_url=self._base_url, api_key=self._api_key, timeout=self.timeout)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(), name=f"analysis-worker-{i}")
+                         for i in range(self.concurrency)]
+
+    async def stop(self):
+        """
+        Cancels the workers. Requests still queued fail with asyncio.CancelledError.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    @timed("llm.analyse")
+    async def analyse(self, message):
+        """
+        Queues a message for analysis and waits for its metrics.
+
+        :param message: str
+        :return: A dictionary with the same shape as analyse_message_with_LLM.
+        :raises asyncio.TimeoutError: if the LLM request exceeds the timeout
+        """
+        assert isinstance(message, str), "Message must be a string."
+        if not self._workers:
+            await self.start()
+
+        if self.cache is not None:
+            key = self.cache.key(message)
+            result = await self.cache.aget(key)
+            if result is not None:
+                return result
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future))
+        result = await future
+
+        if self.cache is not None:
+            await self.cache.aput(key, result, time.perf_counter() - started)
+        return result
+
+    @timed("llm.request")
+    async def _request(self, message):
+        response = await self._client.chat.completions.create(**build_request(message))
+        return parse_llm_response(response.choices[0].message.content)
+
+    async def _worker(self):
+        while True:
+            message, future = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                result = await asyncio.wait_for(self._request(message), timeout=self.timeout)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                logging.error(f"LLM analysis failed: {e!r}")
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,150 @@
+"""
+Re-analyses every stored message, e.g. after the analysis prompt or model changed.
+
+Progress is checkpointed in the backfill_progress table after every chunk, so an
+interrupted run resumes after the last chunk it wrote back. Records that could not be
+analysed are kept in backfill_failures and retried first when the job runs again.
+
+With --provisional only records stored with the offline analysis are re-analysed,
+e.g. after the LLM was unavailable for a while.
+
+Usage:
+    python -m lib.LLM.backfill --job gpt-4o-mini-v2 --workers 8 --batch-size 5
+    python -m lib.LLM.backfill --job provisional --provisional --restart
+"""
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import lib.database as db
+from .LLM_message_analyser import analyse_messages_with_LLM
+
+
+def _analyse_batch(batch):
+    """
+    Analyses a batch of (record_id, message) pairs.
+
+    :return: list of (record_id, metrics or None)
+    """
+    ids = [record_id for record_id, _ in batch]
+    try:
+        results = analyse_messages_with_LLM([message for _, message in batch])
+    except Exception as e:
+        logging.error(f"Backfill batch starting at record {ids[0]} failed: {e!r}")
+        results = [None] * len(batch)
+    return list(zip(ids, results))
+
+
+def _analyse_chunk(executor, chunk, batch_size, analyse_batch):
+    """
+    :return: tuple (list of (record_id, metrics) that were analysed, list of record ids that failed)
+    """
+    batches = [chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size)]
+    analyses, failed_ids = [], []
+    for results in executor.map(analyse_batch, batches):
+        for record_id, metrics in results:
+            if metrics is None:
+                failed_ids.append(record_id)
+            else:
+                analyses.append((record_id, metrics))
+    return analyses, failed_ids
+
+
+def run_backfill(job, chunk_size=500, workers=8, batch_size=1, restart=False, analyse_batch=_analyse_batch,
+                 provisional_only=False):
+    """
+    Streams records.message in chunks, analyses them in parallel and writes the results back.
+
+    :param job: str, name of the checkpoint to resume from
+    :param chunk_size: int, number of records read and written back per transaction
+    :param workers: int, number of concurrent LLM requests
+    :param batch_size: int, number of messages sent per LLM request
+    :param restart: bool, ignore an existing checkpoint and earlier failures and start from the first record
+    :param analyse_batch: callable, analyses a list of (record_id, message) pairs
+    :param provisional_only: bool, only re-analyse records whose analysis is still provisional
+    :return: dict with processed, failed (records still not analysed), elapsed (seconds) and rows_per_minute
+    """
+    assert isinstance(chunk_size, int) and chunk_size > 0, "Chunk size must be a positive integer."
+    assert isinstance(workers, int) and workers > 0, "Workers must be a positive integer."
+    assert isinstance(batch_size, int) and batch_size > 0, "Batch size must be a positive integer."
+
+    if restart:
+        db.reset_backfill_progress(job)
+    last_id, processed, failed = db.get_backfill_progress(job)
+    if last_id:
+        logging.info(f"Resuming backfill {job} after record {last_id} ({processed} processed, {failed} failed)")
+
+    started = time.perf_counter()
+    processed_this_run = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as executor:
+        # Records earlier runs failed on come first, the checkpoint has already moved past them
+        retry_id = 0
+        while True:
+            chunk = db.get_backfill_failures(job, retry_id, limit=chunk_size)
+            if not chunk:
+                break
+
+            analyses, _ = _analyse_chunk(executor, chunk, batch_size, analyse_batch)
+            retry_id = chunk[-1][0]
+            failed -= len(analyses)
+
+            with db.transaction():
+                db.update_record_analyses(analyses)
+                db.remove_backfill_failures(job, [record_id for record_id, _ in analyses])
+                db.set_backfill_progress(job, last_id, processed, failed)
+            logging.info(f"Backfill {job}: {len(analyses)} of {len(chunk)} earlier failures analysed")
+
+        while True:
+            chunk = db.get_messages_after(last_id, limit=chunk_size, provisional_only=provisional_only)
+            if not chunk:
+                break
+
+            analyses, failed_ids = _analyse_chunk(executor, chunk, batch_size, analyse_batch)
+
+            last_id = chunk[-1][0]
+            processed += len(chunk)
+            failed += len(failed_ids)
+            processed_this_run += len(chunk)
+
+            # Results, failures and checkpoint are committed together, so a crash never skips a record
+            with db.transaction():
+                db.update_record_analyses(analyses)
+                db.add_backfill_failures(job, failed_ids)
+                db.set_backfill_progress(job, last_id, processed, failed)
+
+            logging.info(f"Backfill {job}: {processed} processed, {failed} failed, at record {last_id}")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "processed": processed,
+        "failed": failed,
+        "elapsed": elapsed,
+        "rows_per_minute": processed_this_run / elapsed * 60 if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-analyse all stored check-in messages.")
+    parser.add_argument("--job", default="default", help="Checkpoint name, reuse it to resume an interrupted run.")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Records read and written per transaction.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent LLM requests.")
+    parser.add_argument("--batch-size", type=int, default=1, help="Messages sent per LLM request.")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the checkpoint and earlier failures and start over.")
+    parser.add_argument("--provisional", action="store_true", help="Only re-analyse provisional records.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db.init_database()
+    report = run_backfill(args.job, chunk_size=args.chunk_size, workers=args.workers,
+                          batch_size=args.batch_size, restart=args.restart, provisional_only=args.provisional)
+
+    print(f"Processed: {report['processed']}")
+    print(f"Failed: {report['failed']}")
+    print(f"Elapsed: {report['elapsed']:.1f} s")
+    print(f"Throughput: {report['rows_per_minute']:.0f} rows/minute")
+
+
+if __name__ == "__main__":
+    main()
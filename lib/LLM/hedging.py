@@ -0,0 +1,99 @@
+import time
+import asyncio
+import logging
+import lib.database as db
+from lib.utility.metrics import metrics, timed
+from .local_analyser import analyse_message_locally
+
+
+class HedgedCheckIn:
+    """
+    Stores check-ins within a fixed latency budget, whatever the LLM does.
+
+    The LLM analysis gets `budget` seconds. If it answers in time the record is stored as usual.
+    Otherwise the message is analysed offline with the lexicon analyser and stored right away as a
+    provisional record, and the LLM result replaces it once it arrives. If the LLM fails altogether the
+    record stays provisional; `python -m lib.LLM.backfill --provisional` re-analyses those later.
+
+    Usage:
+        check_ins = HedgedCheckIn(analysis_service, budget=3.0)
+        analysis, provisional = await check_ins.store(user_id, message)
+        ...
+        await check_ins.drain()  # at shutdown
+    """
+
+    def __init__(self, service, budget=3.0, local_analyser=analyse_message_locally):
+        """
+        :param service: AnalysisService used for the LLM analysis
+        :param budget: float, seconds the LLM may take before the local result is stored
+        :param local_analyser: callable, offline analyser returning the same dictionary as the LLM
+        """
+        assert budget > 0, "Budget must be positive."
+
+        self.service = service
+        self.budget = budget
+        self.local_analyser = local_analyser
+        self._upgrades = set()
+        metrics.gauge("pending_upgrades", lambda: len(self._upgrades))
+
+    @property
+    def pending_upgrades(self):
+        return len(self._upgrades)
+
+    @timed("checkin.store")
+    async def store(self, user_id, message):
+        """
+        Analyses and stores a check-in, taking at most about `budget` seconds plus one database write.
+
+        :param user_id: int
+        :param message: str
+        :return: tuple (analysis dict that was stored, bool provisional)
+        """
+        started = time.perf_counter()
+        llm = asyncio.ensure_future(self.service.analyse(message))
+        done, _ = await asyncio.wait({llm}, timeout=self.budget)
+
+        # exception() raises CancelledError on a cancelled task, e.g. when the service stopped
+        if done and not llm.cancelled() and llm.exception() is None:
+            analysis = llm.result()
+            await db.aio.add_data_to_records(user_id, analysis, message)
+            return analysis, False
+
+        if done:
+            reason = "cancelled" if llm.cancelled() else repr(llm.exception())
+            logging.warning(f"LLM analysis failed, storing a provisional analysis: {reason}")
+        else:
+            logging.info(f"LLM analysis exceeded {self.budget} s, storing a provisional analysis")
+        # Counts hedged check-ins, with LLM failures as errors and timeouts as successes
+        metrics.observe("llm.hedged", time.perf_counter() - started, error=done)
+
+        analysis = self.local_analyser(message)
+        record_id = await db.aio.add_data_to_records(user_id, analysis, message, provisional=True)
+        if not done:
+            task = asyncio.create_task(self._upgrade(record_id, llm))
+            self._upgrades.add(task)
+            task.add_done_callback(self._upgrades.discard)
+        return analysis, True
+
+    async def _upgrade(self, record_id, llm):
+        try:
+            analysis = await llm
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"LLM analysis of provisional record {record_id} failed, leaving it provisional: {e!r}")
+            return
+        await db.aio.update_record_analyses([(record_id, analysis)])
+        logging.info(f"Upgraded provisional record {record_id} with the LLM analysis")
+
+    async def drain(self, timeout=None):
+        """
+        Waits for pending upgrades, cancelling those still running after `timeout` seconds.
+        Records whose upgrade was cancelled stay provisional.
+        """
+        if not self._upgrades:
+            return
+        _, pending = await asyncio.wait(set(self._upgrades), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,180 @@
+"""
+Offline, lexicon-based message analysis.
+
+Produces the same dictionary as analyse_message_with_LLM without any network access, so a check-in
+can still be stored when the LLM is slow or unavailable. Every word found in a lexicon adds its
+weight to one or more dimensions, scaled by a preceding intensifier and flipped by a preceding
+negation; the sums are squashed into [-1, 1] and mapped onto the labels and 1-10 scales of the LLM.
+The results are rough, which is why records analysed this way are stored as provisional.
+"""
+import re
+import math
+from collections import Counter
+from lib.utility.functions import SENTIMENT_MAPPING, MOOD_MAPPING
+
+SENTIMENT_LABELS = list(SENTIMENT_MAPPING)
+MOOD_LABELS = list(MOOD_MAPPING)
+
+# word: (valence, energy, productivity), each roughly between -3 and 3
+LEXICON = {
+    # Positive feelings
+    "good": (2, 0, 0), "great": (3, 1, 0), "amazing": (3, 1, 0), "awesome": (3, 1, 0), "fantastic": (3, 1, 0),
+    "wonderful": (3, 1, 0), "nice": (2, 0, 0), "fine": (1, 0, 0), "okay": (0.5, 0, 0), "ok": (0.5, 0, 0),
+    "happy": (3, 1, 0), "glad": (2, 0, 0), "joy": (3, 1, 0), "excited": (3, 2, 0), "fun": (2, 1, 0),
+    "relaxed": (2, -1, 0), "calm": (2, -1, 0), "peaceful": (2, -1, 0), "grateful": (3, 0, 0),
+    "thankful": (2, 0, 0), "proud": (3, 1, 1), "love": (3, 1, 0), "loved": (3, 1, 0), "enjoyed": (2, 1, 0),
+    "enjoy": (2, 1, 0), "better": (1, 0, 0), "best": (3, 0, 0), "hopeful": (2, 0, 0), "content": (2, 0, 0),
+    "satisfied": (2, 0, 1), "successful": (2, 1, 2), "success": (2, 1, 2), "win": (2, 1, 1), "won": (2, 1, 1),
+    "laughed": (2, 1, 0), "smile": (2, 0, 0), "beautiful": (2, 0, 0), "lovely": (2, 0, 0), "cozy": (1, -1, 0),
+    # Negative feelings
+    "bad": (-2, 0, 0), "terrible": (-3, -1, 0), "awful": (-3, -1, 0), "horrible": (-3, -1, 0), "worst": (-3, 0, 0),
+    "sad": (-2, -1, 0), "unhappy": (-2, -1, 0), "depressed": (-3, -2, -1), "down": (-1, -1, 0), "lonely": (-2, -1, 0),
+    "angry": (-3, 1, 0), "annoyed": (-2, 0, 0), "frustrated": (-2, 0, -1), "frustrating": (-2, 0, -1),
+    "upset": (-2, 0, 0), "anxious": (-2, 0, -1), "anxiety": (-2, 0, -1), "worried": (-2, 0, 0), "worry": (-2, 0, 0),
+    "stressed": (-2, 0, -1), "stress": (-2, 0, -1), "stressful": (-2, 0, -1), "overwhelmed": (-2, -1, -1),
+    "nervous": (-1, 0, 0), "scared": (-2, 0, 0), "afraid": (-2, 0, 0), "hate": (-3, 0, 0), "hated": (-3, 0, 0),
+    "sick": (-2, -2, -1), "ill": (-2, -2, -1), "pain": (-2, -1, -1), "hurt": (-2, -1, 0), "headache": (-2, -1, -1),
+    "cried": (-2, -1, 0), "crying": (-2, -1, 0), "boring": (-1, -1, 0), "bored": (-1, -1, -1), "worse": (-2, 0, 0),
+    "disappointed": (-2, 0, 0), "failed": (-2, 0, -2), "fail": (-2, 0, -2), "lost": (-1, 0, 0), "miss": (-1, 0, 0),
+    "argument": (-2, 0, 0), "fight": (-2, 1, 0), "rough": (-2, -1, 0), "hard": (-1, 0, 0), "difficult": (-1, 0, 0),
+    # Energy
+    "energetic": (1, 3, 1), "energized": (1, 3, 1), "refreshed": (2, 2, 0), "rested": (1, 2, 0),
+    "active": (1, 2, 1), "motivated": (2, 2, 2), "pumped": (2, 3, 0), "alive": (1, 2, 0), "strong": (1, 2, 0),
+    "tired": (-1, -2, -1), "exhausted": (-2, -3, -1), "sleepy": (-1, -2, -1), "drained": (-2, -3, -1),
+    "fatigue": (-1, -3, -1), "fatigued": (-1, -3, -1), "lazy": (-1, -2, -2), "sluggish": (-1, -2, -1),
+    "insomnia": (-2, -2, -1), "burnout": (-3, -3, -2), "burned": (-1, -2, -1), "slept": (0, 1, 0),
+    "workout": (1, 2, 0), "gym": (1, 2, 0), "ran": (1, 2, 0), "run": (1, 2, 0), "running": (1, 2, 0),
+    # Productivity
+    "productive": (2, 1, 3), "finished": (1, 0, 2), "completed": (1, 0, 2), "done": (1, 0, 1),
+    "accomplished": (2, 1, 3), "achieved": (2, 1, 2), "progress": (1, 0, 2), "focused": (1, 1, 2),
+    "efficient": (1, 1, 2), "organized": (1, 0, 2), "delivered": (1, 0, 2), "solved": (2, 0, 2),
+    "fixed": (1, 0, 2), "learned": (1, 0, 1), "studied": (0, 0, 2), "wrote": (0, 0, 1), "shipped": (2, 1, 2),
+    "procrastinated": (-1, -1, -3), "procrastinating": (-1, -1, -3), "unproductive": (-1, -1, -3),
+    "distracted": (-1, 0, -2), "behind": (-1, 0, -2), "stuck": (-1, 0, -2), "wasted": (-2, -1, -2),
+    "deadline": (-1, 0, 1), "busy": (0, 1, 1),
+}
+
+NEGATIONS = {"not", "no", "never", "none", "nothing", "hardly", "barely", "without", "cannot", "cant", "dont",
+             "didnt", "wasnt", "isnt", "arent", "wont", "couldnt", "wouldnt", "shouldnt", "havent", "hasnt"}
+
+INTENSIFIERS = {"very": 1.5, "really": 1.5, "so": 1.3, "extremely": 2.0, "super": 1.5, "incredibly": 2.0,
+                "totally": 1.5, "completely": 1.5, "quite": 1.2, "pretty": 1.1, "slightly": 0.5, "somewhat": 0.7,
+                "little": 0.7, "bit": 0.7, "kinda": 0.7}
+
+TOPIC_KEYWORDS = {
+    "work": {"work", "job", "office", "meeting", "meetings", "boss", "colleague", "colleagues", "coworker",
+             "client", "clients", "project", "deadline", "shift", "email", "emails"},
+    "school": {"school", "class", "classes", "lecture", "exam", "exams", "homework", "study", "studied",
+               "studying", "university", "college", "assignment", "teacher"},
+    "sleep": {"sleep", "slept", "nap", "insomnia", "bed", "woke", "tired", "sleepy"},
+    "exercise": {"gym", "workout", "run", "ran", "running", "walk", "walked", "hike", "yoga", "swim", "exercise",
+                 "training", "bike", "cycling"},
+    "family": {"family", "mom", "mum", "dad", "mother", "father", "parents", "sister", "brother", "kids",
+               "son", "daughter", "grandma", "grandpa"},
+    "friends": {"friend", "friends", "party", "hangout", "dinner", "drinks"},
+    "relationship": {"partner", "girlfriend", "boyfriend", "wife", "husband", "date", "relationship"},
+    "health": {"sick", "ill", "doctor", "headache", "pain", "hospital", "medicine", "cold", "flu", "health"},
+    "food": {"food", "ate", "eat", "lunch", "breakfast", "cooked", "cooking", "meal", "coffee"},
+    "weather": {"weather", "rain", "rainy", "sunny", "snow", "cold", "hot", "sun"},
+    "travel": {"travel", "trip", "flight", "train", "vacation", "holiday", "drive", "drove"},
+    "money": {"money", "rent", "bills", "salary", "paid", "budget", "expensive"},
+    "hobbies": {"music", "guitar", "piano", "game", "games", "gaming", "book", "reading", "movie", "painting"},
+}
+
+STOPWORDS = {"the", "and", "a", "an", "to", "of", "in", "on", "at", "for", "with", "my", "me", "i", "it", "was",
+             "is", "am", "are", "be", "been", "that", "this", "but", "so", "then", "had", "have", "has", "just",
+             "today", "day", "felt", "feel", "feeling", "after", "before", "about", "from", "some", "very",
+             "really", "got", "went", "did", "do", "lot", "also", "were", "we", "our", "they", "them", "what",
+             "when", "because", "into", "over", "out", "up", "all", "much", "more", "too", "quite", "again"}
+
+MAX_TOPICS = 5
+
+# Words after a negation that are still affected by it
+NEGATION_SCOPE = 3
+
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def _tokens(message):
+    # Apostrophes are dropped so "didn't" and "didnt" are the same token
+    return [token.replace("'", "") for token in _WORD.findall(message.lower())]
+
+
+def _squash(total, alpha=6.0):
+    """
+    Maps an unbounded sum onto (-1, 1), saturating smoothly like VADER's compound score.
+    """
+    return total / math.sqrt(total * total + alpha)
+
+
+def _scale(value):
+    # -1..1 onto the 1..10 scale of the LLM
+    return max(1, min(10, round(5.5 + 4.5 * value)))
+
+
+def _label(value, labels):
+    # -1..1 onto five labels ordered from worst to best, with the middle one covering -0.25..0.25
+    return labels[max(0, min(4, round(value * 2) + 2))]
+
+
+def analyse_message_locally(message):
+    """
+    Analyses a message with the built-in lexicons.
+
+    :param message: The message to be analysed.
+    :return: A dictionary with the same keys and value types as analyse_message_with_LLM.
+    """
+    assert isinstance(message, str), "Message must be a string."
+
+    tokens = _tokens(message)
+    valence = energy = productivity = 0.0
+    negated_until = -1
+    multiplier = 1.0
+
+    for index, token in enumerate(tokens):
+        if token in NEGATIONS:
+            negated_until = index + NEGATION_SCOPE
+            continue
+        if token in INTENSIFIERS:
+            multiplier *= INTENSIFIERS[token]
+            continue
+
+        weights = LEXICON.get(token)
+        if weights is not None:
+            # Negation dampens as well as flips: "not good" is milder than "bad"
+            sign = -0.5 if index <= negated_until else 1.0
+            valence += weights[0] * multiplier * sign
+            energy += weights[1] * multiplier * sign
+            productivity += weights[2] * multiplier * sign
+        multiplier = 1.0
+
+    sentiment_value = _squash(valence)
+    energy_value = _squash(energy + 0.3 * valence)
+    productivity_value = _squash(productivity + 0.2 * valence)
+    well_being_value = _squash(valence + 0.5 * energy)
+
+    return {
+        "sentiment": _label(sentiment_value, SENTIMENT_LABELS),
+        "mood": _label(_squash(valence + 0.3 * energy), MOOD_LABELS),
+        "key_topics": extract_topics(tokens),
+        "well_being": _scale(well_being_value),
+        "energy": _scale(energy_value),
+        "productivity": _scale(productivity_value),
+    }
+
+
+def extract_topics(tokens):
+    """
+    Finds the topics whose keywords occur most often, falling back to the most frequent content words.
+
+    :param tokens: list of str, lowercased words
+    :return: list of str, at most MAX_TOPICS topics
+    """
+    counts = Counter(tokens)
+    hits = Counter({topic: sum(counts[word] for word in words) for topic, words in TOPIC_KEYWORDS.items()})
+    topics = [topic for topic, count in hits.most_common() if count > 0]
+    if topics:
+        return topics[:MAX_TOPICS]
+
+    words = Counter(token for token in tokens if len(token) > 3 and token not in STOPWORDS and token not in LEXICON)
+    return [word for word, _ in words.most_common(3)]
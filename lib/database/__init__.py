@@ -1,4 +1,14 @@
+import importlib
 from .db_interaction import *
 from .db_structure import *
-from .db_connection import create_database
-create_database()
\ No newline at end of file
+from .db_rollups import rebuild_daily_rollups, get_daily_rollups_for_user, get_rollup_fields
+from .db_connection import create_database, init_database, transaction, set_database, close_connections
+from .db_writer import enable_write_behind, disable_write_behind
+from .db_analytics import get_weekly_activity, get_mood_distribution, get_server_summary, clear_analytics_cache
+from .db_search import search_records, get_topic_counts, get_topic_count, rebuild_record_topics
+
+def __getattr__(name):
+    # The async API pulls in asyncio, so it is only imported when first used as lib.database.aio
+    if name == "aio":
+        return importlib.import_module(".aio", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from . import db_interaction, db_rollups, db_analytics, db_search
+from .db_connection import create_database as _create_database
+from lib.utility.metrics import metrics
+
+# All database work from the event loop goes through this single thread.
+# SQLite only allows one writer at a time anyway, and a dedicated thread keeps
+# its pooled connection warm while the event loop stays free.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+# Calls submitted to the database thread that have not finished yet
+_pending = 0
+metrics.gauge("db_queue_depth", lambda: _pending)
+
+
+async def run(function, *args, **kwargs):
+    """
+    Runs a synchronous database callable on the database thread and awaits its result.
+    Useful for multi-statement work wrapped in transaction().
+
+    :param function: callable
+    :return: the callable's return value
+    """
+    global _pending
+    loop = asyncio.get_running_loop()
+    _pending += 1
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(function, *args, **kwargs))
+    finally:
+        _pending -= 1
+
+
+def _wrap(function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run(function, *args, **kwargs)
+    return wrapper
+
+
+def shutdown(wait=True):
+    """
+    Stops the database thread after pending calls have finished.
+    """
+    _executor.shutdown(wait=wait)
+
+
+create_database = _wrap(_create_database)
+add_user = _wrap(db_interaction.add_user)
+remove_user = _wrap(db_interaction.remove_user)
+add_data_to_records = _wrap(db_interaction.add_data_to_records)
+add_incident = _wrap(db_interaction.add_incident)
+get_users = _wrap(db_interaction.get_users)
+set_reminder = _wrap(db_interaction.set_reminder)
+get_reminder = _wrap(db_interaction.get_reminder)
+get_users_due_for_reminder = _wrap(db_interaction.get_users_due_for_reminder)
+get_user_name = _wrap(db_interaction.get_user_name)
+get_last_n_records_for_user = _wrap(db_interaction.get_last_n_records_for_user)
+get_records_in_range = _wrap(db_interaction.get_records_in_range)
+get_all_records = _wrap(db_interaction.get_all_records)
+get_incidents_for_user = _wrap(db_interaction.get_incidents_for_user)
+update_record_analyses = _wrap(db_interaction.update_record_analyses)
+get_messages_after = _wrap(db_interaction.get_messages_after)
+get_backfill_progress = _wrap(db_interaction.get_backfill_progress)
+set_backfill_progress = _wrap(db_interaction.set_backfill_progress)
+reset_backfill_progress = _wrap(db_interaction.reset_backfill_progress)
+add_backfill_failures = _wrap(db_interaction.add_backfill_failures)
+remove_backfill_failures = _wrap(db_interaction.remove_backfill_failures)
+get_backfill_failures = _wrap(db_interaction.get_backfill_failures)
+get_cached_analysis = _wrap(db_interaction.get_cached_analysis)
+store_cached_analysis = _wrap(db_interaction.store_cached_analysis)
+evict_cached_analyses = _wrap(db_interaction.evict_cached_analyses)
+get_latest_record_id = _wrap(db_interaction.get_latest_record_id)
+get_daily_rollups_for_user = _wrap(db_rollups.get_daily_rollups_for_user)
+rebuild_daily_rollups = _wrap(db_rollups.rebuild_daily_rollups)
+get_weekly_activity = _wrap(db_analytics.get_weekly_activity)
+get_mood_distribution = _wrap(db_analytics.get_mood_distribution)
+get_server_summary = _wrap(db_analytics.get_server_summary)
+search_records = _wrap(db_search.search_records)
+get_topic_counts = _wrap(db_search.get_topic_counts)
+get_topic_count = _wrap(db_search.get_topic_count)
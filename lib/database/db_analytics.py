@@ -0,0 +1,154 @@
+"""
+Server-wide aggregates over every opted-in user, computed inside SQLite.
+
+Weekly figures are grouped from the daily_rollups table, so their cost grows with active users x days
+rather than with the number of check-ins, and the mood distribution is counted from a covering (ts, mood)
+index. Moving averages, week-over-week changes and shares are window functions, so only the final
+rows reach Python.
+
+Results are cached per period: the key includes the current day, so nothing is reused across days,
+and within a day entries are refreshed after ANALYTICS_TTL seconds or when records change in bulk.
+"""
+import time
+import datetime
+import threading
+import functools
+from . import db_connection
+from .db_connection import connect, flush_pending_writes
+from .db_interaction import add_records_listener, _to_epoch
+from lib.utility.functions import MOOD_MAPPING
+
+# Seconds a cached aggregate is served within its period
+ANALYTICS_TTL = 300.0
+
+# Weeks averaged by the moving average of get_weekly_activity
+MOVING_AVERAGE_WEEKS = 4
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached_per_period(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (function.__name__, args, tuple(sorted(kwargs.items())), db_connection.db_path, datetime.date.today())
+        now = time.monotonic()
+        with _cache_lock:
+            entry = _cache.get(key)
+        if entry is not None and now - entry[0] < ANALYTICS_TTL:
+            return entry[1]
+
+        value = function(*args, **kwargs)
+        with _cache_lock:
+            # Entries of earlier periods are never read again
+            for stale in [k for k in _cache if k[-1] != key[-1]]:
+                del _cache[stale]
+            _cache[key] = (now, value)
+        return value
+    return wrapper
+
+
+def clear_analytics_cache(user_id=None):
+    """
+    Drops every cached aggregate. Registered as a records listener for bulk changes (user_id None),
+    such as backfills and score recomputations; single check-ins are picked up after ANALYTICS_TTL.
+    """
+    if user_id is None:
+        with _cache_lock:
+            _cache.clear()
+
+
+add_records_listener(clear_analytics_cache)
+
+
+@_cached_per_period
+@connect
+def get_weekly_activity(cursor, weeks=12):
+    """
+    Get server-wide activity per week, Monday to Sunday, for the last N weeks including the current one.
+    Weeks without any check-in are left out.
+
+    weeks: int
+    :return: list of tuples (week_start, check_ins, participants, participation_rate, mean_score,
+             moving_average_score, score_change), oldest week first. participation_rate is the share of
+             opted-in users who checked in that week, score_change the difference to the previous week.
+    """
+    assert isinstance(weeks, int) and weeks > 0, "Weeks must be a positive integer."
+
+    flush_pending_writes()
+    # Days are summed first, in the order of the day index; grouping the rollup rows by week directly would
+    # sort all of them. Participants are counted per week with a range scan of that week's rows, and only
+    # while they are users: remove_user keeps the rollups of users who opted out.
+    cursor.execute(f"""
+        WITH daily AS (
+            SELECT day, SUM(count) AS check_ins, SUM(sum_score) AS sum_score
+            FROM daily_rollups
+            WHERE day >= date('now', 'localtime', '-6 days', 'weekday 1', ?)
+            GROUP BY day
+        ),
+        weekly AS (
+            SELECT date(day, '-6 days', 'weekday 1') AS week,
+                   SUM(check_ins) AS check_ins,
+                   SUM(sum_score) / SUM(check_ins) AS mean_score
+            FROM daily
+            GROUP BY week
+        )
+        SELECT week, check_ins, participants,
+               participants * 1.0 / MAX((SELECT COUNT(*) FROM users), 1),
+               mean_score,
+               AVG(mean_score) OVER (ORDER BY week ROWS BETWEEN {MOVING_AVERAGE_WEEKS - 1} PRECEDING AND CURRENT ROW),
+               mean_score - LAG(mean_score) OVER (ORDER BY week)
+        FROM (SELECT weekly.*,
+                     (SELECT COUNT(DISTINCT user_id) FROM daily_rollups
+                      WHERE day >= week AND day < date(week, '+7 days')
+                        AND user_id IN (SELECT id FROM users)) AS participants
+              FROM weekly)
+        ORDER BY week""", (f"-{(weeks - 1) * 7} days",))
+    return cursor.fetchall()
+
+
+@_cached_per_period
+@connect
+def get_mood_distribution(cursor, days=30):
+    """
+    Get the number and share of check-ins per mood over the last N days, across all users.
+
+    days: int
+    :return: list of tuples (mood, check_ins, share) for every mood label, from worst to best
+    """
+    assert isinstance(days, int) and days > 0, "Days must be a positive integer."
+
+    flush_pending_writes()
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    cursor.execute("""SELECT mood, COUNT(*), COUNT(*) * 1.0 / SUM(COUNT(*)) OVER ()
+                   FROM records WHERE ts >= ? AND mood IS NOT NULL
+                   GROUP BY mood""", (_to_epoch(start),))
+    counts = {mood: (check_ins, share) for mood, check_ins, share in cursor.fetchall()}
+    return [(mood, *counts.get(mood, (0, 0.0))) for mood in MOOD_MAPPING]
+
+
+@_cached_per_period
+@connect
+def get_server_summary(cursor, days=30):
+    """
+    Get headline figures over the last N days, across all users.
+
+    days: int
+    :return: dict with users, active_users, participation_rate, check_ins and mean_score (None without check-ins)
+    """
+    assert isinstance(days, int) and days > 0, "Days must be a positive integer."
+
+    flush_pending_writes()
+    # Users who opted out keep their rollups, so they count towards check_ins but not active_users
+    cursor.execute("""SELECT (SELECT COUNT(*) FROM users),
+                   COUNT(DISTINCT CASE WHEN user_id IN (SELECT id FROM users) THEN user_id END), SUM(count),
+                   SUM(sum_score) / SUM(count)
+                   FROM daily_rollups WHERE day > date('now', 'localtime', ?)""", (f"-{days} days",))
+    users, active_users, check_ins, mean_score = cursor.fetchone()
+    return {
+        "users": users,
+        "active_users": active_users,
+        "participation_rate": active_users / users if users else 0.0,
+        "check_ins": check_ins or 0,
+        "mean_score": mean_score,
+    }
@@ -1,24 +1,174 @@
+import os
 import sqlite3
+import threading
+import functools
+from contextlib import contextmanager
 from .db_structure import db_name, db_structure
+from lib.utility.metrics import timed
 
-# We create a decorator function that handles the connection to the database and closes it after the function is executed.
+# Pragmas applied to every new connection. WAL lets readers run alongside the single writer,
+# and synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # Negative values are KiB, so roughly 16 MB of page cache
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Number of prepared statements sqlite3 keeps per connection.
+CACHED_STATEMENTS = 256
+
+db_path = db_name
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+# Bumped by close_connections, so other threads notice their connection was closed
+_generation = 0
+
+# Set while write-behind is enabled, see lib.database.db_writer
+_write_buffer = None
+
+
+def set_database(path):
+    """
+    Points the connection manager at another database file.
+    Open connections are closed and reopened lazily on next use.
+
+    :param path: str, path to the SQLite database file
+    """
+    global db_path
+    close_connections()
+    db_path = path
+
+
+def get_connection():
+    """
+    Returns the connection belonging to the calling thread, opening it on first use.
+    Connections are reopened if the database path changed, the process was forked or close_connections ran.
+
+    :return: sqlite3.Connection
+    """
+    conn = getattr(_local, "conn", None)
+    if (conn is not None and _local.path == db_path and _local.pid == os.getpid()
+            and _local.generation == _generation):
+        return conn
+
+    conn = open_connection(db_path)
+    _local.conn = conn
+    _local.path = db_path
+    _local.pid = os.getpid()
+    _local.generation = _generation
+    _local.depth = 0
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def open_connection(path):
+    """
+    Opens a new connection with PRAGMAS applied. The caller owns the connection and closes it.
+    Most code should use get_connection or transaction instead.
+
+    :param path: str, path to the SQLite database file
+    :return: sqlite3.Connection
+    """
+    # check_same_thread is off only so close_connections can close it at shutdown
+    conn = sqlite3.connect(path, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
+
+
+def close_connections():
+    """
+    Closes every connection opened by the manager, in all threads.
+    """
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """
+    Runs the enclosed statements in a single transaction on the thread's connection.
+    Nested transactions join the outermost one, which commits on success and rolls back on error.
+
+    Usage:
+        with transaction() as cursor:
+            cursor.execute(...)
+            add_data_to_records(...)  # joins the same transaction
+
+    :return: sqlite3.Cursor
+    """
+    conn = get_connection()
+    _local.depth += 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.rollback()
+        raise
+    else:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.commit()
+
+
+def set_write_buffer(buffer):
+    """
+    Installs the write-behind buffer that readers flush before reading, or removes it with None.
+    Used by lib.database.db_writer.
+
+    :param buffer: WriteBehindBuffer or None
+    """
+    global _write_buffer
+    _write_buffer = buffer
+
+
+def flush_pending_writes(user_id=None):
+    """
+    Writes rows still waiting in the write-behind buffer, so reads see them (read-your-writes).
+    Does nothing when write-behind is disabled.
+
+    :param user_id: int, only flush if this user has pending rows; None flushes anything pending
+    """
+    if _write_buffer is not None:
+        _write_buffer.flush(user_id)
+
+
+# We create a decorator function that hands the function a cursor on the thread's pooled connection.
+# Each call runs in its own transaction unless it is made inside an explicit transaction(),
+# and its duration is recorded in lib.utility.metrics as db.<function name>.
 def connect(function):
+    @functools.wraps(function)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        result = function(cursor, *args, **kwargs)
-        conn.commit()
-        conn.close()
-        return result
-    return wrapper
+        with transaction() as cursor:
+            return function(cursor, *args, **kwargs)
+    return timed(f"db.{function.__name__}")(wrapper)
 
 @connect
 def create_database(cursor):
     for table_name, table_structure in db_structure.items():
-        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join([f'{column} {datatype}' 
-                                                                              for column, datatype 
-                                                                              in table_structure.items()])})")
-        
+        columns = ", ".join(f"{column} {datatype}" for column, datatype in table_structure.items())
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns})")
+
+def init_database():
+    """
+    Creates the schema if needed and applies pending migrations.
+    Call once at startup, before the database is used.
+    """
+    from .db_migrations import apply_migrations
+    create_database()
+    apply_migrations()
+
 if __name__ == "__main__":
-    db_name = "../../" + db_name
-    create_database()
\ No newline at end of file
+    set_database("../../" + db_path)
+    init_database()
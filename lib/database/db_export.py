@@ -0,0 +1,123 @@
+"""
+Exports the records or incidents table to CSV or Parquet with constant memory use.
+
+Rows are streamed from SQLite in chunks and appended to the output file chunk by chunk, so the
+table is never held in memory. Parquet output requires the optional pyarrow package.
+
+Usage:
+    python -m lib.database.db_export records records.csv
+    python -m lib.database.db_export records records.parquet --format parquet --columns user_id date score
+    python -m lib.database.db_export incidents incidents.csv --start 2024-01-01 --end 2024-07-01
+"""
+import csv
+import sys
+import time
+import argparse
+import resource
+from .db_connection import init_database, set_database
+from .db_interaction import iter_chunks
+from .db_structure import db_structure, get_fields
+
+_ARROW_TYPES = {"INTEGER": "int64", "INT": "int64", "REAL": "float64", "TEXT": "string"}
+
+
+def export_csv(table, path, columns, chunk_size=10_000, **filters):
+    """
+    :return: int, number of rows written
+    """
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in iter_chunks(table, columns, chunk_size=chunk_size, **filters):
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def export_parquet(table, path, columns, chunk_size=10_000, **filters):
+    """
+    Writes one Parquet row group per chunk.
+
+    :return: int, number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+
+    def column_type(column):
+        datatype = "INTEGER" if column == "id" else db_structure[table][column].split()[0]
+        return getattr(pa, _ARROW_TYPES[datatype])()
+
+    schema = pa.schema([(column, column_type(column)) for column in columns])
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(table, columns, chunk_size=chunk_size, **filters):
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+EXPORTERS = {"csv": export_csv, "parquet": export_parquet}
+
+
+def export_table(table, path, format="csv", columns=None, chunk_size=10_000, **filters):
+    """
+    Exports a table incrementally.
+
+    :param table: str, records or incidents
+    :param path: str, output file
+    :param format: str, csv or parquet
+    :param columns: list of str, defaults to every column
+    :param chunk_size: int, rows held in memory at once
+    :param filters: user_id, start and end, as accepted by iter_chunks
+    :return: dict with rows, seconds, rows_per_second and peak_rss_mb
+    """
+    assert format in EXPORTERS, f"Unknown export format: {format}"
+    columns = columns or ["id"] + get_fields(table)
+
+    started = time.perf_counter()
+    rows = EXPORTERS[format](table, path, columns, chunk_size=chunk_size, **filters)
+    seconds = time.perf_counter() - started
+
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export records or incidents to CSV or Parquet.")
+    parser.add_argument("table", choices=["records", "incidents"])
+    parser.add_argument("path", help="Output file.")
+    parser.add_argument("--format", choices=sorted(EXPORTERS), default=None,
+                        help="Output format, guessed from the file extension by default.")
+    parser.add_argument("--columns", nargs="+", default=None, help="Columns to export, defaults to all.")
+    parser.add_argument("--user", type=int, default=None, help="Only export this user's rows.")
+    parser.add_argument("--start", default=None, help="Only rows at or after this ISO date.")
+    parser.add_argument("--end", default=None, help="Only rows before this ISO date.")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="Rows held in memory at once.")
+    parser.add_argument("--database", default=None, help="Database file, defaults to the bot's database.")
+    args = parser.parse_args(argv)
+
+    format = args.format or ("parquet" if args.path.endswith(".parquet") else "csv")
+
+    if args.database:
+        set_database(args.database)
+    init_database()
+    report = export_table(args.table, args.path, format=format, columns=args.columns, chunk_size=args.chunk_size,
+                          user_id=args.user, start=args.start, end=args.end)
+
+    print(f"Exported {report['rows']} rows to {args.path} in {report['seconds']:.1f} s "
+          f"({report['rows_per_second']:.0f} rows/s, peak RSS {report['peak_rss_mb']:.0f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
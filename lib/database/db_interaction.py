@@ -1,8 +1,30 @@
+import json
 import sqlite3
+import logging
 import datetime
-from .db_connection import connect
-from .db_structure import db_structure, get_fields
-from lib.utility import calculate_composite_score
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from . import db_connection
+from .db_connection import connect, get_connection, flush_pending_writes
+from .db_structure import db_structure, get_fields, get_columns
+from .db_rollups import add_to_daily_rollups, refresh_daily_rollups
+from .db_search import add_record_topics, replace_record_topics
+from lib.utility.functions import calculate_composite_score, convert_mood, convert_sentiment, DEFAULT_WEIGHTS
+
+# Callbacks run with a user_id whenever records of that user are written,
+# or with None when records of several users may have changed.
+_records_listeners = []
+
+def add_records_listener(callback):
+    """
+    Registers a callback that is notified when records change, e.g. to invalidate caches.
+
+    :param callback: callable taking a user_id (int) or None
+    """
+    _records_listeners.append(callback)
+
+def _notify_records_changed(user_id=None):
+    for callback in _records_listeners:
+        callback(user_id)
 
 @connect
 def add_user(cursor, user_id, user_name):
@@ -24,51 +46,318 @@ def remove_user(cursor, user_id):
         return True
 
 @connect
-def add_data_to_records(cursor, user_id, data, message):
+def set_reminder(cursor, user_id, remind_time, timezone):
+    """
+    Set the local time and timezone of a user's daily reminder.
+
+    user_id: int
+    remind_time: str (HH:MM, None for the default time)
+    timezone: str (IANA name such as Europe/Oslo, None for the default timezone)
+    :return: bool, False if the user has not opted in
+    """
+    cursor.execute("UPDATE users SET remind_time=?, timezone=? WHERE id=?", (remind_time, timezone, user_id))
+    return cursor.rowcount > 0
+
+@connect
+def get_reminder(cursor, user_id):
     """
+    user_id: int
+    :return: tuple (remind_time, timezone), None where the default applies, or None if the user has not opted in
+    """
+    cursor.execute("SELECT remind_time, timezone FROM users WHERE id=?", (user_id,))
+    return cursor.fetchone()
+
+@connect
+def get_users_due_for_reminder(cursor, minute, default_time, default_timezone):
+    """
+    Get the users whose daily reminder falls in the given minute of their own timezone.
+    In the repeated hour when clocks go back a reminder is due only the first time; reminders set
+    within the hour skipped when clocks go forward are not due that day.
+
+    minute: datetime (Timezone-aware)
+    default_time: str (HH:MM, for users without a reminder time)
+    default_timezone: str (For users without a timezone)
+    :return: list of user ids
+    """
+    # Local times are computed once per timezone in use rather than once per user
+    cursor.execute("SELECT DISTINCT COALESCE(timezone, ?) FROM users", (default_timezone,))
+    local_times = []
+    for (name,) in cursor.fetchall():
+        try:
+            local = minute.astimezone(ZoneInfo(name))
+        except (ZoneInfoNotFoundError, ValueError):
+            logging.warning(f"Unknown reminder timezone {name!r}, skipping its users")
+            continue
+        if not local.fold:
+            local_times += [name, local.strftime("%H:%M")]
+    if not local_times:
+        return []
+
+    values = ", ".join("(?, ?)" for _ in range(len(local_times) // 2))
+    cursor.execute(f"""SELECT id FROM users
+                    WHERE (COALESCE(timezone, ?), COALESCE(remind_time, ?)) IN (VALUES {values})
+                    ORDER BY id""", [default_timezone, default_time] + local_times)
+    return [user_id for user_id, in cursor.fetchall()]
+
+def _score_weights(cursor):
+    cursor.execute("SELECT value FROM settings WHERE key='score_weights'")
+    row = cursor.fetchone()
+    return dict(DEFAULT_WEIGHTS, **json.loads(row[0])) if row is not None else dict(DEFAULT_WEIGHTS)
+
+@connect
+def get_score_weights(cursor):
+    """
+    Returns the weights the score column is computed with, DEFAULT_WEIGHTS overridden by set_score_weights.
+
+    :return: dict
+    """
+    return _score_weights(cursor)
+
+@connect
+def set_score_weights(cursor, weights):
+    """
+    Stores score weights for every score computed from now on. Existing scores keep their old weights
+    until python -m lib.database.db_scoring recomputes them.
+
+    weights: dict (Weights overriding DEFAULT_WEIGHTS)
+    :return: dict, the complete weights now in use
+    """
+    assert set(weights) <= set(DEFAULT_WEIGHTS), f"Unknown weights {', '.join(set(weights) - set(DEFAULT_WEIGHTS))}."
+    weights = dict(_score_weights(cursor), **{name: float(value) for name, value in weights.items()})
+    assert sum(weights.values()) > 0, "The weights must not sum to zero."
+    cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('score_weights', ?)", (json.dumps(weights),))
+    return weights
+
+def _analysis_values(data, weights):
+    """
+    Converts an analysis dictionary into the records column values it is stored as.
+
+    :param data: dict, as returned by analyse_message_with_LLM
+    :param weights: dict, the score weights, see get_score_weights
+    :return: tuple (well_being, energy, productivity, sentiment, mood, score, key_topics)
+    """
+    return (data["well_being"],
+            data["energy"],
+            data["productivity"],
+            data["sentiment"],
+            data["mood"],
+            calculate_composite_score(dict(data), weights),
+            ", ".join(data["key_topics"]))
+
+def _rollup_values(data, weights):
+    return {"well_being": data["well_being"],
+            "energy": data["energy"],
+            "productivity": data["productivity"],
+            "score": calculate_composite_score(dict(data), weights),
+            "mood": convert_mood(data["mood"]),
+            "sentiment": convert_sentiment(data["sentiment"])}
+
+def insert_records(cursor, records):
+    """
+    Inserts records, folds them into the daily rollups and links their topics with one executemany call each.
+    Runs inside the caller's transaction. The search index is updated by a trigger.
+
+    :param cursor: sqlite3.Cursor
+    :param records: list of (user_id, data, message, now, provisional), now being the datetime of the check-in
+    :return: list of int, the ids of the new records
+    """
+    weights = _score_weights(cursor)
+    cursor.executemany("""INSERT INTO records 
+                       (user_id, 
+                       date, 
+                       well_being, 
+                       energy, 
+                       productivity, 
+                       sentiment, 
+                       mood, 
+                       score, 
+                       key_topics, 
+                       message,
+                       ts,
+                       provisional) 
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                       [(user_id,
+                         now.isoformat(),
+                         *_analysis_values(data, weights),
+                         message,
+                         int(now.timestamp()),
+                         int(provisional)) for user_id, data, message, now, provisional in records])
+    # The ids are consecutive, since the transaction holds the write lock for the whole executemany
+    last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    ids = list(range(last_id - len(records) + 1, last_id + 1))
+    add_to_daily_rollups(cursor, [(user_id, now.isoformat(), _rollup_values(data, weights))
+                                  for user_id, data, _, now, _ in records])
+    add_record_topics(cursor, [(record_id, user_id, data["key_topics"])
+                               for record_id, (user_id, data, _, _, _) in zip(ids, records)])
+    return ids
+
+def insert_incidents(cursor, incidents):
+    """
+    Inserts incidents with one executemany call. Runs inside the caller's transaction.
+
+    :param cursor: sqlite3.Cursor
+    :param incidents: list of (user_id, incident, now), now being the datetime of the report
+    """
+    cursor.executemany("""INSERT INTO incidents 
+                       (user_id, 
+                       date, 
+                       incident,
+                       ts) 
+                       VALUES (?, ?, ?, ?)""",
+                       [(user_id, now.isoformat(), incident, int(now.timestamp()))
+                        for user_id, incident, now in incidents])
+
+@connect
+def add_data_to_records(cursor, user_id, data, message, provisional=False):
+    """
+    With write-behind enabled the record is queued and written with the next batch,
+    except provisional records, whose id is needed to upgrade them later.
+
     user_id: int
     data: dict
     message: str
+    provisional: bool (The analysis is a stand-in, to be replaced through update_record_analyses)
+    :return: int, the id of the new record, or None if it was queued
+    """
+
+    record = (user_id, data, message, datetime.datetime.now(), provisional)
+    if db_connection._write_buffer is not None and not provisional:
+        # Converted now, so a malformed analysis fails here instead of in the background flush
+        _analysis_values(data, DEFAULT_WEIGHTS)
+        _rollup_values(data, DEFAULT_WEIGHTS)
+        db_connection._write_buffer.add_record(record)
+        return None
+    record_id, = insert_records(cursor, [record])
+    _notify_records_changed(user_id)
+    return record_id
+
+@connect
+def update_record_analyses(cursor, analyses):
+    """
+    Overwrites the analysis columns of existing records in one executemany call.
+    The records are no longer provisional afterwards.
+
+    analyses: list of (record_id: int, data: dict)
+    """
+    weights = _score_weights(cursor)
+    cursor.executemany("""UPDATE records SET
+                       well_being=?,
+                       energy=?,
+                       productivity=?,
+                       sentiment=?,
+                       mood=?,
+                       score=?,
+                       key_topics=?,
+                       provisional=0
+                       WHERE id=?""",
+                       [(*_analysis_values(data, weights), record_id) for record_id, data in analyses])
+    refresh_daily_rollups(cursor, [record_id for record_id, _ in analyses])
+    replace_record_topics(cursor, [(record_id, data["key_topics"]) for record_id, data in analyses])
+    _notify_records_changed()
+
+@connect
+def get_messages_after(cursor, last_id=0, limit=500, provisional_only=False):
+    """
+    Get the next chunk of (id, message) pairs in id order, for streaming over the records table.
+
+    last_id: int (Only records with a larger id are returned)
+    limit: int (Maximum number of rows to return)
+    provisional_only: bool (Only records whose analysis is still provisional)
+    """
+    assert isinstance(limit, int) and limit > 0, "Limit must be a positive integer."
+
+    provisional = "AND provisional=1" if provisional_only else ""
+    cursor.execute(f"SELECT id, message FROM records WHERE id > ? {provisional} ORDER BY id LIMIT ?", (last_id, limit))
+    return cursor.fetchall()
+
+@connect
+def get_backfill_progress(cursor, job):
+    """
+    Get the checkpoint of a backfill job.
+
+    job: str
+    :return: tuple (last_id, processed, failed), or (0, 0, 0) if the job has not run
+    """
+    cursor.execute("SELECT last_id, processed, failed FROM backfill_progress WHERE job=?", (job,))
+    fetch = cursor.fetchone()
+    return fetch if fetch is not None else (0, 0, 0)
+
+@connect
+def set_backfill_progress(cursor, job, last_id, processed, failed):
     """
+    Store the checkpoint of a backfill job.
+
+    job: str
+    last_id: int (Id of the last record handled)
+    processed: int
+    failed: int
+    """
+    cursor.execute("""INSERT INTO backfill_progress (job, last_id, processed, failed, updated_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(job) DO UPDATE SET
+                   last_id=excluded.last_id,
+                   processed=excluded.processed,
+                   failed=excluded.failed,
+                   updated_at=excluded.updated_at""",
+                   (job, last_id, processed, failed, datetime.datetime.now().isoformat()))
+
+@connect
+def reset_backfill_progress(cursor, job):
+    cursor.execute("DELETE FROM backfill_progress WHERE job=?", (job,))
+    cursor.execute("DELETE FROM backfill_failures WHERE job=?", (job,))
+
+@connect
+def add_backfill_failures(cursor, job, record_ids):
+    """
+    Remember records a backfill job could not analyse, so a resumed run retries them.
+
+    job: str
+    record_ids: list of int
+    """
+    cursor.executemany("INSERT OR IGNORE INTO backfill_failures (job, record_id) VALUES (?, ?)",
+                       [(job, record_id) for record_id in record_ids])
+
+@connect
+def remove_backfill_failures(cursor, job, record_ids):
+    """
+    job: str
+    record_ids: list of int (Records that have now been analysed)
+    """
+    cursor.executemany("DELETE FROM backfill_failures WHERE job=? AND record_id=?",
+                       [(job, record_id) for record_id in record_ids])
+
+@connect
+def get_backfill_failures(cursor, job, last_id=0, limit=500):
+    """
+    Get the next chunk of (id, message) pairs of records a backfill job failed on, in id order.
+    Records deleted since are skipped.
+
+    job: str
+    last_id: int (Only records with a larger id are returned)
+    limit: int (Maximum number of rows to return)
+    """
+    assert isinstance(limit, int) and limit > 0, "Limit must be a positive integer."
+
+    cursor.execute("""SELECT records.id, records.message FROM backfill_failures
+                   JOIN records ON records.id = backfill_failures.record_id
+                   WHERE backfill_failures.job=? AND backfill_failures.record_id > ?
+                   ORDER BY backfill_failures.record_id LIMIT ?""", (job, last_id, limit))
+    return cursor.fetchall()
 
-    cursor.execute("""INSERT INTO records 
-                   (user_id, 
-                   date, 
-                   well_being, 
-                   energy, 
-                   productivity, 
-                   sentiment, 
-                   mood, 
-                   score, 
-                   key_topics, 
-                   message) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                   (user_id, 
-                    datetime.datetime.now().isoformat(), 
-                    data["well_being"], 
-                    data["energy"], 
-                    data["productivity"], 
-                    data["sentiment"], 
-                    data["mood"], 
-                    calculate_composite_score(data), 
-                    ", ".join(data["key_topics"]), 
-                    message))
-                        
 @connect
 def add_incident(cursor, user_id, incident):
     """
+    With write-behind enabled the incident is queued and written with the next batch.
+
     user_id: int
     incident: str
     """
 
-    cursor.execute("""INSERT INTO incidents 
-                   (user_id, 
-                   date, 
-                   incident) 
-                   VALUES (?, ?, ?)""",
-                   (user_id, 
-                    datetime.datetime.now().isoformat(), 
-                    incident))
+    row = (user_id, incident, datetime.datetime.now())
+    if db_connection._write_buffer is not None:
+        db_connection._write_buffer.add_incident(row)
+        return
+    insert_incidents(cursor, [row])
     
 @connect
 def get_users(cursor):
@@ -100,21 +389,95 @@ def get_last_n_records_for_user(cursor, user_id, limit=10, column=None):
     """
 
     if column is None:
-        column = "*"
+        column = get_columns("records")
     else:
         assert isinstance(column, str), f"Column name must be a string, got {column}."
         assert column in get_fields("records"), "Invalid column name."
 
     assert isinstance(limit, int) and limit > 0, "Limit must be a positive integer."
 
-    cursor.execute(f"SELECT {column} FROM records WHERE user_id=? ORDER BY date DESC LIMIT ?", (user_id, limit))
+    flush_pending_writes(user_id)
+    cursor.execute(f"SELECT {column} FROM records WHERE user_id=? ORDER BY ts DESC, id DESC LIMIT ?", (user_id, limit))
 
     return cursor.fetchall()
 
 
+@connect
+def get_records_in_range(cursor, user_id, start=None, end=None, columns=None, after=None, limit=None,
+                         as_columns=False):
+    """
+    Get a user's records in a time window, oldest first, one page at a time.
+
+    Pages are addressed with a keyset cursor instead of an offset, so every page is a range scan of the
+    (user_id, ts) index however deep into the history it is.
+
+    Usage:
+        rows, cursor = get_records_in_range(user_id, start=month_ago, columns=["date", "score"], limit=100)
+        while cursor is not None:
+            rows, cursor = get_records_in_range(user_id, start=month_ago, columns=["date", "score"], limit=100,
+                                                after=cursor)
+
+    user_id: int
+    start: datetime, date, ISO string or epoch seconds (Only records at or after this time)
+    end: datetime, date, ISO string or epoch seconds (Only records before this time)
+    columns: list of str (Defaults to id followed by get_fields("records"))
+    after: tuple, the cursor returned with the previous page
+    limit: int (Maximum number of records per page, None returns the whole window)
+    as_columns: bool (Return a dict mapping each column to a tuple of its values instead of row tuples,
+                which numpy.asarray and pandas.DataFrame take as they are)
+    :return: tuple (list of row tuples or dict of columns, cursor of the next page or None after the last page)
+    """
+    if columns is None:
+        columns = ["id"] + get_fields("records")
+    else:
+        assert isinstance(columns, (list, tuple)) and columns, "Columns must be a non-empty list."
+        for column in columns:
+            assert column == "id" or column in get_fields("records"), f"Invalid column name: {column}"
+    assert limit is None or (isinstance(limit, int) and limit > 0), "Limit must be a positive integer."
+
+    conditions, parameters = ["user_id=?"], [user_id]
+    if start is not None:
+        conditions.append("ts>=?")
+        parameters.append(_to_epoch(start))
+    if end is not None:
+        conditions.append("ts<?")
+        parameters.append(_to_epoch(end))
+    if after is not None:
+        conditions.append("(ts, id) > (?, ?)")
+        parameters.extend(after)
+
+    # ts and id are selected last for the cursor and cut off again below
+    query = f"SELECT {', '.join(columns)}, ts, id FROM records WHERE {' AND '.join(conditions)} ORDER BY ts, id"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+
+    flush_pending_writes(user_id)
+    cursor.execute(query, parameters)
+    rows = cursor.fetchall()
+
+    next_cursor = rows[-1][-2:] if limit is not None and len(rows) == limit else None
+    width = len(columns)
+    if as_columns:
+        values = list(zip(*rows))
+        return {column: values[index] if rows else () for index, column in enumerate(columns)}, next_cursor
+    return [row[:width] for row in rows], next_cursor
+
+
+@connect
+def get_latest_record_id(cursor, user_id):
+    """
+    Get the id of the most recent record of a user, or 0 if the user has no records.
+    user_id: int
+    """
+    flush_pending_writes(user_id)
+    cursor.execute("SELECT MAX(id) FROM records WHERE user_id=?", (user_id,))
+    return cursor.fetchone()[0] or 0
+
 @connect
 def get_all_records(cursor):
-    cursor.execute("SELECT * FROM records")
+    flush_pending_writes()
+    cursor.execute(f"SELECT {get_columns('records')} FROM records")
     return cursor.fetchall()
 
 @connect
@@ -123,5 +486,117 @@ def get_incidents_for_user(cursor, user_id):
     Get all incidents for a user.
     user_id: int
     """
-    cursor.execute("SELECT * FROM incidents WHERE user_id=?", (user_id,))
-    return cursor.fetchall()
\ No newline at end of file
+    flush_pending_writes(user_id)
+    cursor.execute(f"SELECT {get_columns('incidents')} FROM incidents WHERE user_id=? ORDER BY ts, id", (user_id,))
+    return cursor.fetchall()
+
+@connect
+def get_cached_analysis(cursor, key, min_created_at=0):
+    """
+    Get a cached analysis result.
+
+    key: str
+    min_created_at: float (Entries created before this epoch time are treated as expired)
+    :return: tuple (result: str, latency: float, created_at: float), or None if there is no fresh entry
+    """
+    cursor.execute("SELECT result, latency, created_at FROM analysis_cache WHERE key=? AND created_at>=?",
+                   (key, min_created_at))
+    return cursor.fetchone()
+
+@connect
+def store_cached_analysis(cursor, key, result, latency, created_at):
+    """
+    key: str
+    result: str (JSON encoded analysis)
+    latency: float (Seconds the original analysis took)
+    created_at: float (Epoch time)
+    """
+    cursor.execute("INSERT OR REPLACE INTO analysis_cache (key, result, latency, created_at) VALUES (?, ?, ?, ?)",
+                   (key, result, latency, created_at))
+
+@connect
+def evict_cached_analyses(cursor, min_created_at, max_entries):
+    """
+    Delete expired cache entries, then the oldest ones beyond max_entries.
+
+    min_created_at: float (Entries created before this epoch time are deleted)
+    max_entries: int
+    :return: int, number of deleted entries
+    """
+    cursor.execute("DELETE FROM analysis_cache WHERE created_at<?", (min_created_at,))
+    deleted = cursor.rowcount
+    cursor.execute("""DELETE FROM analysis_cache WHERE key IN
+                   (SELECT key FROM analysis_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)""", (max_entries,))
+    return deleted + cursor.rowcount
+
+def _to_epoch(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return int(value.timestamp())
+
+def iter_chunks(table, columns=None, user_id=None, start=None, end=None, chunk_size=1000):
+    """
+    Stream rows of records or incidents in chunks, so memory use does not grow with the table.
+
+    table: str (records or incidents)
+    columns: list of str (Defaults to id followed by get_fields(table))
+    user_id: int (Only rows of this user)
+    start: datetime, date, ISO string or epoch seconds (Only rows at or after this time)
+    end: datetime, date, ISO string or epoch seconds (Only rows before this time)
+    chunk_size: int (Rows fetched per chunk)
+    :return: generator of lists of row tuples
+    """
+    assert table in ("records", "incidents"), "Only records and incidents can be streamed."
+    assert isinstance(chunk_size, int) and chunk_size > 0, "Chunk size must be a positive integer."
+
+    if columns is None:
+        columns = ["id"] + get_fields(table)
+    for column in columns:
+        assert column == "id" or column in get_fields(table), f"Invalid column name: {column}"
+
+    conditions, parameters = [], []
+    if user_id is not None:
+        conditions.append("user_id=?")
+        parameters.append(user_id)
+    if start is not None:
+        conditions.append("ts>=?")
+        parameters.append(_to_epoch(start))
+    if end is not None:
+        conditions.append("ts<?")
+        parameters.append(_to_epoch(end))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Per-user scans follow the (user_id, ts) index, full scans follow the table order
+    order = "ts, id" if user_id is not None else "id"
+
+    flush_pending_writes(user_id)
+    cursor = get_connection().cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY {order}", parameters)
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        cursor.close()
+
+def iter_records(columns=None, user_id=None, start=None, end=None, chunk_size=1000):
+    """
+    Stream records one row at a time, fetching chunk_size rows at once. Streaming counterpart of get_all_records.
+    See iter_chunks for the parameters.
+    """
+    for chunk in iter_chunks("records", columns, user_id, start, end, chunk_size):
+        yield from chunk
+
+def iter_incidents(columns=None, user_id=None, start=None, end=None, chunk_size=1000):
+    """
+    Stream incidents one row at a time, fetching chunk_size rows at once. Streaming counterpart of get_incidents_for_user.
+    See iter_chunks for the parameters.
+    """
+    for chunk in iter_chunks("incidents", columns, user_id, start, end, chunk_size):
+        yield from chunk
@@ -0,0 +1,182 @@
+import logging
+import datetime
+from .db_connection import connect, transaction
+from .db_rollups import rebuild_daily_rollups
+from .db_search import rebuild_record_topics
+
+# Rows rewritten per transaction by data migrations, so large tables never hold one huge write lock.
+MIGRATION_BATCH_SIZE = 10_000
+
+# Ordered list of (version, description, function). Each function brings the schema from version - 1 to version.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """
+    Registers a migration step. Steps run in version order, once per database.
+    A step must be safe to re-run if it was interrupted before its version was recorded.
+    """
+    def decorator(function):
+        assert all(version != existing for existing, _, _ in MIGRATIONS), f"Duplicate migration version {version}."
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return function
+    return decorator
+
+
+@connect
+def get_schema_version(cursor):
+    """
+    :return: int, the version of the last migration applied, 0 for a fresh database
+    """
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    return cursor.fetchone()[0] or 0
+
+
+@connect
+def _record_version(cursor, version, description):
+    cursor.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                   (version, description, datetime.datetime.now().isoformat()))
+
+
+def apply_migrations():
+    """
+    Applies every migration newer than the database's schema version.
+
+    :return: list of int, the versions applied
+    """
+    current = get_schema_version()
+    applied = []
+    for version, description, function in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Applying database migration {version}: {description}")
+        function()
+        _record_version(version, description)
+        applied.append(version)
+    return applied
+
+
+def _has_column(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _to_epoch(date):
+    try:
+        return int(datetime.datetime.fromisoformat(date).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backfill_epoch(table):
+    """
+    Fills the ts column from the ISO date column, one batch per transaction.
+    """
+    last_id = 0
+    while True:
+        with transaction() as cursor:
+            cursor.execute(f"SELECT id, date FROM {table} WHERE id > ? AND ts IS NULL ORDER BY id LIMIT ?",
+                           (last_id, MIGRATION_BATCH_SIZE))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+
+            updates = [(_to_epoch(date), row_id) for row_id, date in rows]
+            for ts, row_id in updates:
+                if ts is None:
+                    logging.warning(f"Could not convert date of {table} row {row_id}, leaving ts empty")
+            cursor.executemany(f"UPDATE {table} SET ts=? WHERE id=?", [update for update in updates if update[0] is not None])
+            last_id = rows[-1][0]
+
+
+@migration(1, "Index records and incidents by (user_id, date)")
+@connect
+def _index_user_date(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_user_date ON records (user_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_incidents_user_date ON incidents (user_id, date)")
+
+
+@migration(2, "Store dates as integer epoch seconds in ts and index by (user_id, ts)")
+def _epoch_timestamps():
+    for table in ("records", "incidents"):
+        with transaction() as cursor:
+            if not _has_column(cursor, table, "ts"):
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER")
+
+        _backfill_epoch(table)
+
+        with transaction() as cursor:
+            # The ts index serves every per-user query, so the text date index is no longer needed
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_ts ON {table} (user_id, ts)")
+            cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_user_date")
+
+
+@migration(3, "Build daily rollups from existing records")
+def _build_daily_rollups():
+    rebuild_daily_rollups()
+
+
+@migration(4, "Flag records analysed offline as provisional")
+@connect
+def _provisional_records(cursor):
+    if not _has_column(cursor, "records", "provisional"):
+        cursor.execute("ALTER TABLE records ADD COLUMN provisional INTEGER DEFAULT 0")
+    # Partial index, so finding the few provisional records does not scan the table
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_provisional ON records (id) WHERE provisional=1")
+
+
+@migration(5, "Index the job queue by status and due time")
+@connect
+def _index_jobs(cursor):
+    # The jobs table itself is created by create_database, like every table in db_structure
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)")
+
+
+@migration(6, "Index daily rollups by day and records by (ts, mood) for server-wide analytics")
+@connect
+def _index_analytics(cursor):
+    # Both indexes cover their queries in lib.database.db_analytics, so the tables themselves are not read
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_rollups_day ON daily_rollups (day, user_id, count, sum_score)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_ts_mood ON records (ts, mood)")
+
+
+@migration(7, "Add full-text search over messages and index records by normalised topic")
+def _search_index():
+    with transaction() as cursor:
+        # External content table: the FTS index stores no copy of the messages, the triggers keep it in sync.
+        # user_id is indexed as a term too, so a search only ranks the matches of one user.
+        cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS records_fts
+                       USING fts5(message, user_id, content='records', content_rowid='id',
+                                  tokenize='porter unicode61')""")
+        cursor.execute("""CREATE TRIGGER IF NOT EXISTS records_search_insert AFTER INSERT ON records BEGIN
+                           INSERT INTO records_fts (rowid, message, user_id) VALUES (new.id, new.message, new.user_id);
+                       END""")
+        cursor.execute("""CREATE TRIGGER IF NOT EXISTS records_search_delete AFTER DELETE ON records BEGIN
+                           INSERT INTO records_fts (records_fts, rowid, message, user_id)
+                               VALUES ('delete', old.id, old.message, old.user_id);
+                           DELETE FROM record_topics WHERE record_id = old.id;
+                       END""")
+        cursor.execute("""CREATE TRIGGER IF NOT EXISTS records_search_update AFTER UPDATE OF message, user_id ON records
+                       BEGIN
+                           INSERT INTO records_fts (records_fts, rowid, message, user_id)
+                               VALUES ('delete', old.id, old.message, old.user_id);
+                           INSERT INTO records_fts (rowid, message, user_id) VALUES (new.id, new.message, new.user_id);
+                       END""")
+        # Ranked by the message alone, the user_id column only filters
+        cursor.execute("INSERT INTO records_fts (records_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+        cursor.execute("INSERT INTO records_fts (records_fts) VALUES ('rebuild')")
+
+    rebuild_record_topics(MIGRATION_BATCH_SIZE)
+
+    with transaction() as cursor:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_record_topics_user_topic ON record_topics (user_id, topic_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_record_topics_topic ON record_topics (topic_id)")
+
+
+@migration(8, "Store a daily reminder time and timezone per user")
+@connect
+def _user_reminders(cursor):
+    for column in ("remind_time", "timezone"):
+        if not _has_column(cursor, "users", column):
+            cursor.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
@@ -0,0 +1,146 @@
+"""
+Per-user, per-day aggregates of the records table.
+
+daily_rollups holds count, sum, min and max of every metric in rollup_metrics for each (user_id, day),
+where day is the local date of the record. New records are folded in as they are inserted, rows whose
+analysis changed are recomputed by refresh_daily_rollups, and rebuild_daily_rollups recomputes everything.
+
+Usage:
+    python -m lib.database.db_rollups --rebuild [--user USER_ID]
+"""
+import argparse
+from .db_connection import connect, init_database, flush_pending_writes
+from .db_structure import rollup_metrics
+from lib.utility.functions import MOOD_MAPPING, SENTIMENT_MAPPING, DEFAULT_LABEL_VALUE
+
+
+def _label_case(column, mapping):
+    cases = " ".join(f"WHEN '{label}' THEN {value}" for label, value in mapping.items())
+    return f"(CASE {column} {cases} ELSE {DEFAULT_LABEL_VALUE} END)"
+
+# SQL expressions giving the numeric value of each rollup metric in a records row
+_METRIC_EXPRESSIONS = {
+    "well_being": "well_being",
+    "energy": "energy",
+    "productivity": "productivity",
+    "score": "score",
+    "mood": _label_case("mood", MOOD_MAPPING),
+    "sentiment": _label_case("sentiment", SENTIMENT_MAPPING),
+}
+
+_ROLLUP_COLUMNS = ", ".join(f"{aggregate}_{metric}" for metric in rollup_metrics for aggregate in ("sum", "min", "max"))
+
+_UPSERT = f"""INSERT INTO daily_rollups (user_id, day, count, {_ROLLUP_COLUMNS})
+              VALUES (?, ?, 1, {", ".join("?" for _ in rollup_metrics for _ in range(3))})
+              ON CONFLICT(user_id, day) DO UPDATE SET
+              count = count + 1,
+              {", ".join(f"sum_{m} = sum_{m} + excluded.sum_{m}, "
+                         f"min_{m} = MIN(min_{m}, excluded.min_{m}), "
+                         f"max_{m} = MAX(max_{m}, excluded.max_{m})" for m in rollup_metrics)}"""
+
+# Aggregates records into daily_rollups rows; {where} restricts which records are read
+_AGGREGATE = f"""INSERT OR REPLACE INTO daily_rollups (user_id, day, count, {_ROLLUP_COLUMNS})
+                 SELECT user_id, substr(date, 1, 10), COUNT(*),
+                 {", ".join(f"SUM({_METRIC_EXPRESSIONS[m]}), MIN({_METRIC_EXPRESSIONS[m]}), MAX({_METRIC_EXPRESSIONS[m]})"
+                            for m in rollup_metrics)}
+                 FROM records {{where}}
+                 GROUP BY user_id, substr(date, 1, 10)"""
+
+
+def add_to_daily_rollups(cursor, rows):
+    """
+    Folds new records into their daily rollups with one executemany call.
+    Runs inside the caller's transaction.
+
+    :param cursor: sqlite3.Cursor
+    :param rows: iterable of (user_id, date, values), date being the ISO date of the record and values
+                 a dict mapping every metric in rollup_metrics to its numeric value
+    """
+    parameters = []
+    for user_id, date, values in rows:
+        row = [user_id, date[:10]]
+        for metric in rollup_metrics:
+            row += [values[metric]] * 3
+        parameters.append(row)
+    cursor.executemany(_UPSERT, parameters)
+
+
+def refresh_daily_rollups(cursor, record_ids):
+    """
+    Recomputes the daily rollups containing the given records, after their analysis was rewritten.
+    Runs inside the caller's transaction.
+
+    :param cursor: sqlite3.Cursor
+    :param record_ids: list of int
+    """
+    days = set()
+    for i in range(0, len(record_ids), 500):
+        chunk = record_ids[i:i + 500]
+        cursor.execute(f"SELECT DISTINCT user_id, substr(date, 1, 10) FROM records "
+                       f"WHERE id IN ({', '.join('?' for _ in chunk)})", chunk)
+        days.update(cursor.fetchall())
+
+    for user_id, day in days:
+        cursor.execute(_AGGREGATE.format(where="WHERE user_id=? AND substr(date, 1, 10)=?"), (user_id, day))
+
+
+@connect
+def rebuild_daily_rollups(cursor, user_id=None):
+    """
+    Recomputes daily rollups from the records table, for one user or for everyone.
+
+    user_id: int (None rebuilds every user)
+    """
+    if user_id is None:
+        cursor.execute("DELETE FROM daily_rollups")
+        cursor.execute(_AGGREGATE.format(where=""))
+    else:
+        cursor.execute("DELETE FROM daily_rollups WHERE user_id=?", (user_id,))
+        cursor.execute(_AGGREGATE.format(where="WHERE user_id=?"), (user_id,))
+
+
+@connect
+def get_daily_rollups_for_user(cursor, user_id, days=365):
+    """
+    Get per-day mean, min and max of every rollup metric for the last N days.
+
+    user_id: int
+    days: int (Number of days to look back from today)
+    :return: list of tuples (day, count, mean_<metric>, min_<metric>, max_<metric> for each metric in rollup_metrics)
+    """
+    assert isinstance(days, int) and days > 0, "Days must be a positive integer."
+
+    flush_pending_writes(user_id)
+    aggregates = ", ".join(f"sum_{m} / count, min_{m}, max_{m}" for m in rollup_metrics)
+    cursor.execute(f"""SELECT day, count, {aggregates} FROM daily_rollups
+                   WHERE user_id=? AND day > date('now', 'localtime', ?)
+                   ORDER BY day""", (user_id, f"-{days} days"))
+    return cursor.fetchall()
+
+
+def get_rollup_fields():
+    """
+    Returns the column names of the rows returned by get_daily_rollups_for_user.
+
+    :return: list
+    """
+    return ["day", "count"] + [f"{aggregate}_{metric}" for metric in rollup_metrics
+                               for aggregate in ("mean", "min", "max")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the daily_rollups table.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute rollups from the records table.")
+    parser.add_argument("--user", type=int, default=None, help="Only rebuild this user's rollups.")
+    args = parser.parse_args(argv)
+
+    init_database()
+    if args.rebuild:
+        rebuild_daily_rollups(args.user)
+        print("Daily rollups rebuilt" + (f" for user {args.user}" if args.user is not None else ""))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
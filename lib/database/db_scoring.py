@@ -0,0 +1,82 @@
+"""
+Recomputes the score column of every record, e.g. after DEFAULT_WEIGHTS changed or under new weights.
+Weights given here are stored with set_score_weights, so check-ins written afterwards are scored the same way.
+
+Records are read in id-ordered chunks, scored with the vectorized calculate_composite_scores and
+written back with one executemany UPDATE per chunk. Daily rollups are rebuilt once at the end.
+
+Usage:
+    python -m lib.database.db_scoring
+    python -m lib.database.db_scoring --weights sentiment=1 mood=1 well_being=2 energy=1 productivity=2
+"""
+import time
+import argparse
+from .db_connection import transaction, init_database, set_database
+from .db_interaction import _notify_records_changed, get_score_weights, set_score_weights
+from .db_rollups import rebuild_daily_rollups
+from lib.utility.functions import calculate_composite_scores, DEFAULT_WEIGHTS
+
+_SCORED_COLUMNS = ["well_being", "energy", "productivity", "sentiment", "mood"]
+
+
+def recompute_scores(weights=None, chunk_size=50_000):
+    """
+    Rewrites the score of every record under the given weights in a single pass.
+    The weights are stored first, so records added during the pass are scored with them too.
+
+    :param weights: dict overriding the stored weights, None to recompute with the stored weights
+    :param chunk_size: int, records scored and updated per transaction
+    :return: dict with rows, seconds and rows_per_second
+    """
+    assert isinstance(chunk_size, int) and chunk_size > 0, "Chunk size must be a positive integer."
+    weights = set_score_weights(weights) if weights else get_score_weights()
+
+    started = time.perf_counter()
+    rows = 0
+    last_id = 0
+    while True:
+        with transaction() as cursor:
+            cursor.execute(f"SELECT id, {', '.join(_SCORED_COLUMNS)} FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                           (last_id, chunk_size))
+            chunk = cursor.fetchall()
+            if not chunk:
+                break
+
+            columns = list(zip(*chunk))
+            scores = calculate_composite_scores(dict(zip(_SCORED_COLUMNS, columns[1:])), weights)
+            cursor.executemany("UPDATE records SET score=? WHERE id=?", zip(scores.tolist(), columns[0]))
+
+        rows += len(chunk)
+        last_id = chunk[-1][0]
+
+    rebuild_daily_rollups()
+    _notify_records_changed()
+
+    seconds = time.perf_counter() - started
+    return {"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds if seconds > 0 else 0.0}
+
+
+def _parse_weight(text):
+    name, _, value = text.partition("=")
+    if name not in DEFAULT_WEIGHTS:
+        raise argparse.ArgumentTypeError(f"Unknown weight {name!r}, expected one of {', '.join(DEFAULT_WEIGHTS)}")
+    return name, float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute the score column of all records.")
+    parser.add_argument("--weights", nargs="+", type=_parse_weight, default=[],
+                        help="Weights to store and score with, as name=value. Unnamed weights keep their stored value.")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Records updated per transaction.")
+    parser.add_argument("--database", default=None, help="Database file, defaults to the bot's database.")
+    args = parser.parse_args(argv)
+
+    if args.database:
+        set_database(args.database)
+    init_database()
+    report = recompute_scores(dict(args.weights), chunk_size=args.chunk_size)
+    print(f"Recomputed {report['rows']} scores in {report['seconds']:.1f} s ({report['rows_per_second']:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Full-text search over check-in messages and a normalised index of their key topics.
+
+records_fts is an FTS5 index over records.message and user_id that uses the records table as its content,
+kept in sync by triggers (see migration 7). A search matches the user's id as one more term, so only
+that user's matches are ranked. Topics are stored once each in topics, lowercased, and linked to
+records and their user in record_topics, so topic questions are answered from the
+(user_id, topic_id) index instead of splitting records.key_topics in Python.
+"""
+import re
+from .db_connection import connect, transaction, flush_pending_writes
+
+_TERM = re.compile(r"\w+")
+
+
+def normalise_topic(topic):
+    """
+    :param topic: str
+    :return: str, the topic as it is stored in the topics table
+    """
+    return " ".join(topic.split()).lower()
+
+
+def _topic_names(topics):
+    return {normalise_topic(topic) for topic in topics if topic and topic.strip()}
+
+
+def add_record_topics(cursor, entries):
+    """
+    Links new records to their topics, adding unknown topics. Runs inside the caller's transaction.
+
+    :param cursor: sqlite3.Cursor
+    :param entries: list of (record_id, user_id, topics), topics being a list of str
+    """
+    links = [(record_id, user_id, name) for record_id, user_id, topics in entries for name in _topic_names(topics)]
+    if not links:
+        return
+    cursor.executemany("INSERT OR IGNORE INTO topics (name) VALUES (?)", {(name,) for _, _, name in links})
+    cursor.executemany("""INSERT OR IGNORE INTO record_topics (record_id, topic_id, user_id)
+                       SELECT ?, id, ? FROM topics WHERE name=?""", links)
+
+
+def replace_record_topics(cursor, entries):
+    """
+    Replaces the topics of existing records, e.g. after they were analysed again.
+    Runs inside the caller's transaction.
+
+    :param cursor: sqlite3.Cursor
+    :param entries: list of (record_id, topics), topics being a list of str
+    """
+    cursor.executemany("DELETE FROM record_topics WHERE record_id=?", [(record_id,) for record_id, _ in entries])
+    links = [(name, record_id) for record_id, topics in entries for name in _topic_names(topics)]
+    if not links:
+        return
+    cursor.executemany("INSERT OR IGNORE INTO topics (name) VALUES (?)", {(name,) for name, _ in links})
+    cursor.executemany("""INSERT OR IGNORE INTO record_topics (record_id, topic_id, user_id)
+                       SELECT records.id, topics.id, records.user_id FROM records, topics
+                       WHERE topics.name=? AND records.id=?""", links)
+
+
+def rebuild_record_topics(batch_size=10_000):
+    """
+    Rebuilds record_topics from the comma-joined records.key_topics, one batch of records per transaction,
+    e.g. after rows were inserted without insert_records.
+
+    :param batch_size: int, records per transaction
+    """
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM record_topics")
+
+    last_id = 0
+    while True:
+        with transaction() as cursor:
+            cursor.execute("SELECT id, user_id, key_topics FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                           (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            add_record_topics(cursor, [(record_id, user_id, (key_topics or "").split(","))
+                                       for record_id, user_id, key_topics in rows])
+            last_id = rows[-1][0]
+
+
+def _match_expression(user_id, text):
+    # Every word is quoted, so punctuation and FTS5 operators in user input are matched literally
+    terms = " ".join(f'"{term}"' for term in _TERM.findall(text))
+    if not terms:
+        return None
+    return f'user_id : "{int(user_id)}" AND message : ({terms})'
+
+
+@connect
+def search_records(cursor, user_id, text, limit=10):
+    """
+    Search a user's check-in messages, best match first.
+    All words must occur; words are stemmed, so "working" also finds "work".
+
+    user_id: int
+    text: str
+    limit: int (Maximum number of results)
+    :return: list of tuples (record_id, date, snippet with the matches in **bold**, bm25 rank, lower is better)
+    """
+    assert isinstance(limit, int) and limit > 0, "Limit must be a positive integer."
+
+    expression = _match_expression(user_id, text)
+    if expression is None:
+        return []
+
+    flush_pending_writes(user_id)
+    cursor.execute("""SELECT records.id, records.date, snippet(records_fts, 0, '**', '**', '...', 16), records_fts.rank
+                   FROM records_fts JOIN records ON records.id = records_fts.rowid
+                   WHERE records_fts MATCH ?
+                   ORDER BY records_fts.rank LIMIT ?""", (expression, limit))
+    return cursor.fetchall()
+
+
+@connect
+def get_topic_counts(cursor, user_id=None, limit=10):
+    """
+    Get the most frequent topics of a user's check-ins, or of all check-ins.
+
+    user_id: int (None counts the topics of every user)
+    limit: int (Maximum number of topics)
+    :return: list of tuples (topic, number of check-ins), most frequent first
+    """
+    assert isinstance(limit, int) and limit > 0, "Limit must be a positive integer."
+
+    flush_pending_writes(user_id)
+    condition, parameters = ("WHERE record_topics.user_id=?", [user_id]) if user_id is not None else ("", [])
+    cursor.execute(f"""SELECT topics.name, counts.check_ins FROM
+                    (SELECT topic_id, COUNT(*) AS check_ins FROM record_topics {condition}
+                     GROUP BY topic_id ORDER BY check_ins DESC LIMIT ?) AS counts
+                    JOIN topics ON topics.id = counts.topic_id
+                    ORDER BY counts.check_ins DESC, topics.name""", parameters + [limit])
+    return cursor.fetchall()
+
+
+@connect
+def get_topic_count(cursor, user_id, topic):
+    """
+    Get the number of a user's check-ins that mention a topic.
+
+    user_id: int
+    topic: str (Compared case-insensitively)
+    :return: int
+    """
+    flush_pending_writes(user_id)
+    cursor.execute("""SELECT COUNT(*) FROM record_topics
+                   WHERE user_id=? AND topic_id=(SELECT id FROM topics WHERE name=?)""",
+                   (user_id, normalise_topic(topic)))
+    return cursor.fetchone()[0]
@@ -1,9 +1,16 @@
 db_name = "database/CheckIn.db"
 
+# Numeric record metrics aggregated per user and day in daily_rollups.
+# mood and sentiment are stored as their numerical values.
+rollup_metrics = ["well_being", "energy", "productivity", "score", "mood", "sentiment"]
+
 db_structure = {
     "users": {
         "id": "INTEGER PRIMARY KEY",
-        "name": "TEXT"
+        "name": "TEXT",
+        # Local HH:MM and IANA timezone of the daily reminder, NULL for the bot's defaults
+        "remind_time": "TEXT",
+        "timezone": "TEXT"
     },
     "records": {
         "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
@@ -17,6 +24,8 @@ db_structure = {
         "score": "REAL",
         "key_topics": "TEXT",
         "message": "TEXT",
+        "ts": "INTEGER",
+        "provisional": "INTEGER DEFAULT 0",
         "FOREIGN KEY(user_id)": "REFERENCES users(id)"
     },
     "incidents": {
@@ -24,10 +33,83 @@ db_structure = {
         "user_id": "INTEGER",
         "date": "TEXT",
         "incident": "TEXT",
+        "ts": "INTEGER",
         "FOREIGN KEY(user_id)": "REFERENCES users(id)"
+    },
+    "schema_version": {
+        "version": "INTEGER PRIMARY KEY",
+        "description": "TEXT",
+        "applied_at": "TEXT"
+    },
+    "backfill_progress": {
+        "job": "TEXT PRIMARY KEY",
+        "last_id": "INTEGER",
+        "processed": "INTEGER",
+        "failed": "INTEGER",
+        "updated_at": "TEXT"
+    },
+    # Records a backfill job could not analyse, retried when the job is resumed
+    "backfill_failures": {
+        "job": "TEXT",
+        "record_id": "INTEGER",
+        "PRIMARY KEY": "(job, record_id)"
+    },
+    "daily_rollups": {
+        "user_id": "INTEGER",
+        "day": "TEXT",
+        "count": "INTEGER",
+        **{f"{aggregate}_{metric}": "REAL" for metric in rollup_metrics for aggregate in ("sum", "min", "max")},
+        "PRIMARY KEY": "(user_id, day)",
+        "FOREIGN KEY(user_id)": "REFERENCES users(id)"
+    },
+    # Bot-wide settings stored as JSON, e.g. the score weights set by lib.database.db_scoring
+    "settings": {
+        "key": "TEXT PRIMARY KEY",
+        "value": "TEXT"
+    },
+    "analysis_cache": {
+        "key": "TEXT PRIMARY KEY",
+        "result": "TEXT",
+        "latency": "REAL",
+        "created_at": "REAL"
+    },
+    # Normalised key topics, see lib.database.db_search. user_id is repeated in record_topics,
+    # so per-user topic counts are read from the (user_id, topic_id) index alone.
+    "topics": {
+        "id": "INTEGER PRIMARY KEY",
+        "name": "TEXT UNIQUE"
+    },
+    "record_topics": {
+        "record_id": "INTEGER",
+        "topic_id": "INTEGER",
+        "user_id": "INTEGER",
+        "PRIMARY KEY": "(record_id, topic_id)",
+        "FOREIGN KEY(record_id)": "REFERENCES records(id)",
+        "FOREIGN KEY(topic_id)": "REFERENCES topics(id)"
+    },
+    # Durable job queue, see lib.jobs. Times are epoch seconds.
+    "jobs": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "kind": "TEXT",
+        "payload": "TEXT",
+        "status": "TEXT",
+        "attempts": "INTEGER DEFAULT 0",
+        "max_attempts": "INTEGER",
+        "run_at": "REAL",
+        "leased_by": "TEXT",
+        "lease_until": "REAL",
+        "result": "BLOB",
+        "error": "TEXT",
+        "created_at": "REAL",
+        "updated_at": "REAL"
     }
 }
 
+# Columns maintained by the database layer itself, e.g. the epoch timestamp mirroring date, or the flag
+# marking records analysed offline until the LLM analysis replaces them.
+# They are not returned by the query functions, so rows keep the same shape as before they existed.
+internal_fields = {"ts", "provisional"}
+
 def get_fields(table):
     """
     Returns a list of fields that can be interacted with in a table.
@@ -35,4 +117,14 @@ def get_fields(table):
     :param table: str
     :return: list
     """
-    return [field for field in db_structure[table].keys() if (field != "id" and "FOREIGN" not in field)]
\ No newline at end of file
+    return [field for field in db_structure[table].keys()
+            if (field != "id" and "FOREIGN" not in field and "PRIMARY" not in field and field not in internal_fields)]
+
+def get_columns(table):
+    """
+    Returns the column list used in place of * when selecting full rows, i.e. id followed by get_fields.
+
+    :param table: str
+    :return: str
+    """
+    return ", ".join(["id"] + get_fields(table))
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Write-behind buffering of new records and incidents.
+
+When enabled, add_data_to_records and add_incident only queue their rows. A background thread writes
+the queue with executemany in a single transaction once max_rows rows are waiting or every max_delay
+seconds, so a burst of check-ins costs a few commits instead of one per check-in. Readers of a user's
+records flush that user's pending rows first, and the queue is flushed when the buffer stops or the
+interpreter exits.
+
+Rows are only durable once flushed: if the process is killed, up to max_delay seconds of acknowledged
+check-ins are lost. Records are validated when queued, and if a batch still fails, its rows are retried
+one at a time and those that fail on their own are logged and dropped, so one bad row cannot block the rest.
+
+Usage:
+    from lib.database.db_writer import enable_write_behind, disable_write_behind
+    enable_write_behind(max_rows=500, max_delay=0.5)
+    ...
+    disable_write_behind()  # flushes what is left
+"""
+import atexit
+import sqlite3
+import logging
+import threading
+from . import db_connection
+from .db_connection import open_connection, set_write_buffer
+from .db_interaction import insert_records, insert_incidents, _notify_records_changed
+
+
+class WriteBehindBuffer:
+    """
+    Queues record and incident inserts and writes them in batches on a background thread.
+    """
+
+    def __init__(self, max_rows=500, max_delay=0.5):
+        """
+        :param max_rows: int, pending rows that trigger a flush
+        :param max_delay: float, seconds between time-based flushes
+        """
+        assert isinstance(max_rows, int) and max_rows > 0, "max_rows must be a positive integer."
+        assert max_delay > 0, "max_delay must be positive."
+
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._records = []
+        self._incidents = []
+        self._users = set()
+        self._lock = threading.Lock()        # Guards the pending rows
+        self._flush_lock = threading.Lock()  # One flush at a time, so readers also wait for a flush in progress
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._conn = None
+        self._conn_path = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Stops the background thread and writes every pending row.
+        """
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+            atexit.unregister(self.stop)
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def add_record(self, record):
+        """
+        :param record: tuple (user_id, data, message, now, provisional), as taken by insert_records
+        """
+        self._add(self._records, record)
+
+    def add_incident(self, incident):
+        """
+        :param incident: tuple (user_id, incident, now), as taken by insert_incidents
+        """
+        self._add(self._incidents, incident)
+
+    def _add(self, queue, row):
+        with self._lock:
+            queue.append(row)
+            self._users.add(row[0])
+            full = len(self._records) + len(self._incidents) >= self.max_rows
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        """
+        :return: int, number of rows waiting to be written
+        """
+        with self._lock:
+            return len(self._records) + len(self._incidents)
+
+    def flush(self, user_id=None):
+        """
+        Writes the pending rows in one transaction.
+
+        :param user_id: int, only flush if this user has pending rows; None flushes anything pending
+        :return: int, number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                if user_id is not None and user_id not in self._users:
+                    return 0
+                records, incidents, users = self._records, self._incidents, self._users
+                self._records, self._incidents, self._users = [], [], set()
+
+            if not records and not incidents:
+                return 0
+
+            conn = self._connection()
+            error = None
+            try:
+                with conn:
+                    cursor = conn.cursor()
+                    insert_records(cursor, records)
+                    insert_incidents(cursor, incidents)
+            except sqlite3.OperationalError:
+                # E.g. the database is locked: put the rows back in front of anything queued meanwhile,
+                # so the next flush retries them
+                self._requeue(records, incidents, users)
+                raise
+            except Exception:
+                logging.exception(f"Write-behind batch of {len(records) + len(incidents)} rows failed, "
+                                  f"writing them one at a time")
+                records, incidents, error = self._write_one_by_one(conn, records, incidents)
+
+            self.flushes += 1
+            self.rows_written += len(records) + len(incidents)
+
+        for user in {record[0] for record in records}:
+            _notify_records_changed(user)
+        if error is not None:
+            raise error
+        return len(records) + len(incidents)
+
+    def _requeue(self, records, incidents, users):
+        with self._lock:
+            self._records[:0] = records
+            self._incidents[:0] = incidents
+            self._users |= users
+
+    def _write_one_by_one(self, conn, records, incidents):
+        """
+        Writes every row in its own transaction. Rows that fail are logged and dropped.
+        If the database itself fails, the rows not written yet are queued again.
+
+        :return: tuple (list of records written, list of incidents written, the sqlite3.OperationalError or None)
+        """
+        written = ([], [])
+        rows = [(insert_records, record, written[0]) for record in records]
+        rows += [(insert_incidents, incident, written[1]) for incident in incidents]
+        for index, (insert, row, done) in enumerate(rows):
+            try:
+                with conn:
+                    insert(conn.cursor(), [row])
+            except sqlite3.OperationalError as e:
+                # Not the row's fault, so it and the rows after it are retried by the next flush
+                remaining = rows[index:]
+                self._requeue([pending for function, pending, _ in remaining if function is insert_records],
+                              [pending for function, pending, _ in remaining if function is insert_incidents],
+                              {pending[0] for _, pending, _ in remaining})
+                return (*written, e)
+            except Exception:
+                self.rows_dropped += 1
+                logging.exception(f"Dropped a write-behind row of user {row[0]}: {row!r}")
+            else:
+                done.append(row)
+        return (*written, None)
+
+    def _connection(self):
+        # The buffer commits on its own connection, independently of any transaction open in the calling thread
+        if self._conn is None or self._conn_path != db_connection.db_path:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = open_connection(db_connection.db_path)
+            self._conn_path = db_connection.db_path
+        return self._conn
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Write-behind flush failed, retrying on the next one")
+
+    def stats(self):
+        return {"pending": self.pending(), "flushes": self.flushes, "rows_written": self.rows_written,
+                "rows_dropped": self.rows_dropped}
+
+
+_buffer = None
+
+
+def enable_write_behind(max_rows=500, max_delay=0.5):
+    """
+    Starts buffering new records and incidents. Calling it again returns the running buffer.
+
+    :param max_rows: int, pending rows that trigger a flush
+    :param max_delay: float, seconds between time-based flushes
+    :return: WriteBehindBuffer
+    """
+    global _buffer
+    if _buffer is None:
+        _buffer = WriteBehindBuffer(max_rows=max_rows, max_delay=max_delay)
+        _buffer.start()
+        set_write_buffer(_buffer)
+    return _buffer
+
+
+def disable_write_behind():
+    """
+    Flushes pending rows and goes back to writing every insert immediately.
+    """
+    global _buffer
+    if _buffer is not None:
+        set_write_buffer(None)
+        _buffer.stop()
+        _buffer = None
@@ -0,0 +1,3 @@
+from .queue import (enqueue, lease, ack, fail, get_job, retry_dead, purge_jobs, get_queue_stats, Job, JobFailed,
+                    QUEUED, LEASED, DONE, DEAD)
+from .handlers import HANDLERS, handler
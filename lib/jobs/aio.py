@@ -0,0 +1,50 @@
+"""
+Async front end of the job queue for the bot: enqueue jobs and poll for their results
+without blocking the event loop. Database calls run on the database thread of lib.database.aio.
+"""
+import time
+import asyncio
+from lib.database.aio import run
+from . import queue
+from .queue import DONE, DEAD, JobFailed
+
+
+async def enqueue(kind, payload, max_attempts=5, delay=0.0):
+    return await run(queue.enqueue, kind, payload, max_attempts=max_attempts, delay=delay)
+
+
+async def get_job(job_id):
+    return await run(queue.get_job, job_id)
+
+
+async def wait_for_job(job_id, timeout=60.0, interval=0.1, max_interval=1.0):
+    """
+    Polls until a job is done and returns its result.
+    The interval grows by half after every poll up to max_interval, so quick jobs are picked up
+    quickly while slow ones do not keep the database thread busy.
+
+    :param job_id: int
+    :param timeout: float, seconds
+    :return: the job result
+    :raises JobFailed: if the job is dead
+    :raises asyncio.TimeoutError: if the job is not done within timeout, it stays queued
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await get_job(job_id)
+        if job is None:
+            raise JobFailed(f"Job {job_id} does not exist")
+        if job.status == DONE:
+            return job.result
+        if job.status == DEAD:
+            raise JobFailed(f"Job {job_id} ({job.kind}) failed after {job.attempts} attempts: {job.error}")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"Job {job_id} ({job.kind}) still {job.status} after {timeout} s")
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, max_interval)
+
+
+async def get_queue_stats():
+    return await run(queue.get_queue_stats)
@@ -0,0 +1,66 @@
+"""
+Functions run by the workers, one per job kind.
+Each takes the job payload and returns the job result: bytes, a JSON-serialisable value or None.
+"""
+import lib.database as db
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """
+    Registers the function running jobs of `kind`.
+    """
+    def decorator(function):
+        assert kind not in HANDLERS, f"Duplicate handler for {kind}."
+        HANDLERS[kind] = function
+        return function
+    return decorator
+
+
+@handler("analyse")
+def analyse(payload):
+    """
+    Analyses a check-in with the LLM.
+
+    With a record_id the analysis replaces the provisional one of that record, otherwise a new record
+    is stored for user_id.
+
+    :param payload: dict with message and either record_id or user_id
+    :return: dict, the analysis and the record id
+    """
+    from lib.LLM import analyse_message_with_LLM
+
+    analysis = analyse_message_with_LLM(payload["message"])
+    record_id = payload.get("record_id")
+    if record_id is not None:
+        db.update_record_analyses([(record_id, analysis)])
+    else:
+        record_id = db.add_data_to_records(payload["user_id"], analysis, payload["message"])
+    return {"record_id": record_id, "analysis": analysis}
+
+
+@handler("plot")
+def plot(payload):
+    """
+    Renders a plot of a user's metrics.
+
+    :param payload: dict with user_id, metric and days
+    :return: bytes, the plot as a PNG image, or None if there was nothing to plot
+    """
+    from lib.plotting import plot_metric_over_time
+
+    return plot_metric_over_time(payload["user_id"], payload["metric"], days=payload["days"])
+
+
+@handler("serverstats")
+def server_stats(payload):
+    """
+    Renders the server-wide activity plot.
+
+    :param payload: dict with weeks and days
+    :return: bytes, the plot as a PNG image, or None if there was nothing to plot
+    """
+    from lib.plotting import render_server_stats
+
+    return render_server_stats(weeks=payload["weeks"], days=payload["days"])
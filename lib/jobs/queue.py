@@ -0,0 +1,193 @@
+"""
+Durable job queue stored in the jobs table of the bot's SQLite database.
+
+A job moves from queued to leased when a worker takes it, and from leased to done when the worker
+acknowledges it. A failed attempt puts the job back in the queue with an exponential backoff, until
+max_attempts attempts failed and it is moved to dead, where it stays until retried by hand.
+A lease expires after lease_seconds, so the jobs of a worker that crashed are picked up again.
+
+Leasing is a single UPDATE ... RETURNING statement, so any number of worker processes never take the
+same job twice. They must all run on the host that holds the database file: SQLite's WAL mode keeps its
+index in shared memory, which a network file system does not share between hosts. Workers on several
+hosts would need the queue in a client/server database instead.
+"""
+import json
+import time
+from collections import namedtuple
+from lib.database.db_connection import connect
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+# Seconds before the first retry, doubled after every further failed attempt up to MAX_BACKOFF
+BACKOFF = 5.0
+MAX_BACKOFF = 600.0
+
+Job = namedtuple("Job", ["id", "kind", "payload", "status", "attempts", "max_attempts", "result", "error"])
+
+
+class JobFailed(Exception):
+    """Raised when waiting for a job that ended up dead."""
+
+
+def _encode_result(result):
+    # Images are stored as they are, anything else as JSON
+    if result is None or isinstance(result, bytes):
+        return result
+    return json.dumps(result)
+
+
+def _decode_result(result):
+    if isinstance(result, str):
+        return json.loads(result)
+    return result
+
+
+def _job(row):
+    id, kind, payload, status, attempts, max_attempts, result, error = row
+    return Job(id, kind, json.loads(payload), status, attempts, max_attempts, _decode_result(result), error)
+
+
+_JOB_COLUMNS = "id, kind, payload, status, attempts, max_attempts, result, error"
+
+
+@connect
+def enqueue(cursor, kind, payload, max_attempts=5, delay=0.0):
+    """
+    Adds a job to the queue.
+
+    :param kind: str, name of the handler that runs the job, see lib.jobs.handlers
+    :param payload: JSON-serialisable arguments of the handler
+    :param max_attempts: int, attempts before the job is moved to dead
+    :param delay: float, seconds before the job may run
+    :return: int, the job id
+    """
+    assert isinstance(kind, str) and kind, "Kind must be a non-empty string."
+    assert isinstance(max_attempts, int) and max_attempts > 0, "max_attempts must be a positive integer."
+
+    now = time.time()
+    cursor.execute("""INSERT INTO jobs (kind, payload, status, attempts, max_attempts, run_at, created_at, updated_at)
+                   VALUES (?, ?, ?, 0, ?, ?, ?, ?)""",
+                   (kind, json.dumps(payload), QUEUED, max_attempts, now + delay, now, now))
+    return cursor.lastrowid
+
+
+@connect
+def lease(cursor, worker, kinds=None, limit=1, lease_seconds=120.0):
+    """
+    Takes up to `limit` due jobs, oldest first, including jobs whose lease expired.
+
+    :param worker: str, identifies the worker in leased_by
+    :param kinds: list of str, only lease these kinds; None leases any kind
+    :param limit: int
+    :param lease_seconds: float, time the worker has to ack or fail the job
+    :return: list of Job, with attempts already counting this attempt
+    """
+    assert isinstance(limit, int) and limit > 0, "Limit must be a positive integer."
+
+    now = time.time()
+    kind_filter = f"AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ""
+    kind_args = list(kinds) if kinds else []
+
+    # Jobs whose worker vanished during their last allowed attempt are not run again
+    cursor.execute(f"""UPDATE jobs SET status=?, error=COALESCE(error, 'Lease expired'), leased_by=NULL,
+                    lease_until=NULL, updated_at=?
+                    WHERE status=? AND lease_until<? AND attempts>=max_attempts {kind_filter}""",
+                   [DEAD, now, LEASED, now] + kind_args)
+
+    cursor.execute(f"""UPDATE jobs SET status=?, leased_by=?, lease_until=?, attempts=attempts+1, updated_at=?
+                    WHERE id IN (SELECT id FROM jobs
+                                 WHERE ((status=? AND run_at<=?) OR (status=? AND lease_until<?)) {kind_filter}
+                                 ORDER BY run_at, id LIMIT ?)
+                    RETURNING {_JOB_COLUMNS}""",
+                   [LEASED, worker, now + lease_seconds, now, QUEUED, now, LEASED, now] + kind_args + [limit])
+    return sorted((_job(row) for row in cursor.fetchall()), key=lambda job: job.id)
+
+
+@connect
+def ack(cursor, job_id, worker, result=None):
+    """
+    Marks a leased job as done and stores its result.
+
+    :param job_id: int
+    :param worker: str, the worker holding the lease
+    :param result: bytes or a JSON-serialisable value, read by whoever waits for the job
+    :return: bool, False if the lease was lost to another worker in the meantime
+    """
+    cursor.execute("""UPDATE jobs SET status=?, result=?, error=NULL, leased_by=NULL, lease_until=NULL, updated_at=?
+                   WHERE id=? AND status=? AND leased_by=?""",
+                   (DONE, _encode_result(result), time.time(), job_id, LEASED, worker))
+    return cursor.rowcount == 1
+
+
+@connect
+def fail(cursor, job_id, worker, error):
+    """
+    Records a failed attempt. The job is queued again after a backoff, or moved to dead after max_attempts.
+
+    :param job_id: int
+    :param worker: str, the worker holding the lease
+    :param error: str
+    :return: str, the new status, or None if the lease was lost
+    """
+    # One statement, so concurrent workers never see the job between reading its attempts and updating it
+    now = time.time()
+    cursor.execute("""UPDATE jobs SET
+                   status=CASE WHEN attempts>=max_attempts THEN ? ELSE ? END,
+                   run_at=? + MIN(? * (1 << (attempts - 1)), ?),
+                   error=?, leased_by=NULL, lease_until=NULL, updated_at=?
+                   WHERE id=? AND status=? AND leased_by=?
+                   RETURNING status""",
+                   (DEAD, QUEUED, now, BACKOFF, MAX_BACKOFF, str(error), now, job_id, LEASED, worker))
+    fetch = cursor.fetchone()
+    return fetch[0] if fetch is not None else None
+
+
+@connect
+def get_job(cursor, job_id):
+    """
+    :param job_id: int
+    :return: Job, or None if there is no such job
+    """
+    cursor.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id=?", (job_id,))
+    fetch = cursor.fetchone()
+    return _job(fetch) if fetch is not None else None
+
+
+@connect
+def retry_dead(cursor, kind=None):
+    """
+    Queues dead jobs again with a fresh set of attempts.
+
+    :param kind: str, only retry jobs of this kind; None retries all
+    :return: int, number of jobs queued
+    """
+    kind_filter = "AND kind=?" if kind else ""
+    cursor.execute(f"""UPDATE jobs SET status=?, attempts=0, run_at=?, updated_at=? WHERE status=? {kind_filter}""",
+                   [QUEUED, time.time(), time.time(), DEAD] + ([kind] if kind else []))
+    return cursor.rowcount
+
+
+@connect
+def purge_jobs(cursor, max_age=86400.0):
+    """
+    Deletes finished jobs older than max_age seconds. Dead jobs are kept for inspection.
+
+    :param max_age: float
+    :return: int, number of jobs deleted
+    """
+    cursor.execute("DELETE FROM jobs WHERE status=? AND updated_at<?", (DONE, time.time() - max_age))
+    return cursor.rowcount
+
+
+@connect
+def get_queue_stats(cursor):
+    """
+    :return: dict mapping each status to its number of jobs
+    """
+    cursor.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    stats = {QUEUED: 0, LEASED: 0, DONE: 0, DEAD: 0}
+    stats.update(cursor.fetchall())
+    return stats
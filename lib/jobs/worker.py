@@ -0,0 +1,147 @@
+"""
+Runs queued jobs, see lib.jobs.queue.
+
+Every worker process leases jobs from the shared database, runs their handler and acknowledges
+the result, so throughput scales with the number of processes. All workers run on the host of the
+database file, see lib.jobs.queue.
+Jobs in flight when a worker is stopped or crashes are leased again once their lease expires.
+
+Usage:
+    python -m lib.jobs.worker --processes 4
+    python -m lib.jobs.worker --kinds analyse --processes 8 --database database/CheckIn.db
+    python -m lib.jobs.worker --retry-dead
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from lib.database import db_connection
+from lib.utility.metrics import metrics
+from . import queue
+from .handlers import HANDLERS
+
+# Seconds between deletions of old finished jobs
+PURGE_INTERVAL = 3600.0
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_job(job, worker_id):
+    """
+    Runs one leased job and records its outcome.
+
+    :param job: queue.Job
+    :param worker_id: str
+    :return: bool, True if the job succeeded
+    """
+    function = HANDLERS.get(job.kind)
+    if function is None:
+        queue.fail(job.id, worker_id, f"No handler for job kind {job.kind!r}")
+        return False
+
+    try:
+        with metrics.timer(f"job.{job.kind}"):
+            result = function(job.payload)
+    except Exception as e:
+        status = queue.fail(job.id, worker_id, repr(e))
+        logging.warning(f"Job {job.id} ({job.kind}) attempt {job.attempts}/{job.max_attempts} failed, "
+                        f"now {status}: {e!r}")
+        return False
+
+    if not queue.ack(job.id, worker_id, result):
+        logging.warning(f"Job {job.id} ({job.kind}) finished after its lease was taken over")
+    return True
+
+
+def run_worker(worker_id=None, kinds=None, poll_interval=0.5, lease_seconds=120.0, stop=None, exit_when_idle=False):
+    """
+    Leases and runs jobs until `stop` is set.
+
+    :param worker_id: str, defaults to host:pid
+    :param kinds: list of str, job kinds to run; None runs every kind with a handler
+    :param poll_interval: float, seconds to wait when the queue is empty
+    :param lease_seconds: float, time a job may run before other workers may take it over
+    :param stop: threading.Event or multiprocessing.Event
+    :param exit_when_idle: bool, return as soon as no job is due, e.g. for tests and cron runs
+    :return: dict with succeeded and failed counts
+    """
+    worker_id = worker_id or default_worker_id()
+    kinds = kinds or sorted(HANDLERS)
+    stop = stop or threading.Event()
+    counts = {"succeeded": 0, "failed": 0}
+    last_purge = 0.0
+
+    logging.info(f"Worker {worker_id} running {', '.join(kinds)} jobs")
+    while not stop.is_set():
+        if time.monotonic() - last_purge > PURGE_INTERVAL:
+            queue.purge_jobs()
+            last_purge = time.monotonic()
+
+        jobs = queue.lease(worker_id, kinds=kinds, lease_seconds=lease_seconds)
+        if not jobs:
+            if exit_when_idle:
+                break
+            stop.wait(poll_interval)
+            continue
+
+        for job in jobs:
+            counts["succeeded" if run_job(job, worker_id) else "failed"] += 1
+    return counts
+
+
+def _worker_process(database, kinds, poll_interval, lease_seconds, stop):
+    # Ctrl+C reaches every process of the group, the parent sets stop for all of them instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    db_connection.set_database(database)
+    run_worker(kinds=kinds, poll_interval=poll_interval, lease_seconds=lease_seconds, stop=stop)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued analysis and plot jobs.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start.")
+    parser.add_argument("--kinds", default=None, help=f"Comma-separated job kinds, default: {','.join(HANDLERS)}.")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between polls of an empty queue.")
+    parser.add_argument("--lease-seconds", type=float, default=120.0, help="Time a job may run before it is retried.")
+    parser.add_argument("--database", default=None, help="Database file, defaults to the bot's database.")
+    parser.add_argument("--retry-dead", action="store_true", help="Queue dead jobs again and exit.")
+    args = parser.parse_args(argv)
+    assert args.processes > 0, "Processes must be a positive integer."
+
+    logging.basicConfig(level=logging.INFO)
+    if args.database:
+        db_connection.set_database(args.database)
+    db_connection.init_database()
+
+    if args.retry_dead:
+        print(f"Queued {queue.retry_dead()} dead jobs again")
+        return
+
+    kinds = args.kinds.split(",") if args.kinds else None
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    processes = [context.Process(target=_worker_process, name=f"worker-{index}",
+                                 args=(db_connection.db_path, kinds, args.poll_interval, args.lease_seconds, stop))
+                 for index in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for process in processes:
+            process.join()
+    logging.info(f"Stopped {len(processes)} workers, queue: {queue.get_queue_stats()}")
+
+
+if __name__ == "__main__":
+    main()
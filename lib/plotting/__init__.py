@@ -1 +1,17 @@
-from .datavisualiser import plot_metric_over_time
\ No newline at end of file
+import importlib
+from .render_service import RenderService, RenderQueueFull
+
+# The plotting functions pull in matplotlib and pandas, so they are imported on first use.
+_lazy_attributes = {
+    "plot_metric_over_time": ".datavisualiser",
+    "render_metric_over_time": ".datavisualiser",
+    "render_server_stats": ".datavisualiser",
+    "export_reports": ".create_export_tex",
+}
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,453 @@
+"""
+Monthly LaTeX reports per user: a pgfplots data table and a TeX document with summary statistics,
+the month's metrics plotted from that table, the most frequent topics and the reported incidents.
+
+Reports are generated for every user with check-ins or incidents in the month, by a pool of worker
+processes that each take a chunk of users. A run is incremental: each user's month (their daily rollups,
+topic links, incidents and name) is hashed into a fingerprint, reading the rows of all users in three
+queries, and only reports whose fingerprint differs from the manifest.json of the previous run are
+written again.
+Reports of users who no longer have data in the month are removed.
+
+With --pdf every regenerated document is also compiled with pdflatex, which needs a TeX installation
+with pgfplots. This is the slow part, and the reason the work is spread over processes.
+
+Usage:
+    python -m lib.plotting.create_export_tex                           # last month, into reports/
+    python -m lib.plotting.create_export_tex --month 2026-09 --output reports --processes 8 --pdf
+    python -m lib.plotting.create_export_tex --month 2026-09 --force   # ignore the manifest
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import datetime
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from lib.database import db_connection
+from lib.database.db_connection import connect, init_database, set_database, flush_pending_writes
+from lib.database.db_interaction import _to_epoch
+from lib.database.db_structure import rollup_metrics
+
+# Part of every fingerprint, so changing the report layout regenerates every report
+REPORT_VERSION = 1
+
+MANIFEST = "manifest.json"
+
+# Users handed to a worker process at a time
+CHUNK_SIZE = 50
+
+TOP_TOPICS = 10
+
+# Seconds pdflatex may take for one document
+PDF_TIMEOUT = 120
+
+METRIC_LABELS = {
+    "well_being": "Well-being",
+    "energy": "Energy",
+    "productivity": "Productivity",
+    "score": "Weighted sum score",
+    "mood": "Mood",
+    "sentiment": "Sentiment",
+}
+
+_TEX_ESCAPES = {
+    "\\": r"\textbackslash{}", "&": r"\&", "%": r"\%", "$": r"\$", "#": r"\#", "_": r"\_",
+    "{": r"\{", "}": r"\}", "~": r"\textasciitilde{}", "^": r"\textasciicircum{}",
+}
+
+
+def escape_tex(text):
+    """
+    :param text: str
+    :return: str, the text with LaTeX special characters escaped
+    """
+    return "".join(_TEX_ESCAPES.get(character, character) for character in text)
+
+
+def month_bounds(month):
+    """
+    :param month: str, YYYY-MM
+    :return: tuple of datetime.date, the first day of the month and of the next month
+    """
+    start = datetime.datetime.strptime(month, "%Y-%m").date()
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+@connect
+def get_report_fingerprints(cursor, month):
+    """
+    Fingerprints the data behind every report of a month, for all users at once.
+    Every row shown in a report is hashed, in a fixed order, so any change to it changes the fingerprint.
+
+    month: str (YYYY-MM)
+    :return: dict mapping user_id to a hex digest, for every user with check-ins or incidents in the month
+    """
+    start, end = month_bounds(month)
+    flush_pending_writes()
+
+    digests = {}
+
+    def add(section, rows):
+        for user_id, *values in rows:
+            digest = digests.get(user_id)
+            if digest is None:
+                digest = digests[user_id] = hashlib.sha1()
+            digest.update(json.dumps([section, values]).encode())
+
+    columns = ", ".join(f"sum_{m}, min_{m}, max_{m}" for m in rollup_metrics)
+    cursor.execute(f"""SELECT user_id, day, count, {columns} FROM daily_rollups
+                   WHERE day >= ? AND day < ? ORDER BY user_id, day""", (start.isoformat(), end.isoformat()))
+    add("rollups", cursor)
+
+    cursor.execute("""SELECT records.user_id, record_topics.record_id, record_topics.topic_id FROM records
+                   JOIN record_topics ON record_topics.record_id = records.id
+                   WHERE records.ts >= ? AND records.ts < ?
+                   ORDER BY records.user_id, record_topics.record_id, record_topics.topic_id""",
+                   (_to_epoch(start), _to_epoch(end)))
+    add("topics", cursor)
+
+    cursor.execute("""SELECT user_id, id, date, incident FROM incidents
+                   WHERE ts >= ? AND ts < ? ORDER BY user_id, id""", (_to_epoch(start), _to_epoch(end)))
+    add("incidents", cursor)
+
+    cursor.execute("SELECT id, name FROM users")
+    names = dict(cursor.fetchall())
+
+    fingerprints = {}
+    for user_id, digest in digests.items():
+        digest.update(json.dumps([REPORT_VERSION, names.get(user_id)]).encode())
+        fingerprints[user_id] = digest.hexdigest()
+    return fingerprints
+
+
+@connect
+def get_report_data(cursor, user_id, month):
+    """
+    Loads everything shown in one user's monthly report.
+
+    user_id: int
+    month: str (YYYY-MM)
+    :return: dict with name, days (list of tuples (day, count, mean of each metric in rollup_metrics)),
+             summary (dict mapping each metric to (mean, min, max)), check_ins, topics (list of (topic, count))
+             and incidents (list of (date, text))
+    """
+    start, end = month_bounds(month)
+
+    columns = ", ".join(f"sum_{m}, min_{m}, max_{m}" for m in rollup_metrics)
+    cursor.execute(f"""SELECT day, count, {columns} FROM daily_rollups
+                   WHERE user_id=? AND day >= ? AND day < ? ORDER BY day""",
+                   (user_id, start.isoformat(), end.isoformat()))
+    rows = cursor.fetchall()
+
+    check_ins = sum(row[1] for row in rows)
+    days, summary = [], {}
+    for row in rows:
+        days.append((row[0], row[1]) + tuple(_divide(row[2 + 3 * i], row[1]) for i in range(len(rollup_metrics))))
+    for i, metric in enumerate(rollup_metrics):
+        totals = [row[2 + 3 * i] for row in rows if row[2 + 3 * i] is not None]
+        minima = [row[3 + 3 * i] for row in rows if row[3 + 3 * i] is not None]
+        maxima = [row[4 + 3 * i] for row in rows if row[4 + 3 * i] is not None]
+        summary[metric] = (_divide(sum(totals), check_ins) if totals else None,
+                           min(minima, default=None), max(maxima, default=None))
+
+    cursor.execute("""SELECT topics.name, COUNT(*) AS check_ins FROM records
+                   JOIN record_topics ON record_topics.record_id = records.id
+                   JOIN topics ON topics.id = record_topics.topic_id
+                   WHERE records.user_id=? AND records.ts >= ? AND records.ts < ?
+                   GROUP BY topics.id ORDER BY check_ins DESC, topics.name LIMIT ?""",
+                   (user_id, _to_epoch(start), _to_epoch(end), TOP_TOPICS))
+    topics = cursor.fetchall()
+
+    cursor.execute("""SELECT date, incident FROM incidents
+                   WHERE user_id=? AND ts >= ? AND ts < ? ORDER BY ts""",
+                   (user_id, _to_epoch(start), _to_epoch(end)))
+    incidents = cursor.fetchall()
+
+    cursor.execute("SELECT name FROM users WHERE id=?", (user_id,))
+    name = cursor.fetchone()
+
+    return {
+        "name": name[0] if name else str(user_id),
+        "days": days,
+        "summary": summary,
+        "check_ins": check_ins,
+        "topics": topics,
+        "incidents": incidents,
+    }
+
+
+def _divide(total, count):
+    return total / count if total is not None and count else None
+
+
+def _number(value):
+    return "nan" if value is None else f"{value:.4f}"
+
+
+def format_data_table(days):
+    """
+    :param days: list of tuples (day, count, mean of each metric in rollup_metrics)
+    :return: str, a whitespace-separated table for pgfplots' \\addplot table, with nan for missing values
+    """
+    lines = [" ".join(["day", "count"] + rollup_metrics)]
+    for day, count, *means in days:
+        lines.append(" ".join([day, str(count)] + [_number(mean) for mean in means]))
+    return "\n".join(lines) + "\n"
+
+
+def _axis(month, table, metrics, y_label, limits=None):
+    start, end = month_bounds(month)
+    options = [
+        "date coordinates in=x", "xticklabel=\\day", "width=\\textwidth", "height=6cm",
+        f"xmin={start.isoformat()}", f"xmax={(end - datetime.timedelta(days=1)).isoformat()}",
+        f"ylabel={{{y_label}}}", "legend pos=outer north east", "grid=major", "unbounded coords=jump",
+    ]
+    if limits is not None:
+        options += [f"ymin={limits[0]}", f"ymax={limits[1]}"]
+    lines = ["\\begin{tikzpicture}", "\\begin{axis}[" + ", ".join(options) + "]"]
+    for metric in metrics:
+        lines.append(f"\\addplot+[mark size=1.5pt] table[x=day, y={metric}] {{{table}}};")
+        lines.append(f"\\addlegendentry{{{METRIC_LABELS[metric]}}}")
+    lines += ["\\end{axis}", "\\end{tikzpicture}"]
+    return lines
+
+
+def format_report(month, data, table):
+    """
+    :param month: str, YYYY-MM
+    :param data: dict as returned by get_report_data
+    :param table: str, file name of the data table, relative to the document
+    :return: str, a standalone LaTeX document
+    """
+    month_name = datetime.datetime.strptime(month, "%Y-%m").strftime("%B %Y")
+    lines = [
+        "\\documentclass[a4paper,11pt]{article}",
+        "\\usepackage[margin=2cm]{geometry}",
+        "\\usepackage{pgfplots}",
+        "\\usepgfplotslibrary{dateplot}",
+        "\\pgfplotsset{compat=1.16}",
+        f"\\title{{Check-in report for {escape_tex(data['name'])}}}",
+        f"\\date{{{month_name}}}",
+        "\\begin{document}",
+        "\\maketitle",
+        "",
+        "\\section*{Summary}",
+        f"{data['check_ins']} check-ins on {len(data['days'])} days.",
+        "",
+        "\\begin{tabular}{lrrr}",
+        "Metric & Mean & Min & Max \\\\",
+        "\\hline",
+    ]
+    for metric in rollup_metrics:
+        mean, minimum, maximum = data["summary"][metric]
+        values = " & ".join("--" if value is None else f"{value:.2f}" for value in (mean, minimum, maximum))
+        lines.append(f"{METRIC_LABELS[metric]} & {values} \\\\")
+    lines += ["\\end{tabular}", ""]
+
+    if data["days"]:
+        lines += ["\\section*{Daily averages}"]
+        lines += _axis(month, table, ["well_being", "energy", "productivity"], "Score", (0, 10))
+        lines += [""]
+        lines += _axis(month, table, ["mood", "sentiment", "score"], "Value")
+        lines += [""]
+
+    lines += ["\\section*{Topics}"]
+    if data["topics"]:
+        lines += ["\\begin{itemize}"]
+        lines += [f"\\item {escape_tex(topic)} ({count})" for topic, count in data["topics"]]
+        lines += ["\\end{itemize}"]
+    else:
+        lines += ["No topics recorded."]
+    lines += ["", "\\section*{Incidents}"]
+    if data["incidents"]:
+        lines += ["\\begin{itemize}"]
+        lines += [f"\\item \\textbf{{{escape_tex(date[:10])}}} {escape_tex(text or '')}"
+                  for date, text in data["incidents"]]
+        lines += ["\\end{itemize}"]
+    else:
+        lines += ["No incidents reported."]
+    lines += ["", "\\end{document}", ""]
+    return "\n".join(lines)
+
+
+def _write(path, content):
+    # Written next to the target and moved into place, so an interrupted run never leaves half a report
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def compile_pdf(directory, name):
+    """
+    Compiles directory/name.tex to directory/name.pdf with pdflatex.
+
+    :raises RuntimeError: if pdflatex is not installed or the document does not compile
+    """
+    pdflatex = shutil.which("pdflatex")
+    if pdflatex is None:
+        raise RuntimeError("PDF output requires pdflatex with pgfplots, e.g. apt install texlive-pictures")
+    result = subprocess.run([pdflatex, "-interaction=nonstopmode", "-halt-on-error", f"{name}.tex"],
+                            cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=PDF_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"pdflatex failed for {name}.tex, see {name}.log")
+    for suffix in (".aux", ".log"):
+        if os.path.exists(os.path.join(directory, name + suffix)):
+            os.remove(os.path.join(directory, name + suffix))
+
+
+def generate_report(user_id, month, directory, pdf=False):
+    """
+    Writes <user_id>.dat and <user_id>.tex, and <user_id>.pdf if pdf is set, into directory.
+    """
+    data = get_report_data(user_id, month)
+    table = f"{user_id}.dat"
+    _write(os.path.join(directory, table), format_data_table(data["days"]))
+    _write(os.path.join(directory, f"{user_id}.tex"), format_report(month, data, table))
+    if pdf:
+        compile_pdf(directory, str(user_id))
+
+
+def _init_worker(db_path):
+    set_database(db_path)
+
+
+def _generate_chunk(user_ids, month, directory, pdf):
+    """
+    Runs in a worker process.
+
+    :return: list of (user_id, error message or None)
+    """
+    results = []
+    for user_id in user_ids:
+        try:
+            generate_report(user_id, month, directory, pdf=pdf)
+            results.append((user_id, None))
+        except Exception as e:
+            logging.error(f"Report of user {user_id} for {month} failed: {e!r}")
+            results.append((user_id, repr(e)))
+    return results
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _remove_report(directory, user_id):
+    for suffix in (".dat", ".tex", ".pdf"):
+        path = os.path.join(directory, f"{user_id}{suffix}")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_reports(month, output="reports", processes=None, pdf=False, force=False, chunk_size=CHUNK_SIZE):
+    """
+    Generates the monthly reports of every user whose data changed since the last run.
+
+    :param month: str, YYYY-MM
+    :param output: str, directory holding one subdirectory per month
+    :param processes: int, worker processes, defaults to the number of CPUs. 1 generates in this process.
+    :param pdf: bool, also compile every regenerated report to PDF
+    :param force: bool, regenerate every report regardless of the manifest
+    :param chunk_size: int, users per task handed to a worker process
+    :return: dict with generated, unchanged, removed and failed (numbers of reports) and seconds
+    """
+    assert isinstance(chunk_size, int) and chunk_size > 0, "Chunk size must be a positive integer."
+    month_bounds(month)  # Validates the format
+
+    started = time.perf_counter()
+    directory = os.path.join(output, month)
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+    previous = _load_manifest(manifest_path)
+    manifest = {} if force else dict(previous)
+
+    fingerprints = {str(user_id): fingerprint for user_id, fingerprint in get_report_fingerprints(month).items()}
+    changed = sorted(int(user_id) for user_id, fingerprint in fingerprints.items()
+                     if manifest.get(user_id) != fingerprint)
+
+    removed = [user_id for user_id in previous if user_id not in fingerprints]
+    for user_id in removed:
+        _remove_report(directory, user_id)
+        manifest.pop(user_id, None)
+
+    def save_manifest():
+        _write(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+
+    failed = 0
+    chunks = [changed[i:i + chunk_size] for i in range(0, len(changed), chunk_size)]
+    processes = min(processes or os.cpu_count() or 1, len(chunks)) or 1
+
+    if processes == 1:
+        results = (_generate_chunk(chunk, month, directory, pdf) for chunk in chunks)
+        executor = None
+    else:
+        # Spawned rather than forked, so the workers do not inherit this process's connections
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(db_connection.db_path,))
+        futures = [executor.submit(_generate_chunk, chunk, month, directory, pdf) for chunk in chunks]
+        results = (future.result() for future in as_completed(futures))
+
+    try:
+        for chunk_results in results:
+            for user_id, error in chunk_results:
+                if error is None:
+                    manifest[str(user_id)] = fingerprints[str(user_id)]
+                else:
+                    manifest.pop(str(user_id), None)
+                    failed += 1
+            # Saved after every chunk, so an interrupted run keeps the reports it finished
+            save_manifest()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    save_manifest()
+
+    return {
+        "generated": len(changed) - failed,
+        "unchanged": len(fingerprints) - len(changed),
+        "removed": len(removed),
+        "failed": failed,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _last_month():
+    return (datetime.date.today().replace(day=1) - datetime.timedelta(days=1)).strftime("%Y-%m")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate monthly LaTeX reports for every user.")
+    parser.add_argument("--month", default=None, help="Month to report on as YYYY-MM, defaults to last month.")
+    parser.add_argument("--output", default="reports", help="Directory holding one subdirectory per month.")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes, defaults to the CPU count.")
+    parser.add_argument("--pdf", action="store_true", help="Also compile the reports with pdflatex.")
+    parser.add_argument("--force", action="store_true", help="Regenerate every report, ignoring the manifest.")
+    parser.add_argument("--database", default=None, help="Database file, defaults to the bot's database.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.database:
+        set_database(args.database)
+    init_database()
+
+    month = args.month or _last_month()
+    summary = export_reports(month, output=args.output, processes=args.processes, pdf=args.pdf, force=args.force)
+    print(f"Reports for {month}: {summary['generated']} generated, {summary['unchanged']} unchanged, "
+          f"{summary['removed']} removed, {summary['failed']} failed in {summary['seconds']:.1f} s")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,125 +1,156 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+import io
+import datetime
 import pandas as pd
-from lib.database import get_fields, get_last_n_records_for_user, get_user_name
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from lib.database import (get_records_in_range, get_user_name, get_latest_record_id, get_daily_rollups_for_user,
+                          get_rollup_fields, get_weekly_activity, get_mood_distribution)
+from .plot_cache import plot_cache
+from .figures import render_metric_figure, is_plottable, DPI, GRID_SIZE
 from lib.utility.functions import convert_sentiment, convert_mood
+from lib.utility.metrics import timed
 import logging
 
-sns.set_style('whitegrid')
-
+# Requests spanning more days than this are drawn from the daily_rollups table (one point per day)
+# instead of the raw records.
+ROLLUP_THRESHOLD_DAYS = 90
+
+# Record columns each metric plot reads, besides date
+PLOT_COLUMNS = {
+    'all': ['mood', 'sentiment', 'well_being', 'energy', 'productivity', 'score'],
+    'mood': ['mood'],
+    'sentiment': ['sentiment'],
+    'well_being': ['well_being'],
+    'energy': ['energy'],
+    'productivity': ['productivity'],
+    'score': ['score'],
+}
+
+def _load_frame(user_id, metric, days):
+    """
+    Loads the plotted metrics of the last `days` days as a DataFrame with a datetime 'date' column
+    and numeric 'mood' and 'sentiment' columns.
+    """
+    if days > ROLLUP_THRESHOLD_DAYS:
+        df = pd.DataFrame(get_daily_rollups_for_user(user_id, days=days), columns=get_rollup_fields())
+        df = df.rename(columns={f"mean_{metric}": metric for metric in
+                                ['sentiment', 'mood', 'well_being', 'energy', 'productivity', 'score']})
+        df['date'] = pd.to_datetime(df['day'])
+        return df
+
+    # Only the window and the columns that are plotted, straight from the columns into the DataFrame
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    data, _ = get_records_in_range(user_id, start=start, columns=['date'] + PLOT_COLUMNS.get(metric, []),
+                                   as_columns=True)
+    df = pd.DataFrame(data)
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')  # Dates with and without microseconds
+    if 'mood' in df:
+        df['mood'] = convert_mood(df['mood'])
+    if 'sentiment' in df:
+        df['sentiment'] = convert_sentiment(df['sentiment'])
+    return df
+
+@timed("plot.metric_over_time")
 def plot_metric_over_time(user_id, metric, days=30):
     """
     Plots selected metrics over time for a given user.
+    Images are cached until the user's records change.
+
+    :param user_id: int
+    :param metric: str
+    :param days: int
+    :return: bytes, the plot as a PNG image, or None if there is nothing to plot
+    """
+    key = plot_cache.key(user_id, metric, days, get_latest_record_id(user_id))
+    image = plot_cache.get(key)
+    if image is None:
+        image = render_metric_over_time(user_id, metric, days)
+        if image is not None:
+            plot_cache.put(key, image)
+    return image
+
+def render_metric_over_time(user_id, metric, days=30):
+    """
+    Renders selected metrics over time for a given user, bypassing the plot cache.
 
     :param user_id: int
     :param metric: str
     :param days: int
-    :return: str, path to the saved plot image
+    :return: bytes, the plot as a PNG image, or None if there is nothing to plot
     """
     assert isinstance(user_id, int), "User ID should be an integer."
     assert isinstance(metric, str), "Metric should be a string."
 
+    if not is_plottable(metric):
+        logging.error(f"Invalid metric passed to visualizer: {metric}")
+        return None
+
     user_name = get_user_name(user_id)
 
-    # Fetch records and convert to DataFrame
-    metrics_list = ['sentiment', 'mood', 'well_being', 'energy', 'productivity', 'score']
-    
-    df = pd.DataFrame(get_last_n_records_for_user(user_id, limit=days), columns=["id"] + get_fields('records'))
-    
+    # Fetch records, or daily rollups for long ranges, as a DataFrame
+    df = _load_frame(user_id, metric, days)
+
     if df.empty:
         logging.error(f"No data available for user {user_id} and metric {metric}")
         return None
 
-    # Convert date column to datetime
-    df['date'] = pd.to_datetime(df['date'])
-
-    if metric == 'all':
-        fig, axs = plt.subplots(2, 2, figsize=(15, 10))
-        fig.suptitle(f'Metrics Over Time for {user_name}', fontsize=16)
-
-        # Plot Mood
-        sns.lineplot(x=df['date'], y=convert_mood(df['mood']), ax=axs[0, 0], marker='o', label='Mood')
-        axs[0, 0].set_title('Mood')
-        axs[0, 0].set_ylabel('Mood Score')
-        axs[0, 0].set_yticks([0.0, 0.25, 0.5, 0.75, 1.0])
-        axs[0, 0].set_yticklabels(["Very Bad", "Bad", "Neutral", "Good", "Very Good"])
-
-        # Plot Sentiment
-        sns.lineplot(x=df['date'], y=convert_sentiment(df['sentiment']), ax=axs[0, 1], marker='o', label='Sentiment')
-        axs[0, 1].set_title('Sentiment')
-        axs[0, 1].set_ylabel('Sentiment Score')
-        axs[0, 1].set_yticks([-1.0, -0.5, 0, 0.5, 1.0])
-        axs[0, 1].set_yticklabels(["Very Negative", "Negative", "Neutral", "Positive", "Very Positive"])
-
-        # Plot Well-being, Energy, and Productivity
-        axs[1, 0].plot(df['date'], df['well_being'], marker='o', label='Well-being')
-        axs[1, 0].plot(df['date'], df['energy'], marker='o', label='Energy')
-        axs[1, 0].plot(df['date'], df['productivity'], marker='o', label='Productivity')
-        axs[1, 0].set_title('Well-being, Energy, and Productivity')
-        axs[1, 0].set_ylabel('Score')
-        axs[1, 0].legend()
-
-        # Plot Weighted sum score
-        sns.lineplot(x=df['date'], y=df['score'], ax=axs[1, 1], marker='o', label='Weighted Sum Score')
-        axs[1, 1].set_title('Weighted Sum Score')
-        axs[1, 1].set_ylabel('Weighted Sum Score')
-
-        for ax in axs.flat:
-            ax.set_xlabel('Time')
-            ax.tick_params(axis='x', rotation=45)
-            ax.grid(True)
-
-        plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-        # Save the plot
-        image_name = f'plots/all_metrics_over_time.png'
-        plt.savefig(image_name)
-        plt.close()
-
-        return image_name
-
-    else:
-        plt.figure(figsize=(12, 6))
-
-        # Handle different metrics
-        if metric == 'sentiment':
-            sns.lineplot(x=df['date'], y=convert_sentiment(df[metric]), marker='o', label=metric.capitalize())
-            plt.yticks([-1.0, -0.5, 0, 0.5, 1.0], ["Very Negative", "Negative", "Neutral", "Positive", "Very Positive"])
-            y_label = f'{metric.capitalize()} Score'
-            title = f'{metric.capitalize()} Over Time for {user_name}'
-
-        elif metric == 'mood':
-            sns.lineplot(x=df['date'], y=convert_mood(df[metric]), marker='o', label=metric.capitalize())
-            plt.yticks([0.0, 0.25, 0.5, 0.75, 1.0], ["Very Bad", "Bad", "Neutral", "Good", "Very Good"])
-            y_label = f'{metric.capitalize()} Score'
-            title = f'{metric.capitalize()} Over Time for {user_name}'
-
-        elif metric in ['well_being', 'energy', 'productivity']:
-            sns.lineplot(x=df['date'], y=df[metric], marker='o', label=metric.replace("_", " ").capitalize())
-            plt.ylim((0,10))
-            y_label = f'{metric.replace("_", " ").capitalize()} Score'
-            title = f'{metric.replace("_", " ").capitalize()} Over Time for {user_name}'
-
-        elif metric == 'score':
-            sns.lineplot(x=df['date'], y=df['score'], marker='o', label='Weighted sum score')
-            plt.ylim((0,100))
-            y_label = 'Weighted sum Score'
-            title = f"Weighted sum score over time for {user_name}"
-        else:
-            logging.error(f"Invalid metric passed to visualizer: {metric}")
-            return None
-
-        # Final touches on the plot
-        plt.ylabel(y_label)
-        plt.title(title)
-        plt.xticks(rotation=45)
-        plt.xlabel('Time')
-        plt.grid(True)
-        plt.legend()
-
-        # Save the plot
-        image_name = f'plots/{metric}_over_time.png'
-        plt.savefig(image_name, bbox_inches='tight', dpi=512)
-        plt.close()
-
-        return image_name
+    # Drawn on this thread's figure template for the metric, see lib.plotting.figures
+    return render_metric_figure(metric, user_name, df)
+
+@timed("plot.server_stats")
+def render_server_stats(weeks=12, days=30):
+    """
+    Renders server-wide weekly scores, participation and check-ins, and the mood distribution.
+    The aggregates come from lib.database.db_analytics, so only a few rows are read per plot.
+
+    :param weeks: int, weeks of weekly figures
+    :param days: int, days covered by the mood distribution
+    :return: bytes, the plot as a PNG image, or None if nobody checked in during those weeks
+    """
+    weekly = pd.DataFrame(get_weekly_activity(weeks),
+                          columns=['week', 'check_ins', 'participants', 'participation_rate', 'mean_score',
+                                   'moving_average_score', 'score_change'])
+    if weekly.empty:
+        logging.error(f"No check-ins on the server in the last {weeks} weeks")
+        return None
+    weekly['week'] = pd.to_datetime(weekly['week'])
+    moods = pd.DataFrame(get_mood_distribution(days), columns=['mood', 'check_ins', 'share'])
+
+    # Bar counts change with every request, so this figure is built per call rather than from a template
+    fig = Figure(figsize=GRID_SIZE, dpi=DPI)
+    FigureCanvasAgg(fig)
+    axs = fig.subplots(2, 2)
+    fig.suptitle(f'Server Activity over the Last {weeks} Weeks', fontsize=16)
+
+    # Weekly mean score with its moving average
+    axs[0, 0].plot(weekly['week'], weekly['mean_score'], marker='o', label='Weekly mean')
+    axs[0, 0].plot(weekly['week'], weekly['moving_average_score'], linestyle='--', label='4-week average')
+    axs[0, 0].set_title('Average Weighted Sum Score')
+    axs[0, 0].set_ylabel('Score')
+    axs[0, 0].legend()
+
+    # Share of opted-in users who checked in
+    axs[0, 1].bar(weekly['week'], weekly['participation_rate'] * 100, width=5)
+    axs[0, 1].set_title('Participation Rate')
+    axs[0, 1].set_ylabel('% of opted-in users')
+    axs[0, 1].set_ylim((0, 100))
+
+    axs[1, 0].bar(weekly['week'], weekly['check_ins'], width=5)
+    axs[1, 0].set_title('Check-ins per Week')
+    axs[1, 0].set_ylabel('Check-ins')
+
+    axs[1, 1].bar(moods['mood'], moods['share'] * 100, color=[f'C{i}' for i in range(len(moods))])
+    axs[1, 1].set_title(f'Mood Distribution, Last {days} Days')
+    axs[1, 1].set_ylabel('% of check-ins')
+    axs[1, 1].set_xlabel('Mood')
+
+    for ax in (axs[0, 0], axs[0, 1], axs[1, 0]):
+        ax.set_xlabel('Week')
+        ax.tick_params(axis='x', rotation=45)
+        ax.grid(True)
+
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
@@ -0,0 +1,144 @@
+"""
+Metric plots drawn on reusable figure templates with matplotlib's object-oriented Agg API.
+
+Every thread keeps one figure per layout, with its axes, labels, ticks, limits and (empty) lines set up
+once. A request only replaces the line data, the x range and the title before the figure is saved,
+so no figure is created or laid out per plot. Nothing here touches pyplot's global state: figures are
+never shared between threads, which makes rendering safe from several threads at once.
+
+Images are sized for Discord, whose previews are at most about 550 px wide and whose full-size viewer
+rarely shows more than 1200 px, instead of the several thousand pixels of a dpi=512 print.
+"""
+import io
+import threading
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.dates as mdates
+
+DPI = 100
+SINGLE_SIZE = (12, 6)  # 1200 x 600 px
+GRID_SIZE = (12, 8)    # 1200 x 800 px
+
+MOOD_TICKS = ([0.0, 0.25, 0.5, 0.75, 1.0], ["Very Bad", "Bad", "Neutral", "Good", "Very Good"])
+SENTIMENT_TICKS = ([-1.0, -0.5, 0, 0.5, 1.0], ["Very Negative", "Negative", "Neutral", "Positive", "Very Positive"])
+
+# Per metric: title prefix, y axis label, y limits (None scales to the data), y ticks and the
+# (column, legend label) of each line
+AXES = {
+    'mood': ('Mood', 'Mood Score', (-0.05, 1.05), MOOD_TICKS, [('mood', 'Mood')]),
+    'sentiment': ('Sentiment', 'Sentiment Score', (-1.1, 1.1), SENTIMENT_TICKS, [('sentiment', 'Sentiment')]),
+    'well_being': ('Well being', 'Well being Score', (0, 10.5), None, [('well_being', 'Well being')]),
+    'energy': ('Energy', 'Energy Score', (0, 10.5), None, [('energy', 'Energy')]),
+    'productivity': ('Productivity', 'Productivity Score', (0, 10.5), None, [('productivity', 'Productivity')]),
+    'score': ('Weighted sum score', 'Weighted sum Score', None, None, [('score', 'Weighted sum score')]),
+    'scores': ('Well-being, Energy, and Productivity', 'Score', (0, 10.5), None,
+               [('well_being', 'Well-being'), ('energy', 'Energy'), ('productivity', 'Productivity')]),
+}
+
+# The four panels of the 'all' plot, row by row
+GRID = ['mood', 'sentiment', 'scores', 'score']
+
+_local = threading.local()
+
+
+class _Template:
+    """A figure with its axes and lines, reused for every plot of one layout in one thread."""
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.figure = Figure(figsize=GRID_SIZE if metric == 'all' else SINGLE_SIZE, dpi=DPI)
+        FigureCanvasAgg(self.figure)
+        self.lines = []  # (axes, line, column)
+
+        if metric == 'all':
+            axs = self.figure.subplots(2, 2)
+            for ax, panel in zip(axs.flat, GRID):
+                self._setup_axes(ax, panel, title=AXES[panel][0])
+            self.title = self.figure.suptitle('', fontsize=16)
+            self.figure.subplots_adjust(left=0.1, right=0.97, bottom=0.08, top=0.9, hspace=0.35, wspace=0.3)
+        else:
+            ax = self.figure.subplots()
+            self._setup_axes(ax, metric, title='')
+            self.title = ax.title
+            self.figure.subplots_adjust(left=0.1, right=0.97, bottom=0.1, top=0.92)
+
+    def _setup_axes(self, ax, metric, title):
+        _, y_label, y_limits, y_ticks, columns = AXES[metric]
+        for column, label in columns:
+            line, = ax.plot([], [], marker='o', markersize=4, label=label)
+            self.lines.append((ax, line, column))
+        ax.set_title(title)
+        ax.set_xlabel('Time')
+        ax.set_ylabel(y_label)
+        if y_limits is not None:
+            ax.set_ylim(y_limits)
+        if y_ticks is not None:
+            ax.set_yticks(*y_ticks)
+        ax.grid(True, color='0.9')
+        ax.set_axisbelow(True)
+        # A fixed position, 'best' would search the data for free space on every render
+        ax.legend(loc='upper left')
+        locator = mdates.AutoDateLocator(maxticks=8)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+    def render(self, title, df):
+        dates = mdates.date2num(df['date'].to_numpy())
+        start, end = dates.min(), dates.max()
+        if start == end:
+            start, end = start - 1, end + 1  # A single day still gets a visible range
+        margin = (end - start) * 0.02
+
+        for ax, line, column in self.lines:
+            line.set_data(dates, df[column].to_numpy())
+            ax.set_xlim(start - margin, end + margin)
+            if ax.get_autoscaley_on():
+                ax.relim()
+                ax.autoscale_view(scalex=False)
+        self.title.set_text(title)
+
+        buffer = io.BytesIO()
+        try:
+            self.figure.savefig(buffer, format='png')
+        finally:
+            # The template should not keep the last user's data alive
+            for _, line, _ in self.lines:
+                line.set_data([], [])
+        return buffer.getvalue()
+
+
+def _template(metric):
+    templates = getattr(_local, 'templates', None)
+    if templates is None:
+        templates = _local.templates = {}
+    template = templates.get(metric)
+    if template is None:
+        template = templates[metric] = _Template(metric)
+    return template
+
+
+def render_metric_figure(metric, user_name, df):
+    """
+    Renders one metric, or the four panels of 'all', on this thread's template for that layout.
+
+    :param metric: str, 'all' or a key of AXES other than 'scores'
+    :param user_name: str, shown in the title
+    :param df: pandas.DataFrame with a datetime 'date' column and a numeric column per plotted metric
+    :return: bytes, the plot as a PNG image
+    """
+    assert is_plottable(metric), f"Unknown metric {metric}"
+    assert not df.empty, "Nothing to plot."
+
+    if metric == 'all':
+        title = f'Metrics Over Time for {user_name}'
+    else:
+        title = f'{AXES[metric][0]} Over Time for {user_name}'
+    return _template(metric).render(title, df)
+
+
+def is_plottable(metric):
+    """
+    :param metric: str
+    :return: bool, whether render_metric_figure draws this metric
+    """
+    return metric == 'all' or (metric in AXES and metric != 'scores')
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from lib.database import add_records_listener
+
+
+class PlotCache:
+    """
+    LRU cache of rendered plot images.
+
+    Keys contain the id of the user's latest record, so new check-ins naturally miss.
+    Entries of a user are also dropped as soon as records are written for them.
+    """
+
+    def __init__(self, max_items=256):
+        """
+        :param max_items: int, number of images kept in memory
+        """
+        self.max_items = max_items
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(user_id, metric, days, latest_record_id):
+        return (user_id, metric, days, latest_record_id)
+
+    def get(self, key):
+        """
+        :return: bytes, the cached image, or None on a miss
+        """
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_items:
+                self._images.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """
+        Drops the cached images of a user, or of every user if user_id is None.
+        """
+        with self._lock:
+            if user_id is None:
+                self._images.clear()
+            else:
+                for key in [key for key in self._images if key[0] == user_id]:
+                    del self._images[key]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "items": len(self._images)}
+
+
+plot_cache = PlotCache()
+add_records_listener(plot_cache.invalidate)
@@ -0,0 +1,147 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import lib.database as db
+from lib.database import db_connection
+from .plot_cache import plot_cache
+from lib.utility.metrics import timed
+
+
+class RenderQueueFull(Exception):
+    """Raised when more plot jobs are pending than the render service accepts."""
+
+
+def _warm_worker(db_path):
+    """
+    Runs once in every worker process. The plotting stack is already imported, since workers
+    fork from the forkserver that preloaded it, so only the database is set up here.
+    """
+    db_connection.set_database(db_path)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render(user_id, metric, days):
+    from .datavisualiser import render_metric_over_time
+    return render_metric_over_time(user_id, metric, days=days)
+
+
+def _render_server_stats(weeks, days):
+    from .datavisualiser import render_server_stats
+    return render_server_stats(weeks=weeks, days=days)
+
+
+class RenderService:
+    """
+    Renders plots in a pool of warm worker processes so the event loop never waits on matplotlib,
+    and concurrent requests use several cores instead of queueing behind the GIL.
+    Rendered images are kept in the shared plot cache of this process.
+
+    Usage:
+        renderer = RenderService(workers=4)
+        renderer.start()
+        image = await renderer.plot(user_id, 'all', days=31)
+        renderer.stop()
+    """
+
+    def __init__(self, workers=None, queue_size=16, timeout=60.0):
+        """
+        :param workers: int, number of worker processes, defaults to the number of CPUs
+        :param queue_size: int, maximum number of pending plot jobs before RenderQueueFull is raised
+        :param timeout: float, seconds a caller waits for a single plot
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.pending = 0  # Jobs submitted to the pool and not finished, including those whose caller timed out
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the worker processes and waits until every worker has finished warming up.
+        This blocks, so call it before the event loop starts or off the loop.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._start()
+
+    def _start(self):
+        # Workers fork from a clean server process that already imported the plotting stack,
+        # instead of forking the bot with its threads and open connections.
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["lib.plotting.datavisualiser"])
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                       initializer=_warm_worker, initargs=(db_connection.db_path,))
+
+        pids = {future.result() for future in [executor.submit(_ping) for _ in range(self.workers)]}
+        self._executor = executor
+        logging.info(f"Render service started with {len(pids)} warm worker processes")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @timed("plot.render_service")
+    async def plot(self, user_id, metric, days=30):
+        """
+        Returns the cached plot, or renders it in a worker process.
+
+        :param user_id: int
+        :param metric: str
+        :param days: int
+        :return: bytes, the plot as a PNG image, or None if there was nothing to plot
+        :raises RenderQueueFull: if queue_size jobs are already pending
+        :raises asyncio.TimeoutError: if rendering takes longer than the timeout
+        """
+        key = plot_cache.key(user_id, metric, days, await db.aio.get_latest_record_id(user_id))
+        image = plot_cache.get(key)
+        if image is not None:
+            return image
+
+        image = await self._submit(_render, user_id, metric, days)
+        if image is not None:
+            plot_cache.put(key, image)
+        return image
+
+    @timed("plot.render_service.server_stats")
+    async def server_stats(self, weeks=12, days=30):
+        """
+        Renders the server-wide activity plot in a worker process.
+
+        :param weeks: int
+        :param days: int
+        :return: bytes, the plot as a PNG image, or None if there was nothing to plot
+        :raises RenderQueueFull: if queue_size jobs are already pending
+        :raises asyncio.TimeoutError: if rendering takes longer than the timeout
+        """
+        return await self._submit(_render_server_stats, weeks, days)
+
+    def _job_done(self, _):
+        with self._lock:
+            self.pending -= 1
+
+    async def _submit(self, function, *args):
+        if self._executor is None:
+            # Starting waits for every worker to warm up, which must not block the event loop
+            await asyncio.to_thread(self.start)
+        with self._lock:
+            if self.pending >= self.queue_size:
+                raise RenderQueueFull(f"{self.pending} plot jobs already pending")
+            self.pending += 1
+
+        try:
+            job = self._executor.submit(function, *args)
+        except BaseException:
+            self._job_done(None)
+            raise
+        # A job keeps its slot until the worker is done with it, even if the caller stopped waiting,
+        # so renders that time out cannot pile up beyond queue_size
+        job.add_done_callback(self._job_done)
+        return await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.timeout)
@@ -1,3 +1,32 @@
-from .functions import calculate_composite_score
-from .get_env_variables import *
-from .scheduler import *
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first attribute access, so importing lib.utility
+# does not pull in the scheduler or dotenv until they are used.
+_lazy_attributes = {
+    "calculate_composite_score": ".functions",
+    "get_public_key": ".get_env_variables",
+    "get_bot_token": ".get_env_variables",
+    "get_open_ai_key": ".get_env_variables",
+    "get_metrics_path": ".get_env_variables",
+    "get_job_queue_enabled": ".get_env_variables",
+    "get_write_behind_enabled": ".get_env_variables",
+    "scheduler": ".scheduler",
+    "schedule_daily_message": ".scheduler",
+    "schedule_reminders": ".scheduler",
+    "parse_reminder": ".scheduler",
+    "start_scheduler": ".scheduler",
+    "fan_out": ".fanout",
+    "RateLimiter": ".fanout",
+    "metrics": ".metrics",
+    "format_summary": ".metrics",
+}
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes))
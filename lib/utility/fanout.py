@@ -0,0 +1,141 @@
+import time
+import random
+import asyncio
+import logging
+
+# Requests per second (rate) and burst size (capacity) per Discord route.
+# Discord allows roughly 50 requests per second globally; the per-route limits keep
+# user lookups and DMs from using all of it, leaving room for command replies.
+DEFAULT_ROUTE_LIMITS = {
+    "fetch_user": (20.0, 20),
+    "send_dm": (25.0, 25),
+}
+DEFAULT_GLOBAL_LIMIT = (45.0, 45)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second, holding at most `capacity` tokens.
+    """
+
+    def __init__(self, rate, capacity):
+        assert rate > 0, "Rate must be positive."
+        assert capacity >= 1, "Capacity must be at least 1."
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    A global token bucket plus one bucket per route. A request takes a token from both.
+    """
+
+    def __init__(self, route_limits=None, global_limit=DEFAULT_GLOBAL_LIMIT):
+        """
+        :param route_limits: dict mapping route names to (rate, capacity)
+        :param global_limit: (rate, capacity) shared by every route, or None for no global limit
+        """
+        self.route_limits = dict(DEFAULT_ROUTE_LIMITS if route_limits is None else route_limits)
+        self._global = TokenBucket(*global_limit) if global_limit is not None else None
+        self._routes = {}
+
+    async def acquire(self, route):
+        if self._global is not None:
+            await self._global.acquire()
+        if route in self.route_limits:
+            if route not in self._routes:
+                self._routes[route] = TokenBucket(*self.route_limits[route])
+            await self._routes[route].acquire()
+
+
+def is_retryable(error):
+    """
+    Retries rate limits, server errors and network failures, but not e.g. users who block DMs (403).
+
+    :param error: Exception
+    :return: bool
+    """
+    status = getattr(error, "status", None)
+    if status is None:
+        return isinstance(error, (OSError, asyncio.TimeoutError))
+    return status == 429 or status >= 500
+
+
+async def _call_with_retries(call, route, limiter, retries, backoff, retryable):
+    for attempt in range(retries + 1):
+        await limiter.acquire(route)
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == retries or not retryable(e):
+                raise
+            # Honour the server's hint when the error carries one (e.g. a 429 response)
+            delay = getattr(e, "retry_after", None) or backoff * 2 ** attempt * (1 + random.random())
+            await asyncio.sleep(delay)
+
+
+async def fan_out(user_ids, get_cached_user, fetch_user, send, concurrency=16, limiter=None, retries=3,
+                  backoff=0.5, retryable=is_retryable):
+    """
+    Resolves and messages many users concurrently while staying under the rate limits.
+
+    Users are taken from the client's cache first; only cache misses cost a fetch_user request.
+    Failed requests are retried with exponential backoff, and one failing user never blocks the others.
+
+    :param user_ids: iterable of int
+    :param get_cached_user: callable(user_id) returning the cached user or None, e.g. bot.get_user
+    :param fetch_user: coroutine function(user_id) fetching the user, e.g. bot.fetch_user
+    :param send: coroutine function(user) delivering the message
+    :param concurrency: int, maximum number of users handled at once
+    :param limiter: RateLimiter, defaults to one with DEFAULT_ROUTE_LIMITS
+    :param retries: int, retries per request after the first attempt
+    :param backoff: float, base delay in seconds between retries
+    :param retryable: callable(exception) deciding whether a failed request is retried
+    :return: dict with delivered, failed, fetched (cache misses), duration (seconds) and errors (user_id -> repr)
+    """
+    assert isinstance(concurrency, int) and concurrency > 0, "Concurrency must be a positive integer."
+    limiter = limiter or RateLimiter()
+    pending = iter(user_ids)
+    summary = {"delivered": 0, "failed": 0, "fetched": 0, "duration": 0.0, "errors": {}}
+    started = time.perf_counter()
+
+    async def deliver(user_id):
+        user = get_cached_user(user_id)
+        if user is None:
+            summary["fetched"] += 1
+            user = await _call_with_retries(lambda: fetch_user(user_id), "fetch_user", limiter, retries, backoff,
+                                            retryable)
+        await _call_with_retries(lambda: send(user), "send_dm", limiter, retries, backoff, retryable)
+
+    async def worker():
+        # Workers share one iterator, so at most `concurrency` deliveries exist at any time
+        for user_id in pending:
+            try:
+                await deliver(user_id)
+            except Exception as e:
+                logging.error(f"Failed to deliver to user {user_id}: {e!r}")
+                summary["failed"] += 1
+                summary["errors"][user_id] = repr(e)
+            else:
+                summary["delivered"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary["duration"] = time.perf_counter() - started
+    return summary
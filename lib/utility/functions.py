@@ -1,10 +1,34 @@
-import numpy as np
-import pandas as pd
+import sys
 
 def normalize_score(score, min_val, max_val):
     return (score - min_val) / (max_val - min_val)
 
 
+def _is_series(value):
+    # pandas is only imported by callers that already work with DataFrames,
+    # so checking sys.modules avoids importing it just for this test.
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(value, pandas.Series)
+
+# Numerical values of the labels the LLM answers with. Unknown labels count as 0.5.
+SENTIMENT_MAPPING = {
+    "Very Negative": -1.0,
+    "Negative": -0.5,
+    "Neutral": 0,
+    "Positive": 0.5,
+    "Very Positive": 1.0
+}
+
+MOOD_MAPPING = {
+    "Very Bad": 0.0,
+    "Bad": 0.25,
+    "Neutral": 0.5,
+    "Good": 0.75,
+    "Very Good": 1.0
+}
+
+DEFAULT_LABEL_VALUE = 0.5
+
 def convert_sentiment(sentiment):
     """
     Convert the sentiment string to a numerical value.
@@ -12,19 +36,12 @@ def convert_sentiment(sentiment):
     :param sentiment: A string representing the sentiment.
     :return: A numerical value representing the sentiment.
     """
-    sentiment_mapping = {
-        "Very Negative": -1.0,
-        "Negative": -0.5,
-        "Neutral": 0,
-        "Positive": 0.5,
-        "Very Positive": 1.0
-    }
     if isinstance(sentiment, str):
-        return sentiment_mapping.get(sentiment, 0.5)
-    elif isinstance(sentiment, pd.Series):
-        return sentiment.apply(lambda x: sentiment_mapping.get(x, 0.5))
+        return SENTIMENT_MAPPING.get(sentiment, DEFAULT_LABEL_VALUE)
+    elif _is_series(sentiment):
+        return sys.modules["pandas"].Series(label_values(sentiment, SENTIMENT_MAPPING), index=sentiment.index, name=sentiment.name)
     else:
-        return 0.5
+        return DEFAULT_LABEL_VALUE
 
 def convert_mood(mood):
     """
@@ -33,23 +50,27 @@ def convert_mood(mood):
     :param mood: A string representing the mood.
     :return: A numerical value representing the mood.
     """
-    mood_mapping = {
-        "Very Bad": 0.0,
-        "Bad": 0.25,
-        "Neutral": 0.5,
-        "Good": 0.75,
-        "Very Good": 1.0
-    }
     if isinstance(mood, str):
-        return mood_mapping.get(mood, 0.5)
-    elif isinstance(mood, pd.Series):
-        return mood.apply(lambda x: mood_mapping.get(x, 0.5))
+        return MOOD_MAPPING.get(mood, DEFAULT_LABEL_VALUE)
+    elif _is_series(mood):
+        return sys.modules["pandas"].Series(label_values(mood, MOOD_MAPPING), index=mood.index, name=mood.name)
     else:
-        return 0.5
+        return DEFAULT_LABEL_VALUE
+
+# Weights used for the score column, unless a database stores its own (see lib.database.set_score_weights).
+# After changing them, run python -m lib.database.db_scoring to recompute the scores of existing records.
+DEFAULT_WEIGHTS = {
+    "sentiment": 1.0,
+    "mood": 1.0,
+    "well_being": 1.0,
+    "energy": 1.0,
+    "productivity": 1.0
+}
 
 def calculate_composite_score(metrics, weights=None):
     """
     Calculate a composite score based on the given metrics.
+    The metrics dictionary is left unchanged.
     
     :param metrics: A dictionary containing the metrics.
     :param weights: A dictionary containing the weights for each metric.
@@ -60,32 +81,74 @@ def calculate_composite_score(metrics, weights=None):
     
     # Default weights if none provided
     if weights is None:
-        weights = {
-            "sentiment": 1.0,
-            "mood": 1.0,
-            "well_being": 1.0,
-            "energy": 1.0,
-            "productivity": 1.0
-        }
+        weights = DEFAULT_WEIGHTS
     
     # Normalize well-being, energy, and productivity (0-1 scale)
-    metrics['well_being'] = normalize_score(metrics['well_being'], 1, 10)
-    metrics['energy'] = normalize_score(metrics['energy'], 1, 10)
-    metrics['productivity'] = normalize_score(metrics['productivity'], 1, 10)
-    metrics['mood'] = convert_mood(metrics['mood'])
-    metrics['sentiment'] = convert_sentiment(metrics['sentiment'])
+    well_being = normalize_score(metrics['well_being'], 1, 10)
+    energy = normalize_score(metrics['energy'], 1, 10)
+    productivity = normalize_score(metrics['productivity'], 1, 10)
+    mood = convert_mood(metrics['mood'])
+    sentiment = convert_sentiment(metrics['sentiment'])
 
     # Calculate the composite score
     composite_score = (
-        metrics['sentiment'] * weights['sentiment'] +
-        metrics['mood'] * weights['mood'] +
-        metrics['well_being'] * weights['well_being'] +
-        metrics['energy'] * weights['energy'] +
-        metrics['productivity'] * weights['productivity']
+        sentiment * weights['sentiment'] +
+        mood * weights['mood'] +
+        well_being * weights['well_being'] +
+        energy * weights['energy'] +
+        productivity * weights['productivity']
     )
     
     # Normalize the composite score to be between 0 and 1
     max_possible_score = sum(weights.values())
     composite_score_normalized = composite_score / max_possible_score
     
-    return composite_score_normalized
\ No newline at end of file
+    return composite_score_normalized
+
+def label_values(labels, mapping):
+    """
+    Vectorized lookup of label values, e.g. a whole column of moods at once.
+    Labels are converted to category codes once and used as indices into a lookup table,
+    instead of calling a Python function per label.
+
+    :param labels: An array-like of labels.
+    :param mapping: SENTIMENT_MAPPING or MOOD_MAPPING.
+    :return: A numpy array of floats, DEFAULT_LABEL_VALUE for unknown labels.
+    """
+    import numpy as np
+    import pandas as pd
+
+    # Unknown labels get code -1, which indexes the default value appended at the end
+    table = np.array(list(mapping.values()) + [DEFAULT_LABEL_VALUE], dtype=float)
+    codes = pd.Index(list(mapping)).get_indexer(np.asarray(labels, dtype=object))
+    return table[codes]
+
+def calculate_composite_scores(metrics, weights=None):
+    """
+    Vectorized calculate_composite_score for many check-ins at once.
+
+    :param metrics: A DataFrame or a dictionary of array-likes with the columns sentiment, mood,
+                    well_being, energy and productivity.
+    :param weights: A dictionary containing the weights for each metric.
+    :return: A numpy array with one composite score per row.
+    """
+    import numpy as np
+
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+
+    well_being = normalize_score(np.asarray(metrics['well_being'], dtype=float), 1, 10)
+    energy = normalize_score(np.asarray(metrics['energy'], dtype=float), 1, 10)
+    productivity = normalize_score(np.asarray(metrics['productivity'], dtype=float), 1, 10)
+    mood = label_values(metrics['mood'], MOOD_MAPPING)
+    sentiment = label_values(metrics['sentiment'], SENTIMENT_MAPPING)
+
+    composite_score = (
+        sentiment * weights['sentiment'] +
+        mood * weights['mood'] +
+        well_being * weights['well_being'] +
+        energy * weights['energy'] +
+        productivity * weights['productivity']
+    )
+
+    return composite_score / sum(weights.values())
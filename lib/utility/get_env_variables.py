@@ -10,4 +10,15 @@ def get_bot_token():
     return os.getenv("DISCORD_BOT_TOKEN")
 
 def get_open_ai_key():
-    return os.getenv("OPEN_AI_API_KEY")
\ No newline at end of file
+    return os.getenv("OPEN_AI_API_KEY")
+
+def get_metrics_path():
+    return os.getenv("METRICS_PATH")
+
+def get_job_queue_enabled():
+    # Set JOB_QUEUE=1 to hand analyses and plots to lib.jobs workers instead of running them in the bot
+    return os.getenv("JOB_QUEUE", "").lower() in ("1", "true", "yes")
+
+def get_write_behind_enabled():
+    # Set WRITE_BEHIND=1 to batch record inserts, see lib.database.db_writer for what a crash can lose
+    return os.getenv("WRITE_BEHIND", "").lower() in ("1", "true", "yes")
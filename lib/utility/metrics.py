@@ -0,0 +1,269 @@
+"""
+In-process latency and throughput metrics.
+
+Every timed operation feeds a histogram with fixed buckets, so recording a sample is a bisect and
+a few integer additions under a lock, and p50/p95/p99 are estimated from the bucket counts.
+Gauges are callables read only when metrics are reported, e.g. queue depths.
+
+Usage:
+    from lib.utility.metrics import metrics, timed
+
+    @timed("llm.analyse_message")
+    def analyse(...): ...
+
+    with metrics.timer("db.add_user"):
+        ...
+
+    metrics.gauge("analysis_queue_depth", lambda: service.queue_depth)
+    print(metrics.to_prometheus())
+"""
+import os
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+
+# Flag set on the code of "async def" functions, checked directly because importing inspect
+# would add tens of milliseconds to the import of every instrumented module
+CO_COROUTINE = 0x80
+
+# Upper bounds in seconds, from 0.1 ms to a minute, roughly 2.5x apart
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Count, error count, sum and bucketed distribution of the durations of one operation.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket holds samples above the largest bound
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+            if error:
+                self.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.errors = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+    def percentile(self, q):
+        """
+        Estimates a percentile by interpolating linearly inside the bucket that contains it.
+
+        :param q: float between 0 and 1
+        :return: float, seconds, or 0.0 without samples
+        """
+        with self._lock:
+            counts, count, largest = list(self.counts), self.count, self.max
+        if count == 0:
+            return 0.0
+
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else largest
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, largest)
+            seen += bucket_count
+        return largest
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Registry of operation histograms and gauges.
+    """
+
+    def __init__(self, prefix="checkin"):
+        """
+        :param prefix: str, prefix of the Prometheus metric names
+        """
+        self.prefix = prefix
+        self.started = time.time()
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds, error=False):
+        self.histogram(name).observe(seconds, error)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Times the enclosed block. Exceptions are counted as errors and re-raised.
+        """
+        histogram = self.histogram(name)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            histogram.observe(time.perf_counter() - started, error=True)
+            raise
+        histogram.observe(time.perf_counter() - started)
+
+    def gauge(self, name, callback):
+        """
+        Registers a value read whenever metrics are reported.
+
+        :param name: str
+        :param callback: callable returning a number
+        """
+        self._gauges[name] = callback
+
+    def gauges(self):
+        values = {}
+        for name, callback in list(self._gauges.items()):
+            try:
+                values[name] = callback()
+            except Exception:
+                values[name] = float("nan")
+        return values
+
+    def summary(self):
+        """
+        :return: dict mapping operation names to their summary (count, errors, mean, p50, p95, p99, max)
+        """
+        return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        # Histograms are cleared in place, since timed() holds on to them
+        for histogram in list(self._histograms.values()):
+            histogram.reset()
+        self.started = time.time()
+
+    def to_prometheus(self):
+        """
+        Renders every histogram and gauge in the Prometheus text exposition format.
+
+        :return: str
+        """
+        name = f"{self.prefix}_operation_duration_seconds"
+        lines = [f"# HELP {name} Duration of bot commands, database calls, LLM calls and plot rendering.",
+                 f"# TYPE {name} histogram"]
+        errors = []
+        for operation, histogram in sorted(self._histograms.items()):
+            with histogram._lock:
+                counts, count, total, failed = list(histogram.counts), histogram.count, histogram.sum, histogram.errors
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{operation="{operation}"}} {total}')
+            lines.append(f'{name}_count{{operation="{operation}"}} {count}')
+            errors.append(f'{self.prefix}_operation_errors_total{{operation="{operation}"}} {failed}')
+
+        lines += [f"# HELP {self.prefix}_operation_errors_total Operations that raised an exception.",
+                  f"# TYPE {self.prefix}_operation_errors_total counter"] + errors
+        for gauge, value in sorted(self.gauges().items()):
+            lines += [f"# TYPE {self.prefix}_{gauge} gauge", f"{self.prefix}_{gauge} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes to_prometheus() to a file atomically, e.g. for the node_exporter textfile collector.
+
+        :param path: str
+        """
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+
+metrics = Metrics()
+
+
+def timed(name, registry=None):
+    """
+    Decorator recording the duration of every call of a function or coroutine function.
+
+    :param name: str, operation name
+    :param registry: Metrics, defaults to the module-level metrics
+    """
+    def decorator(function):
+        histogram = (registry or metrics).histogram(name)
+
+        if getattr(function, "__code__", None) is not None and function.__code__.co_flags & CO_COROUTINE:
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await function(*args, **kwargs)
+                except BaseException:
+                    histogram.observe(time.perf_counter() - started, error=True)
+                    raise
+                histogram.observe(time.perf_counter() - started)
+                return result
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                histogram.observe(time.perf_counter() - started, error=True)
+                raise
+            histogram.observe(time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorator
+
+
+def format_summary(registry=None, limit=25):
+    """
+    Formats the slowest operations and the gauges as a fixed-width table, e.g. for a chat message.
+
+    :param registry: Metrics, defaults to the module-level metrics
+    :param limit: int, maximum number of operations listed
+    :return: str
+    """
+    registry = registry or metrics
+    summary = sorted(registry.summary().items(), key=lambda item: item[1]["p95"], reverse=True)[:limit]
+
+    lines = [f"{'operation':<32}{'count':>8}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"]
+    for operation, stats in summary:
+        lines.append(f"{operation[:31]:<32}{stats['count']:>8}{stats['errors']:>5}"
+                     f"{stats['p50'] * 1000:>9.1f}{stats['p95'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}")
+    for gauge, value in sorted(registry.gauges().items()):
+        lines.append(f"{gauge}: {value}")
+    lines.append(f"uptime: {time.time() - registry.started:.0f} s")
+    return "\n".join(lines)
@@ -1,13 +1,101 @@
+import random
+import asyncio
+import logging
+import datetime
+from collections import defaultdict
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import pytz
 
 scheduler = AsyncIOScheduler()
 
+# Reminder sends waiting for their offset, referenced so they are not garbage collected
+_reminder_tasks = set()
+
 def schedule_daily_message(hour, minute, timezone_str, function):
     print(f"Scheduling daily message at {hour}:{minute} in timezone {timezone_str}")
     timezone = pytz.timezone(timezone_str)
-    scheduler.add_job(function), CronTrigger(hour=hour, minute=minute, timezone=timezone)
+    scheduler.add_job(function, CronTrigger(hour=hour, minute=minute, timezone=timezone))
+
+def parse_reminder(time_text, timezone_name):
+    """
+    Validates a reminder time and timezone given by a user.
+
+    :param time_text: str, H:MM or HH:MM
+    :param timezone_name: str, IANA name such as Europe/Oslo
+    :return: tuple (str HH:MM, str timezone name)
+    :raises ValueError: if the time or the timezone is invalid
+    """
+    remind_time = datetime.datetime.strptime(time_text, "%H:%M").strftime("%H:%M")
+    try:
+        ZoneInfo(timezone_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {timezone_name}")
+    return remind_time, timezone_name
+
+def reminder_offset(user_id, jitter):
+    """
+    Whole seconds after the start of its minute at which a user's reminder is sent.
+    Offsets are spread uniformly over [0, jitter) and stay the same from day to day.
+
+    :param user_id: int
+    :param jitter: float, seconds
+    :return: int
+    """
+    return int(random.Random(user_id).random() * jitter) if jitter > 0 else 0
+
+async def _send_after(delay, send, user_ids):
+    await asyncio.sleep(delay)
+    try:
+        await send(user_ids)
+    except Exception as e:
+        logging.error(f"Sending {len(user_ids)} reminders failed: {e!r}")
+
+def dispatch_reminders(user_ids, send, jitter):
+    """
+    Splits the users of one minute bucket by reminder_offset and starts one delayed send per offset.
+    Returns without waiting for the sends. Must be called from the event loop.
+
+    :param user_ids: list of int
+    :param send: async callable taking a list of user ids
+    :param jitter: float, seconds over which the sends are spread
+    :return: list of asyncio.Task, one per group
+    """
+    groups = defaultdict(list)
+    for user_id in user_ids:
+        groups[reminder_offset(user_id, jitter)].append(user_id)
+
+    tasks = []
+    for offset, group in sorted(groups.items()):
+        task = asyncio.create_task(_send_after(offset, send, group))
+        _reminder_tasks.add(task)
+        task.add_done_callback(_reminder_tasks.discard)
+        tasks.append(task)
+    return tasks
+
+async def _remind_due_users(get_due_users, send, jitter):
+    minute = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+    user_ids = await get_due_users(minute)
+    if user_ids:
+        logging.info(f"{len(user_ids)} reminders due at {minute:%H:%M} UTC, spread over {jitter:.0f} s")
+        dispatch_reminders(user_ids, send, jitter)
+
+def schedule_reminders(get_due_users, send, jitter=60.0):
+    """
+    Sends every user their daily reminder at their own local time.
+
+    Once a minute, get_due_users is awaited for the users whose reminder falls in that minute. That
+    bucket is split into groups sent up to jitter seconds later (see reminder_offset), so a popular
+    reminder time, and the replies it prompts, is spread out instead of arriving all at once.
+
+    :param get_due_users: async callable taking the minute as an aware UTC datetime, returning a list of user ids
+    :param send: async callable taking a list of user ids
+    :param jitter: float, seconds over which each minute's reminders are spread
+    """
+    assert jitter >= 0, "Jitter must not be negative."
+    scheduler.add_job(_remind_due_users, CronTrigger(second=0, timezone=pytz.utc), args=(get_due_users, send, jitter),
+                      id="reminders", replace_existing=True, coalesce=True, misfire_grace_time=30)
 
 def start_scheduler():
     scheduler.start()
@@ -1,43 +1,108 @@
+import io
+import time
+import asyncio
 import discord
 from discord.ext import commands
 import logging
-from lib.utility import schedule_daily_message, start_scheduler, get_bot_token, get_public_key
+from lib.utility import (schedule_reminders, parse_reminder, start_scheduler, get_bot_token,
+                         get_metrics_path, get_job_queue_enabled, get_write_behind_enabled, fan_out, RateLimiter,
+                         metrics, format_summary)
 import lib.database as db
-from lib.LLM import analyse_message_with_LLM
-from lib.plotting import plot_metric_over_time
+import lib.jobs.aio as jobs
+from lib.LLM import AnalysisService, HedgedCheckIn, analysis_cache, analyse_message_locally
+from lib.plotting import RenderService
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Provisional check-ins still waiting for their LLM analysis at shutdown get this many seconds to be upgraded
+SHUTDOWN_DRAIN_TIMEOUT = 10.0
 
-# Load Discord bot credentials
-DISCORD_BOT_TOKEN = get_bot_token()
-DISCORD_PUBLIC_KEY = get_public_key()
+# Check-ins are stored within CHECK_IN_BUDGET seconds: if the LLM is slower, an offline analysis is stored
+# as provisional and replaced by the LLM result when it arrives
+CHECK_IN_BUDGET = 3.0
 
-# Initialize the bot
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+# With JOB_QUEUE=1, LLM analyses and plots are queued in the database and run by `python -m lib.jobs.worker`
+# processes on the same host instead. Queued jobs survive restarts of the bot.
+USE_JOB_QUEUE = get_job_queue_enabled()
+PLOT_JOB_TIMEOUT = 60.0
+
+# Users are reminded daily at their own local time (!user remind), by default at DEFAULT_REMIND_TIME in
+# DEFAULT_TIMEZONE. Reminders due in the same minute are spread over REMINDER_JITTER seconds, so the
+# check-ins they prompt do not all reach the LLM and the database at once.
+DEFAULT_REMIND_TIME = "22:00"
+DEFAULT_TIMEZONE = "Europe/Oslo"
+REMINDER_JITTER = 120.0
+
+# With WRITE_BEHIND=1, check-ins arriving in a burst are inserted in batches instead of committed one by one.
+# Confirmed check-ins are then only durable after the next flush: a crash loses up to WRITE_BEHIND_DELAY seconds
+# of them, so it is off by default.
+USE_WRITE_BEHIND = get_write_behind_enabled()
+WRITE_BEHIND_DELAY = 0.5
+
+# Written every METRICS_EXPORT_INTERVAL seconds if METRICS_PATH is set, e.g. for the node_exporter textfile collector
+METRICS_PATH = get_metrics_path()
+METRICS_EXPORT_INTERVAL = 15
+
+# Created by main(). Plot worker processes import this module as well, so importing it must not build
+# the bot, start services or schedule reminders. With the job queue, analyses and plots run in lib.jobs
+# workers, and the in-process analysis_service, check_ins and renderer stay None.
+bot = None
+analysis_service = None
+check_ins = None
+renderer = None
+reminder_limiter = None
+metrics_task = None
+
+
+class CheckInBot(commands.Bot):
+
+    # Event: Bot is ready
+    async def on_ready(self):
+        global metrics_task
+        start_scheduler()
+        if analysis_service is not None:
+            await analysis_service.start()
+        if METRICS_PATH and metrics_task is None:
+            metrics_task = asyncio.create_task(export_metrics())
+        logging.info(f'Logged in as {self.user.name}')
+
+    # Global error handler
+    async def on_command_error(self, ctx, error):
+        logging.error(f"An error occurred: {error}")
+        await ctx.send("An error occurred while processing your request. Please try again.")
+
+    async def close(self):
+        # Upgrades cut off by the timeout leave their records provisional, for the backfill to re-analyse
+        if check_ins is not None:
+            await check_ins.drain(SHUTDOWN_DRAIN_TIMEOUT)
+            await analysis_service.stop()
+        await super().close()
 
 
 # Basic Command: Ping
-@bot.command(name="ping")
+@commands.command(name="ping")
 async def ping_channel(ctx):
     await ctx.send('Pong!')
 
-# Event: Bot is ready
-@bot.event
-async def on_ready():
-    start_scheduler()
-    logging.info(f'Logged in as {bot.user.name}')
+# Every command is timed once, as command.<qualified name>. Discord runs the hooks for a group and again for
+# its subcommand, so the timer keeps its first start and the group itself is only recorded if it failed.
+async def start_command_timer(ctx):
+    if getattr(ctx, "started", None) is None:
+        ctx.started = time.perf_counter()
 
-# Global error handler
-@bot.event
-async def on_command_error(ctx, error):
-    logging.error(f"An error occurred: {error}")
-    await ctx.send("An error occurred while processing your request. Please try again.")
+async def record_command_time(ctx):
+    if ctx.invoked_subcommand is not None and ctx.command is not ctx.invoked_subcommand and not ctx.command_failed:
+        return
+    metrics.observe(f"command.{ctx.command.qualified_name}", time.perf_counter() - ctx.started, error=ctx.command_failed)
+
+async def export_metrics():
+    while True:
+        await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+        try:
+            await asyncio.to_thread(metrics.write_prometheus, METRICS_PATH)
+        except OSError as e:
+            logging.error(f"Could not write metrics to {METRICS_PATH}: {e!r}")
 
 # Command Group: User-related commands
-@bot.group()
+@commands.group()
 async def user(ctx):
     if ctx.invoked_subcommand is None:
         await ctx.send('Invalid user command passed.')
@@ -48,25 +113,49 @@ async def optin_user(ctx):
     user_name = ctx.author.name
     logging.info(f"Opting in user {user_name} with ID {user_id}")
 
-    if db.add_user(user_id, user_name):
+    if await db.aio.add_user(user_id, user_name):
         await ctx.send("Opted in successfully!")
     else:
         await ctx.send("User already opted in!")
 
 # To actually opt in the command is: !
 
+@user.command(name="remind")
+async def set_reminder_time(ctx, time=None, timezone=None):
+    user_id = ctx.author.id
+    reminder = await db.aio.get_reminder(user_id)
+    if reminder is None:
+        await ctx.send("Please opt in first with `!user optin`.")
+        return
+
+    current_time, current_timezone = reminder
+    if time is None:
+        await ctx.send(f"Your daily reminder is at {current_time or DEFAULT_REMIND_TIME} "
+                       f"({current_timezone or DEFAULT_TIMEZONE}).")
+        return
+
+    try:
+        remind_time, timezone = parse_reminder(time, timezone or current_timezone or DEFAULT_TIMEZONE)
+    except ValueError:
+        await ctx.send("Please give a time as HH:MM and optionally a timezone, e.g. `!user remind 21:30 Europe/Oslo`.")
+        return
+
+    await db.aio.set_reminder(user_id, remind_time, timezone)
+    logging.info(f"Set reminder of user with ID {user_id} to {remind_time} {timezone}")
+    await ctx.send(f"I will remind you daily at {remind_time} ({timezone}).")
+
 @user.command(name="optout")
 async def optout_user(ctx):
     user_id = ctx.author.id
     logging.info(f"Opting out user with ID {user_id}")
 
-    if db.remove_user(user_id):
+    if await db.aio.remove_user(user_id):
         await ctx.send("Opted out successfully!")
     else:
         await ctx.send("User not found!")
 
 # Command: Analyze and store user response
-@bot.command(name="mydaywas")
+@commands.command(name="mydaywas")
 async def analyse_and_store_response(ctx, *args):
     message = " ".join(args)
 
@@ -75,48 +164,160 @@ async def analyse_and_store_response(ctx, *args):
         return
 
     await ctx.send("Thank you for sharing your feelings today!")
-    analysis = analyse_message_with_LLM(message)
-    db.add_data_to_records(ctx.author.id, analysis, message)
-    logging.info(f"Stored analysis for user {ctx.author.name} with ID {ctx.author.id}")
+    if USE_JOB_QUEUE:
+        # Stored right away with the offline analysis, which a worker replaces with the LLM analysis
+        record_id = await db.aio.add_data_to_records(ctx.author.id, analyse_message_locally(message), message,
+                                                     provisional=True)
+        await jobs.enqueue("analyse", {"record_id": record_id, "message": message})
+        provisional = True
+    else:
+        _, provisional = await check_ins.store(ctx.author.id, message)
+    logging.info(f"Stored {'provisional ' if provisional else ''}analysis for user {ctx.author.name} with ID {ctx.author.id}")
 
 # Command: Get user's data for the last 7 days and display it in a chart
 
-@bot.command(name="mymonth")
-async def plot_last_week(ctx, metric='all', days=31):
+@commands.command(name="mymonth")
+async def plot_last_week(ctx, metric='all', days: int = 31):
     user_id = ctx.author.id
-    plot_path = plot_metric_over_time(user_id, metric, days=days)  # Call your plotting function
+    if USE_JOB_QUEUE:
+        job_id = await jobs.enqueue("plot", {"user_id": user_id, "metric": metric, "days": days}, max_attempts=2)
+        image = await jobs.wait_for_job(job_id, timeout=PLOT_JOB_TIMEOUT)
+    else:
+        image = await renderer.plot(user_id, metric, days=days)  # Rendered in a worker process, or served from cache
 
-    assert plot_path is not None
+    assert image is not None
 
     logging.info(f"Plotted data for user {ctx.author.name} with ID {user_id}")
-    if plot_path:
-        with open(plot_path, 'rb') as f:
-            file = discord.File(f, filename=plot_path.split('/')[-1])  # Send the image with its filename
-            await ctx.send(file=file)
+    if image:
+        file = discord.File(io.BytesIO(image), filename=f'{metric}_over_time.png')
+        await ctx.send(file=file)
     else:
         await ctx.send("No data available for the last 7 days.")
 
-@bot.command(name="incident")
+# Command: Server-wide weekly scores, participation and mood distribution
+@commands.command(name="serverstats")
+async def show_server_stats(ctx, weeks: int = 12):
+    weeks = max(1, min(weeks, 104))
+    if USE_JOB_QUEUE:
+        job_id = await jobs.enqueue("serverstats", {"weeks": weeks, "days": 30}, max_attempts=2)
+        image = await jobs.wait_for_job(job_id, timeout=PLOT_JOB_TIMEOUT)
+    else:
+        image = await renderer.server_stats(weeks, days=30)
+
+    if not image:
+        await ctx.send(f"Nobody checked in during the last {weeks} weeks.")
+        return
+    summary = await db.aio.get_server_summary(days=30)
+    score = f"{summary['mean_score']:.1f}" if summary['mean_score'] is not None else "n/a"
+    await ctx.send(f"Last 30 days: {summary['active_users']} of {summary['users']} users checked in "
+                   f"({summary['participation_rate']:.0%}), {summary['check_ins']} check-ins, average score {score}.",
+                   file=discord.File(io.BytesIO(image), filename='server_stats.png'))
+
+# Command: Search the user's own check-ins, best match first
+@commands.command(name="search")
+async def search_check_ins(ctx, *args):
+    text = " ".join(args)
+    if not text.strip():
+        await ctx.send("Please tell me what to search for, e.g. `!search exam`.")
+        return
+
+    results = await db.aio.search_records(ctx.author.id, text, limit=5)
+    if not results:
+        await ctx.send(f"None of your check-ins mention \"{text}\".")
+        return
+    lines = [f"`{date[:10]}` {snippet}" for _, date, snippet, _ in results]
+    await ctx.send("\n".join(lines)[:1900])
+
+# Command: The user's most frequent topics, or how often one topic came up
+@commands.command(name="topics")
+async def show_topics(ctx, *args):
+    topic = " ".join(args)
+    if topic.strip():
+        count = await db.aio.get_topic_count(ctx.author.id, topic)
+        await ctx.send(f"\"{topic}\" came up in {count} of your check-ins.")
+        return
+
+    counts = await db.aio.get_topic_counts(ctx.author.id, limit=10)
+    if not counts:
+        await ctx.send("No topics recorded yet.")
+        return
+    await ctx.send("Your most frequent topics:\n" + "\n".join(f"{name}: {count}" for name, count in counts))
+
+# Command: Latency percentiles and queue depths, for the bot owner only
+@commands.command(name="stats")
+@commands.is_owner()
+async def show_stats(ctx):
+    await ctx.send(f"```\n{format_summary(limit=20)[:1900]}\n```")
+
+@commands.command(name="incident")
 async def add_incident(ctx, *args):
     incident = " ".join(args)
-    db.add_incident(ctx.author.id, incident)
+    await db.aio.add_incident(ctx.author.id, incident)
     await ctx.send("Incident added successfully!")
 
-# Function: Send reminder to all users
-async def send_reminder_to_all_users():
-    users = db.get_users()
-    for user in users:
-        discord_user = await bot.fetch_user(user[0])
-        if discord_user:
-            try:
-                await discord_user.send("Hello! How are you feeling today?")
-                logging.info(f"Sent reminder to user with ID {user[0]}")
-            except Exception as e:
-                logging.error(f"Failed to send reminder to user {user[0]}: {e}")
+# Function: Send reminders to a group of users whose reminder is due
+async def send_reminders(user_ids):
+    summary = await fan_out(user_ids,
+                            bot.get_user,
+                            bot.fetch_user,
+                            lambda discord_user: discord_user.send("Hello! How are you feeling today?"),
+                            concurrency=16,
+                            limiter=reminder_limiter)
+    metrics.observe("reminder.fan_out", summary['duration'], error=summary['failed'] > 0)
+    logging.info(f"Sent reminders: {summary['delivered']} delivered, {summary['failed']} failed, "
+                 f"{summary['fetched']} users fetched, in {summary['duration']:.1f} s")
+
+async def get_users_due_for_reminder(minute):
+    return await db.aio.get_users_due_for_reminder(minute, DEFAULT_REMIND_TIME, DEFAULT_TIMEZONE)
+
+COMMANDS = [ping_channel, user, analyse_and_store_response, plot_last_week, show_server_stats, search_check_ins,
+            show_topics, show_stats, add_incident]
+
+
+def main():
+    global bot, analysis_service, check_ins, renderer, reminder_limiter
+
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    # Initialize the bot
+    intents = discord.Intents.default()
+    intents.message_content = True
+    bot = CheckInBot(command_prefix='!', intents=intents)
+    for command in COMMANDS:
+        bot.add_command(command)
+    bot.before_invoke(start_command_timer)
+    bot.after_invoke(record_command_time)
+
+    if not USE_JOB_QUEUE:
+        # LLM analyses run concurrently in the background instead of blocking the event loop
+        analysis_service = AnalysisService(concurrency=8, queue_size=64, timeout=30.0, cache=analysis_cache)
+        check_ins = HedgedCheckIn(analysis_service, budget=CHECK_IN_BUDGET)
+        metrics.gauge("analysis_queue_depth", lambda: analysis_service.queue_depth)
+
+        # Plots are rendered in worker processes so they neither block the event loop nor each other
+        renderer = RenderService(queue_size=16, timeout=60.0)
+        metrics.gauge("render_queue_depth", lambda: renderer.pending)
+
+    # Shared by every reminder group, so groups sent at overlapping times stay under the same Discord rate limits
+    reminder_limiter = RateLimiter()
+
+    metrics.gauge("write_buffer_pending", lambda: db.db_connection._write_buffer.pending()
+                  if db.db_connection._write_buffer is not None else 0)
+
+    # Checks every minute for users whose reminder is due in their timezone
+    schedule_reminders(get_users_due_for_reminder, send_reminders, jitter=REMINDER_JITTER)
 
-# Schedule the daily reminder at a specific time (e.g., 8:18 PM UTC)
-schedule_daily_message(22, 0, 'Europe/Oslo', send_reminder_to_all_users)
+    db.init_database()
+    if USE_WRITE_BEHIND:
+        db.enable_write_behind(max_rows=500, max_delay=WRITE_BEHIND_DELAY)
+    if renderer is not None:
+        renderer.start()
+    bot.run(get_bot_token())
+    if renderer is not None:
+        renderer.stop()
+    db.disable_write_behind()
 
 
-# Start the bot
-bot.run(DISCORD_BOT_TOKEN)
+if __name__ == "__main__":
+    main()
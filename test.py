@@ -1,6 +1,8 @@
 import lib.database as db
 from lib.plotting import plot_metric_over_time
 
+db.init_database()
+
 message = "I had a great day at work today. I'm feeling a bit tired but happy that I completed my project."
 
 # Analyse the message
@@ -0,0 +1,81 @@
+import os
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from lib.database import init_database, set_database, close_connections, transaction
+from lib.LLM.analysis_cache import AnalysisCache, normalize_message
+
+ANALYSIS = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+            'well_being': 8, 'energy': 6, 'productivity': 9}
+
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_analysis_cache.db'
+        set_database(self.db_name)
+        init_database()
+        self.calls = []
+
+        self.cache = AnalysisCache('model', '1', max_items=2)
+
+        @self.cache.cached
+        def analyse(message):
+            self.calls.append(message)
+            return dict(ANALYSIS)
+
+        self.analyse = analyse
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_normalize_message(self):
+        self.assertEqual(normalize_message("  Great   day, at WORK! "), "great day, at work")
+        self.assertEqual(normalize_message("Great day at work..."), "great day at work")
+
+    def test_emoticons_get_their_own_keys(self):
+        keys = [self.cache.key(message) for message in ("good :)", "good :(", "good", "not bad?", "not bad!")]
+        self.assertEqual(len(set(keys)), 5)
+        self.assertEqual(self.cache.key("Not bad"), keys[-1])
+
+    def test_memory_and_disk_hits(self):
+        self.assertEqual(self.analyse("Great day at work!"), ANALYSIS)
+        self.assertEqual(self.analyse("great day at work"), ANALYSIS)
+        self.cache.clear_memory()
+        self.assertEqual(self.analyse("Great day at work."), ANALYSIS)
+
+        self.assertEqual(self.calls, ["Great day at work!"])
+        stats = self.cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['disk_hits'], stats['misses']), (1, 1, 1))
+
+    def test_key_depends_on_prompt_version(self):
+        other = AnalysisCache('model', '2')
+        self.assertNotEqual(self.cache.key("Same message"), other.key("Same message"))
+
+    def test_returned_results_are_copies(self):
+        self.analyse("Copy me")["key_topics"].append("mutated")
+        self.assertEqual(self.analyse("Copy me")["key_topics"], ["work"])
+
+    def test_expired_entries_are_ignored(self):
+        self.analyse("Old message")
+        self.cache.ttl = -1
+        self.analyse("Old message")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_disk_hits_keep_their_age(self):
+        self.analyse("Aging message")
+        with transaction() as cursor:
+            cursor.execute("UPDATE analysis_cache SET created_at = created_at - 100")
+        self.cache.clear_memory()
+        self.cache.ttl = 150
+        self.analyse("Aging message")  # Promoted from disk to memory, 100 seconds old
+        self.cache.ttl = 50
+        self.analyse("Aging message")
+        self.assertEqual(len(self.calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from lib.LLM.analysis_service import AnalysisService
+
+REPLY = """Sentiment: Positive
+Mood: Good
+Key Topics: work, project
+Well-being: 8
+Energy: 6
+Productivity: 9"""
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible chat completions endpoint.
+    Sleeps `delay` seconds per request to simulate model latency.
+    """
+    delay = 0.2
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        time.sleep(self.delay)
+
+        body = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": REPLY},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAnalysisService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def run_service(self, scenario, **kwargs):
+        async def wrapper():
+            service = AnalysisService(base_url=self.base_url, api_key="test-key", **kwargs)
+            await service.start()
+            try:
+                return await scenario(service)
+            finally:
+                await service.stop()
+        return asyncio.run(wrapper())
+
+    def test_analyse_parses_reply(self):
+        result = self.run_service(lambda service: service.analyse("I had a great day at work today."))
+        self.assertEqual(result["sentiment"], "Positive")
+        self.assertEqual(result["key_topics"], ["work", "project"])
+        self.assertEqual(result["productivity"], 9)
+
+    def test_requests_run_concurrently(self):
+        async def scenario(service):
+            started = time.perf_counter()
+            results = await asyncio.gather(*(service.analyse(f"Message {i}") for i in range(10)))
+            return results, time.perf_counter() - started
+
+        results, elapsed = self.run_service(scenario, concurrency=10, queue_size=2)
+        self.assertEqual(len(results), 10)
+        # Sequential handling would take 10 * 0.2 seconds
+        self.assertLess(elapsed, 1.0)
+
+    def test_timeout(self):
+        async def scenario(service):
+            with self.assertRaises(asyncio.TimeoutError):
+                await service.analyse("Too slow")
+
+        self.run_service(scenario, timeout=0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import datetime
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, remove_user, transaction, insert_records,
+    add_data_to_records,
+    get_weekly_activity, get_mood_distribution, get_server_summary, clear_analytics_cache
+)
+from lib.database import db_analytics
+from lib.utility.functions import calculate_composite_score
+
+GOOD = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+        'well_being': 8, 'energy': 6, 'productivity': 9}
+BAD = {'sentiment': 'Negative', 'mood': 'Very Bad', 'key_topics': ['rain'],
+       'well_being': 2, 'energy': 3, 'productivity': 1}
+
+
+class TestAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_analytics.db'
+        set_database(self.db_name)
+        init_database()
+        clear_analytics_cache()
+        for user_id, name in ((1, 'alice'), (2, 'bob'), (3, 'carol'), (4, 'dave')):
+            add_user(user_id, name)
+
+        # Alice checks in every day for three weeks, Bob only this week, Carol and Dave never
+        today = datetime.datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.monday = today - datetime.timedelta(days=today.weekday())
+        records = [(1, GOOD, "Fine", self.monday - datetime.timedelta(days=day), False) for day in range(1, 15)]
+        records.append((1, GOOD, "Fine", self.monday, False))
+        records.append((2, BAD, "Awful", self.monday, False))
+        with transaction() as cursor:
+            insert_records(cursor, records)
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_weekly_activity(self):
+        weeks = get_weekly_activity(3)
+        self.assertEqual([row[0] for row in weeks],
+                         [(self.monday - datetime.timedelta(weeks=n)).date().isoformat() for n in (2, 1, 0)])
+
+        week, check_ins, participants, rate, mean, moving_average, change = weeks[-1]
+        self.assertEqual((check_ins, participants), (2, 2))
+        self.assertAlmostEqual(rate, 0.5)
+        good, bad = calculate_composite_score(dict(GOOD)), calculate_composite_score(dict(BAD))
+        self.assertAlmostEqual(mean, (good + bad) / 2)
+        self.assertAlmostEqual(change, mean - good)
+        self.assertAlmostEqual(moving_average, (good * 2 + mean) / 3)
+        self.assertIsNone(weeks[0][-1])
+
+        # Older weeks fall outside a shorter window
+        self.assertEqual(len(get_weekly_activity(1)), 1)
+
+    def test_mood_distribution(self):
+        distribution = get_mood_distribution(days=7)
+        self.assertEqual([row[0] for row in distribution], ['Very Bad', 'Bad', 'Neutral', 'Good', 'Very Good'])
+        counts = {mood: check_ins for mood, check_ins, _ in distribution}
+        self.assertEqual(counts['Very Bad'], 1)
+        self.assertEqual(counts['Bad'], 0)
+        self.assertAlmostEqual(sum(share for _, _, share in distribution), 1.0)
+
+    def test_server_summary(self):
+        summary = get_server_summary(days=30)
+        self.assertEqual(summary['users'], 4)
+        self.assertEqual(summary['active_users'], 2)
+        self.assertEqual(summary['check_ins'], 16)
+        self.assertAlmostEqual(summary['participation_rate'], 0.5)
+
+    def test_removed_users_do_not_participate(self):
+        for user_id in (2, 3, 4):
+            remove_user(user_id)
+        clear_analytics_cache()
+
+        summary = get_server_summary(days=30)
+        self.assertEqual((summary['users'], summary['active_users']), (1, 1))
+        self.assertLessEqual(summary['participation_rate'], 1.0)
+        for week in get_weekly_activity(3):
+            self.assertLessEqual(week[3], 1.0)
+        self.assertEqual(get_weekly_activity(1)[0][2], 1)
+
+    def test_results_are_cached_within_period(self):
+        before = get_server_summary(days=30)
+        add_data_to_records(3, GOOD, 'New check-in')
+        self.assertEqual(get_server_summary(days=30), before)
+
+        ttl = db_analytics.ANALYTICS_TTL
+        db_analytics.ANALYTICS_TTL = 0
+        try:
+            self.assertEqual(get_server_summary(days=30)['active_users'], 3)
+        finally:
+            db_analytics.ANALYTICS_TTL = ttl
+
+    def test_render_server_stats(self):
+        from lib.plotting import render_server_stats
+        image = render_server_stats(weeks=3, days=7)
+        self.assertTrue(image.startswith(b'\x89PNG'))
+
+        set_database('tests/test_analytics_empty.db')
+        try:
+            init_database()
+            clear_analytics_cache()
+            self.assertIsNone(render_server_stats(weeks=3))
+        finally:
+            close_connections()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists('tests/test_analytics_empty.db' + suffix):
+                    os.remove('tests/test_analytics_empty.db' + suffix)
+
+
+if __name__ == '__main__':
+    unittest.main()
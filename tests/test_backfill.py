@@ -0,0 +1,113 @@
+import os
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records,
+    get_last_n_records_for_user, get_backfill_progress, get_backfill_failures
+)
+from lib.LLM.backfill import run_backfill
+from lib.LLM.LLM_message_analyser import parse_batch_response
+
+ANALYSIS = {'sentiment': 'Neutral', 'mood': 'Neutral', 'key_topics': ['old'],
+            'well_being': 5, 'energy': 5, 'productivity': 5}
+
+NEW_ANALYSIS = {'sentiment': 'Very Positive', 'mood': 'Very Good', 'key_topics': ['new'],
+                'well_being': 9, 'energy': 9, 'productivity': 9}
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_backfill.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        for i in range(7):
+            add_data_to_records(1, ANALYSIS, f'Message {i}')
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_backfill_rewrites_all_records(self):
+        def analyse_batch(batch):
+            return [(record_id, NEW_ANALYSIS) for record_id, _ in batch]
+
+        report = run_backfill('test', chunk_size=3, workers=2, batch_size=2, analyse_batch=analyse_batch)
+
+        self.assertEqual(report['processed'], 7)
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual({row[0] for row in get_last_n_records_for_user(1, column='sentiment')}, {'Very Positive'})
+        self.assertEqual(get_backfill_progress('test'), (7, 7, 0))
+
+    def test_backfill_resumes_after_crash(self):
+        seen = []
+
+        def crashing_batch(batch):
+            if batch[0][0] > 3:
+                raise KeyboardInterrupt
+            seen.extend(record_id for record_id, _ in batch)
+            return [(record_id, None if record_id == 2 else NEW_ANALYSIS) for record_id, _ in batch]
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_backfill('resume', chunk_size=3, workers=1, analyse_batch=crashing_batch)
+        self.assertEqual(get_backfill_progress('resume'), (3, 3, 1))
+
+        def analyse_batch(batch):
+            seen.extend(record_id for record_id, _ in batch)
+            return [(record_id, NEW_ANALYSIS) for record_id, _ in batch]
+
+        report = run_backfill('resume', chunk_size=3, workers=1, analyse_batch=analyse_batch)
+        self.assertEqual(report['processed'], 7)
+        # Record 2 failed before the crash and is retried first
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(seen, [1, 2, 3, 2, 4, 5, 6, 7])
+
+    def test_failed_records_are_retried_on_resume(self):
+        def flaky_batch(batch):
+            return [(record_id, None if record_id in (2, 5) else NEW_ANALYSIS) for record_id, _ in batch]
+
+        report = run_backfill('flaky', chunk_size=3, workers=2, analyse_batch=flaky_batch)
+        self.assertEqual((report['processed'], report['failed']), (7, 2))
+
+        retried = []
+
+        def analyse_batch(batch):
+            retried.extend(record_id for record_id, _ in batch)
+            return [(record_id, None if record_id == 5 else NEW_ANALYSIS) for record_id, _ in batch]
+
+        report = run_backfill('flaky', chunk_size=3, workers=1, analyse_batch=analyse_batch)
+        self.assertEqual(retried, [2, 5])
+        self.assertEqual((report['processed'], report['failed']), (7, 1))
+        self.assertEqual(get_backfill_failures('flaky'), [(5, 'Message 4')])
+
+        run_backfill('flaky', restart=True, analyse_batch=lambda batch: [(i, NEW_ANALYSIS) for i, _ in batch])
+        self.assertEqual(get_backfill_failures('flaky'), [])
+
+    def test_parse_batch_response(self):
+        text = """### Message 2
+Sentiment: Negative
+Mood: Bad
+Key Topics: exams
+Well-being: 3
+Energy: 2
+Productivity: 4
+
+### Message 1
+Sentiment: Positive
+Mood: Good
+Key Topics: work, friends
+Well-being: 8
+Energy: 7
+Productivity: 6"""
+        results = parse_batch_response(text, 3)
+        self.assertEqual(results[0]['key_topics'], ['work', 'friends'])
+        self.assertEqual(results[1]['mood'], 'Bad')
+        self.assertIsNone(results[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,28 +1,33 @@
 import unittest
+import asyncio
 import sqlite3
 import os
 import datetime
 from lib.database import (
-    create_database, add_user, remove_user, add_data_to_records, 
+    set_database, close_connections, transaction, add_user, remove_user, add_data_to_records, 
     add_incident, get_users, get_last_n_records_for_user, 
     get_all_records, get_incidents_for_user
 )
+from lib.database import aio, init_database, get_records_in_range, insert_records, get_fields
 from lib.utility import calculate_composite_score
 
+# Position of score in the full rows returned by get_last_n_records_for_user
+SCORE = (["id"] + get_fields("records")).index("score")
+
 class TestDatabaseFunctions(unittest.TestCase):
 
-    @classmethod
-    def setUpClass(cls):
-        # Set up a temporary database
-        cls.db_name = 'tests/test_db_file.db'
-        global db_name
-        db_name = cls.db_name
-        create_database()
+    def setUp(self):
+        # Every test gets a fresh temporary database
+        self.db_name = 'tests/test_db_file.db'
+        set_database(self.db_name)
+        init_database()
 
-    @classmethod
-    def tearDownClass(cls):
-        # Remove the database file after tests
-        os.remove(cls.db_name)
+    def tearDown(self):
+        # Remove the database file after each test
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
 
     def test_add_user(self):
         # Test adding a new user
@@ -64,7 +69,7 @@ class TestDatabaseFunctions(unittest.TestCase):
         # Check if record was added correctly
         records = get_last_n_records_for_user(3)
         self.assertEqual(len(records), 1)
-        self.assertEqual(records[0][-2], calculate_composite_score(data))  # Checking composite score
+        self.assertEqual(records[0][SCORE], calculate_composite_score(data))  # Checking composite score
 
     def test_add_incident(self):
         add_user(4, 'bob')
@@ -85,16 +90,101 @@ class TestDatabaseFunctions(unittest.TestCase):
         # Retrieve last record
         records = get_last_n_records_for_user(5, limit=1)
         self.assertEqual(len(records), 1)
-        self.assertEqual(records[0][-2], calculate_composite_score(data2))
+        self.assertEqual(records[0][SCORE], calculate_composite_score(data2))
 
         # Retrieve all records
         records = get_last_n_records_for_user(5)
         self.assertEqual(len(records), 2)
 
     def test_get_all_records(self):
-        # Assumes data has already been added in previous tests
-        all_records = get_all_records()
-        self.assertGreater(len(all_records), 0)
+        self.assertEqual(len(get_all_records()), 0)
+        add_user(9, 'grace')
+        add_data_to_records(9, {'well_being': 7, 'energy': 6, 'productivity': 5, 'sentiment': 'Positive',
+                                'mood': 'Good', 'key_topics': ['work']}, 'An entry')
+        self.assertEqual(len(get_all_records()), 1)
+
+    def test_transaction_commits_together(self):
+        with transaction():
+            add_user(6, 'dave')
+            add_incident(6, 'First')
+            add_incident(6, 'Second')
+
+        self.assertEqual(len(get_incidents_for_user(6)), 2)
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with transaction():
+                add_user(7, 'erin')
+                add_incident(7, 'Never stored')
+                raise RuntimeError("abort")
+
+        self.assertEqual(len(get_incidents_for_user(7)), 0)
+        self.assertTrue(add_user(7, 'erin'))
+
+    def test_aio_runs_off_loop(self):
+        async def scenario():
+            self.assertTrue(await aio.add_user(8, 'frank'))
+            await aio.add_incident(8, 'Async incident')
+            return await aio.get_incidents_for_user(8)
+
+        incidents = asyncio.run(scenario())
+        self.assertEqual(incidents[0][-1], 'Async incident')
+
+
+class TestRecordsInRange(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_range.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        add_user(2, 'bob')
+        self.start = datetime.datetime(2024, 9, 1, 21, 30)
+        data = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+                'well_being': 7, 'energy': 6, 'productivity': 5}
+        with transaction() as cursor:
+            insert_records(cursor, [(1, dict(data, well_being=day % 10 + 1), f"Day {day}",
+                                     self.start + datetime.timedelta(days=day), False) for day in range(30)])
+            insert_records(cursor, [(2, data, "Other user", self.start, False)])
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_window_and_columns(self):
+        rows, cursor = get_records_in_range(1, start=self.start + datetime.timedelta(days=10),
+                                            end=self.start + datetime.timedelta(days=20),
+                                            columns=["message", "well_being"])
+        self.assertIsNone(cursor)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0], ("Day 10", 1))
+        self.assertEqual(rows[-1], ("Day 19", 10))
+
+    def test_keyset_pages_cover_window_once(self):
+        messages, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = get_records_in_range(1, columns=["message"], limit=7, after=cursor)
+            messages += [row[0] for row in rows]
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(messages, [f"Day {day}" for day in range(30)])
+        self.assertEqual(pages, 5)
+
+    def test_column_dict(self):
+        columns, _ = get_records_in_range(1, start="2024-09-29", columns=["date", "well_being"], as_columns=True)
+        self.assertEqual(list(columns), ["date", "well_being"])
+        self.assertEqual(columns["well_being"], (9, 10))
+
+        empty, cursor = get_records_in_range(3, columns=["score"], as_columns=True)
+        self.assertEqual(empty, {"score": ()})
+        self.assertIsNone(cursor)
+
+    def test_rejects_unknown_columns(self):
+        with self.assertRaises(AssertionError):
+            get_records_in_range(1, columns=["message; DROP TABLE records"])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import os
+import csv
+import datetime
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records, add_incident,
+    iter_chunks, iter_records, iter_incidents, get_all_records
+)
+from lib.database.db_connection import get_connection
+from lib.database.db_export import export_table
+
+ANALYSIS = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+            'well_being': 8, 'energy': 6, 'productivity': 9}
+
+
+class TestStreamingExport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_name = 'tests/test_export.db'
+        cls.csv_name = 'tests/test_export.csv'
+        set_database(cls.db_name)
+        init_database()
+        for user_id in (1, 2):
+            add_user(user_id, f'user{user_id}')
+            for i in range(5):
+                add_data_to_records(user_id, ANALYSIS, f'Message {i}')
+            add_incident(user_id, 'Incident')
+
+        # Move the first record of user 1 a year back
+        cursor = get_connection().cursor()
+        cursor.execute("UPDATE records SET ts = ts - 365 * 86400 WHERE id = 1")
+        get_connection().commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        close_connections()
+        for path in (cls.db_name, cls.db_name + '-wal', cls.db_name + '-shm', cls.csv_name):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_iter_records_matches_get_all_records(self):
+        self.assertEqual(list(iter_records(chunk_size=3)), get_all_records())
+
+    def test_chunks_and_projection(self):
+        chunks = list(iter_chunks('records', columns=['user_id', 'score'], user_id=2, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertTrue(all(len(row) == 2 and row[0] == 2 for chunk in chunks for row in chunk))
+
+    def test_date_filter(self):
+        since = datetime.datetime.now() - datetime.timedelta(days=30)
+        self.assertEqual(len(list(iter_records(columns=['id'], start=since))), 9)
+        self.assertEqual(list(iter_records(columns=['id'], end=since)), [(1,)])
+        self.assertEqual(len(list(iter_incidents(user_id=1, start=since.date()))), 1)
+
+    def test_invalid_column(self):
+        with self.assertRaises(AssertionError):
+            list(iter_records(columns=['id; DROP TABLE records']))
+
+    def test_csv_export(self):
+        report = export_table('records', self.csv_name, columns=['id', 'user_id', 'message'], chunk_size=4)
+        self.assertEqual(report['rows'], 10)
+        with open(self.csv_name, newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['id', 'user_id', 'message'])
+        self.assertEqual(rows[1], ['1', '1', 'Message 0'])
+        self.assertEqual(len(rows), 11)
+
+if __name__ == '__main__':
+    unittest.main()
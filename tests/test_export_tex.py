@@ -0,0 +1,102 @@
+import os
+import shutil
+import datetime
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records, add_incident,
+    update_record_analyses, transaction
+)
+from lib.plotting.create_export_tex import export_reports, escape_tex, get_report_fingerprints
+
+ANALYSIS = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work', 'friends'],
+            'well_being': 8, 'energy': 6, 'productivity': 9}
+
+
+class TestMonthlyReports(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_export_tex.db'
+        self.output = 'tests/test_reports'
+        self.month = datetime.date.today().strftime('%Y-%m')
+        self.directory = os.path.join(self.output, self.month)
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        add_user(2, 'bob')
+        add_user(3, 'carol')
+        self.record = add_data_to_records(1, ANALYSIS, 'First day')
+        add_data_to_records(1, ANALYSIS, 'Second day')
+        add_data_to_records(2, ANALYSIS, 'First day')
+        add_incident(1, 'Lost 50% of my notes & my_file')
+
+    def tearDown(self):
+        close_connections()
+        shutil.rmtree(self.output, ignore_errors=True)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def export(self, **kwargs):
+        return export_reports(self.month, output=self.output, processes=1, **kwargs)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_reports_and_tables(self):
+        summary = self.export()
+        self.assertEqual((summary['generated'], summary['unchanged'], summary['failed']), (2, 0, 0))
+        # Carol has no check-ins, so she gets no report
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '3.tex')))
+
+        table = self.read('1.dat').splitlines()
+        self.assertEqual(table[0].split()[:3], ['day', 'count', 'well_being'])
+        self.assertEqual(table[1].split()[1:3], ['2', '8.0000'])
+
+        document = self.read('1.tex')
+        self.assertIn('2 check-ins on 1 days.', document)
+        self.assertIn(r'Lost 50\% of my notes \& my\_file', document)
+        self.assertIn(r'\item friends (2)', document)
+        self.assertIn('table[x=day, y=well_being] {1.dat}', document)
+
+    def test_only_changed_reports_are_regenerated(self):
+        self.export()
+        self.assertEqual(self.export()['generated'], 0)
+
+        add_data_to_records(2, ANALYSIS, 'Second day')
+        update_record_analyses([(self.record, dict(ANALYSIS, key_topics=['family']))])
+        summary = self.export()
+        self.assertEqual((summary['generated'], summary['unchanged']), (2, 0))
+        self.assertIn(r'\item family (1)', self.read('1.tex'))
+
+        add_incident(2, 'Missed the bus')
+        self.assertEqual(self.export()['generated'], 1)
+        self.assertEqual(self.export(force=True)['generated'], 2)
+
+    def test_fingerprint_sees_swapped_topics(self):
+        add_data_to_records(3, dict(ANALYSIS, key_topics=['a', 'b', 'c', 'd']), 'Topics')  # Topic ids 3 to 6
+        record = add_data_to_records(2, dict(ANALYSIS, key_topics=['a', 'd']), 'Second day')
+        before = get_report_fingerprints(self.month)
+        # Same number of topic links with the same sum of topic ids
+        update_record_analyses([(record, dict(ANALYSIS, key_topics=['b', 'c']))])
+        after = get_report_fingerprints(self.month)
+        self.assertNotEqual(before[2], after[2])
+        self.assertEqual(before[1], after[1])
+
+    def test_reports_without_data_are_removed(self):
+        self.export()
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM records WHERE user_id=2")
+            cursor.execute("DELETE FROM daily_rollups WHERE user_id=2")
+        summary = self.export()
+        self.assertEqual((summary['removed'], summary['unchanged']), (1, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '2.tex')))
+
+    def test_escape_tex(self):
+        self.assertEqual(escape_tex(r'a\b {c} ~^#$'),
+                         r'a\textbackslash{}b \{c\} \textasciitilde{}\textasciicircum{}\#\$')
+
+
+if __name__ == '__main__':
+    unittest.main()
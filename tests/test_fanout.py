@@ -0,0 +1,73 @@
+import time
+import asyncio
+import unittest
+
+from lib.utility.fanout import fan_out, RateLimiter, TokenBucket
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class TestFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.fetched = []
+        self.sent = []
+        self.attempts = {}
+
+    async def fetch_user(self, user_id):
+        self.fetched.append(user_id)
+        return user_id
+
+    async def send(self, user):
+        self.attempts[user] = self.attempts.get(user, 0) + 1
+        if user == 3 and self.attempts[user] == 1:
+            raise HTTPError(429)
+        if user == 4:
+            raise HTTPError(403)
+        await asyncio.sleep(0.01)
+        self.sent.append(user)
+
+    def run_fan_out(self, user_ids, **kwargs):
+        cache = {1: 1, 2: 2}
+        return asyncio.run(fan_out(user_ids, cache.get, self.fetch_user, self.send, backoff=0.001,
+                                   limiter=RateLimiter(route_limits={}, global_limit=None), **kwargs))
+
+    def test_summary(self):
+        summary = self.run_fan_out([1, 2, 3, 4, 5])
+        self.assertEqual(summary['delivered'], 4)
+        self.assertEqual(summary['failed'], 1)
+        self.assertIn(4, summary['errors'])
+        self.assertEqual(sorted(self.sent), [1, 2, 3, 5])
+
+    def test_cache_first_resolution(self):
+        summary = self.run_fan_out([1, 2, 5])
+        self.assertEqual(self.fetched, [5])
+        self.assertEqual(summary['fetched'], 1)
+
+    def test_retries_only_retryable_errors(self):
+        self.run_fan_out([3, 4])
+        self.assertEqual(self.attempts, {3: 2, 4: 1})
+
+    def test_concurrency(self):
+        summary = self.run_fan_out(range(100, 140), concurrency=20)
+        self.assertEqual(summary['delivered'], 40)
+        # 40 sends of 10 ms each would take at least 0.4 s one at a time
+        self.assertLess(summary['duration'], 0.3)
+
+    def test_token_bucket_rate(self):
+        async def scenario():
+            bucket = TokenBucket(rate=100, capacity=5)
+            started = time.perf_counter()
+            for _ in range(25):
+                await bucket.acquire()
+            return time.perf_counter() - started
+
+        # 5 tokens are available at once, the other 20 arrive at 100 per second
+        self.assertGreaterEqual(asyncio.run(scenario()), 0.19)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 
 import unittest
-from lib.utility.functions import normalize_score, calculate_composite_score
+import pandas as pd
+from lib.utility.functions import normalize_score, calculate_composite_score, calculate_composite_scores, convert_mood
 
 class TestFunctions(unittest.TestCase):
 
@@ -16,6 +17,27 @@ class TestFunctions(unittest.TestCase):
         # Case where min_val equals max_val (should handle divide-by-zero)
         with self.assertRaises(ZeroDivisionError):
             normalize_score(50, 100, 100)
+
+    def test_calculate_composite_scores_matches_scalar(self):
+        rows = [
+            {'well_being': 7, 'energy': 3, 'productivity': 9, 'sentiment': 'Positive', 'mood': 'Good', 'key_topics': []},
+            {'well_being': 1, 'energy': 10, 'productivity': 5, 'sentiment': 'Negative', 'mood': 'Unknown', 'key_topics': []},
+        ]
+        frame = pd.DataFrame(rows)
+        scores = calculate_composite_scores(frame)
+        for row, score in zip(rows, scores):
+            self.assertEqual(score, calculate_composite_score(dict(row)))
+
+    def test_calculate_composite_score_does_not_mutate(self):
+        row = {'well_being': 7, 'energy': 3, 'productivity': 9, 'sentiment': 'Positive', 'mood': 'Good', 'key_topics': []}
+        calculate_composite_score(row)
+        self.assertEqual(row['sentiment'], 'Positive')
+
+    def test_convert_mood_series(self):
+        moods = pd.Series(['Good', 'Bad', 'Unknown'], index=[3, 4, 5])
+        converted = convert_mood(moods)
+        self.assertEqual(list(converted.index), [3, 4, 5])
+        self.assertEqual(converted[5], 0.5)
             
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+import os
+import time
+import asyncio
+import threading
+import unittest
+
+from lib.database import init_database, set_database, close_connections
+from lib import jobs
+from lib.jobs import queue, worker
+from lib.jobs import aio as jobs_aio
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_jobs.db'
+        set_database(self.db_name)
+        init_database()
+        self.backoff = queue.BACKOFF
+        queue.BACKOFF = 0.0
+
+    def tearDown(self):
+        queue.BACKOFF = self.backoff
+        jobs.HANDLERS.pop("test", None)
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_enqueue_lease_ack(self):
+        job_id = jobs.enqueue("plot", {"user_id": 1, "metric": "all", "days": 31})
+        leased = jobs.lease("w1")
+        self.assertEqual([job.id for job in leased], [job_id])
+        self.assertEqual(leased[0].payload, {"user_id": 1, "metric": "all", "days": 31})
+        self.assertEqual(leased[0].attempts, 1)
+        self.assertEqual(jobs.lease("w2"), [])
+
+        self.assertTrue(jobs.ack(job_id, "w1", b"\x89PNG"))
+        job = jobs.get_job(job_id)
+        self.assertEqual(job.status, jobs.DONE)
+        self.assertEqual(job.result, b"\x89PNG")
+
+    def test_ack_requires_lease(self):
+        job_id = jobs.enqueue("analyse", {"message": "hi"})
+        jobs.lease("w1")
+        self.assertFalse(jobs.ack(job_id, "w2", {"ok": True}))
+        self.assertTrue(jobs.ack(job_id, "w1", {"ok": True}))
+        self.assertEqual(jobs.get_job(job_id).result, {"ok": True})
+
+    def test_delayed_and_filtered_jobs(self):
+        jobs.enqueue("plot", {}, delay=60)
+        analyse_id = jobs.enqueue("analyse", {})
+        self.assertEqual(jobs.lease("w1", kinds=["plot"]), [])
+        self.assertEqual([job.id for job in jobs.lease("w1", limit=5)], [analyse_id])
+
+    def test_retry_then_dead(self):
+        job_id = jobs.enqueue("analyse", {}, max_attempts=2)
+        jobs.lease("w1")
+        self.assertEqual(jobs.fail(job_id, "w1", "boom"), jobs.QUEUED)
+        self.assertEqual(jobs.lease("w1")[0].attempts, 2)
+        self.assertEqual(jobs.fail(job_id, "w1", "boom again"), jobs.DEAD)
+        self.assertEqual(jobs.lease("w1"), [])
+        self.assertEqual(jobs.get_job(job_id).error, "boom again")
+
+        self.assertEqual(jobs.retry_dead(), 1)
+        self.assertEqual(jobs.lease("w1")[0].attempts, 1)
+
+    def test_expired_lease_is_taken_over(self):
+        job_id = jobs.enqueue("analyse", {})
+        jobs.lease("crashed", lease_seconds=0.01)
+        time.sleep(0.02)
+        leased = jobs.lease("w2")
+        self.assertEqual([job.id for job in leased], [job_id])
+        self.assertEqual(leased[0].attempts, 2)
+        self.assertFalse(jobs.ack(job_id, "crashed"))
+
+    def test_concurrent_workers_never_share_a_job(self):
+        ids = [jobs.enqueue("analyse", {"n": n}) for n in range(200)]
+        taken = []
+
+        def take(name):
+            while True:
+                leased = jobs.lease(name, limit=3)
+                if not leased:
+                    return
+                taken.extend(job.id for job in leased)
+
+        threads = [threading.Thread(target=take, args=(f"w{n}",)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(taken), ids)
+
+    def test_run_worker(self):
+        calls = []
+
+        @jobs.handler("test")
+        def double(payload):
+            calls.append(payload)
+            if payload["n"] < 0:
+                raise ValueError("negative")
+            return payload["n"] * 2
+
+        good = jobs.enqueue("test", {"n": 21})
+        bad = jobs.enqueue("test", {"n": -1}, max_attempts=1)
+        counts = worker.run_worker("w1", kinds=["test"], exit_when_idle=True)
+
+        self.assertEqual(counts, {"succeeded": 1, "failed": 1})
+        self.assertEqual(jobs.get_job(good).result, 42)
+        self.assertEqual(jobs.get_job(bad).status, jobs.DEAD)
+        self.assertEqual(jobs.get_queue_stats()[jobs.DONE], 1)
+
+    def test_wait_for_job(self):
+        job_id = jobs.enqueue("plot", {})
+
+        def finish():
+            time.sleep(0.1)
+            jobs.lease("w1")
+            jobs.ack(job_id, "w1", b"image")
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        result = asyncio.run(jobs_aio.wait_for_job(job_id, timeout=5))
+        thread.join()
+        self.assertEqual(result, b"image")
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(jobs_aio.wait_for_job(jobs.enqueue("plot", {}), timeout=0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
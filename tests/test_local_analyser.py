@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import asyncio
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from lib.database import init_database, set_database, close_connections, add_user
+from lib.LLM.local_analyser import analyse_message_locally, SENTIMENT_LABELS, MOOD_LABELS
+from lib.LLM.hedging import HedgedCheckIn
+
+LLM_RESULT = {'sentiment': 'Very Positive', 'mood': 'Very Good', 'key_topics': ['work'],
+              'well_being': 10, 'energy': 9, 'productivity': 10}
+
+
+class TestLocalAnalyser(unittest.TestCase):
+
+    def test_same_shape_as_llm(self):
+        analysis = analyse_message_locally("Had a great day at work, finished the project early!")
+        self.assertEqual(set(analysis), {'sentiment', 'mood', 'key_topics', 'well_being', 'energy', 'productivity'})
+        self.assertIn(analysis['sentiment'], SENTIMENT_LABELS)
+        self.assertIn(analysis['mood'], MOOD_LABELS)
+        for key in ('well_being', 'energy', 'productivity'):
+            self.assertTrue(1 <= analysis[key] <= 10)
+        self.assertIn('work', analysis['key_topics'])
+
+    def test_polarity(self):
+        good = analyse_message_locally("I feel really happy and energetic, it was a productive day")
+        bad = analyse_message_locally("Exhausted and sad, I procrastinated all day")
+        self.assertGreater(good['well_being'], bad['well_being'])
+        self.assertGreater(good['energy'], bad['energy'])
+        self.assertGreater(good['productivity'], bad['productivity'])
+        self.assertIn(good['sentiment'], ('Positive', 'Very Positive'))
+        self.assertIn(bad['sentiment'], ('Negative', 'Very Negative'))
+
+    def test_negation(self):
+        self.assertIn(analyse_message_locally("I am not happy")['sentiment'], ('Negative', 'Very Negative'))
+
+    def test_empty_message_is_neutral(self):
+        analysis = analyse_message_locally("")
+        self.assertEqual(analysis['sentiment'], 'Neutral')
+        self.assertEqual(analysis['mood'], 'Neutral')
+        self.assertEqual(analysis['key_topics'], [])
+
+
+class FakeService:
+    """
+    Stands in for AnalysisService, answering after `delay` seconds, failing or being cancelled.
+    """
+
+    def __init__(self, delay, fail=False, cancel=False):
+        self.delay = delay
+        self.fail = fail
+        self.cancel = cancel
+
+    async def analyse(self, message):
+        await asyncio.sleep(self.delay)
+        if self.cancel:
+            raise asyncio.CancelledError()
+        if self.fail:
+            raise RuntimeError("LLM unavailable")
+        return dict(LLM_RESULT)
+
+
+class TestHedgedCheckIn(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_hedging.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def _records(self):
+        conn = sqlite3.connect(self.db_name)
+        rows = conn.execute("SELECT sentiment, provisional FROM records ORDER BY id").fetchall()
+        conn.close()
+        return rows
+
+    def test_fast_llm_is_stored_directly(self):
+        async def scenario():
+            check_ins = HedgedCheckIn(FakeService(0.01), budget=1.0)
+            return await check_ins.store(1, "Sad and tired")
+
+        analysis, provisional = asyncio.run(scenario())
+        self.assertFalse(provisional)
+        self.assertEqual(analysis, LLM_RESULT)
+        self.assertEqual(self._records(), [('Very Positive', 0)])
+
+    def test_slow_llm_upgrades_provisional_record(self):
+        async def scenario():
+            check_ins = HedgedCheckIn(FakeService(0.3), budget=0.05)
+            result = await check_ins.store(1, "Sad and tired")
+            before = self._records()
+            self.assertEqual(check_ins.pending_upgrades, 1)
+            await check_ins.drain()
+            return result, before
+
+        (analysis, provisional), before = asyncio.run(scenario())
+        self.assertTrue(provisional)
+        self.assertIn(analysis['sentiment'], ('Negative', 'Very Negative'))
+        self.assertEqual(before, [(analysis['sentiment'], 1)])
+        self.assertEqual(self._records(), [('Very Positive', 0)])
+
+    def test_failed_llm_stays_provisional(self):
+        async def scenario():
+            check_ins = HedgedCheckIn(FakeService(0.01, fail=True), budget=1.0)
+            return await check_ins.store(1, "Sad and tired")
+
+        _, provisional = asyncio.run(scenario())
+        self.assertTrue(provisional)
+        self.assertEqual(self._records()[0][1], 1)
+
+    def test_cancelled_llm_stays_provisional(self):
+        async def scenario():
+            check_ins = HedgedCheckIn(FakeService(0.01, cancel=True), budget=1.0)
+            return await check_ins.store(1, "Sad and tired")
+
+        _, provisional = asyncio.run(scenario())
+        self.assertTrue(provisional)
+        self.assertEqual(self._records()[0][1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
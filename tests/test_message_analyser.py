@@ -0,0 +1,70 @@
+import os
+import json
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from lib.LLM.LLM_message_analyser import (
+    parse_llm_response, parse_batch_response, build_request, ParseError
+)
+
+LEGACY_REPLY = """**Sentiment:** Very Positive
+**Mood:** Good
+**Key Topics:** work, friends
+**Well-being:** 8/10
+**Energy:** 12
+**Productivity:** 6"""
+
+
+class TestMessageAnalyser(unittest.TestCase):
+
+    def test_structured_reply(self):
+        metrics = parse_llm_response('{"s":1,"m":3,"t":["work","sleep"],"w":7,"e":5,"p":8}')
+        self.assertEqual(metrics, {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work', 'sleep'],
+                                   'well_being': 7, 'energy': 5, 'productivity': 8})
+
+    def test_structured_reply_is_clamped(self):
+        metrics = parse_llm_response('{"s":5,"m":-1,"t":[" a ","", "b","c","d","e","f"],"w":0,"e":11,"p":7.6}')
+        self.assertEqual(metrics['sentiment'], 'Very Positive')
+        self.assertEqual(metrics['mood'], 'Very Bad')
+        self.assertEqual(metrics['key_topics'], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual((metrics['well_being'], metrics['energy'], metrics['productivity']), (1, 10, 8))
+
+    def test_invalid_structured_reply(self):
+        for reply in ('{"s":1', '{"s":1,"m":3,"t":[],"w":7,"e":5}', '{"s":"high","m":3,"t":[],"w":7,"e":5,"p":1}',
+                  '{"s":NaN,"m":3,"t":[],"w":7,"e":5,"p":1}', '{"s":1,"m":3,"t":[],"w":Infinity,"e":5,"p":1}'):
+            with self.assertRaises(ParseError):
+                parse_llm_response(reply)
+
+    def test_legacy_reply(self):
+        metrics = parse_llm_response(LEGACY_REPLY)
+        self.assertEqual(metrics['sentiment'], 'Very Positive')
+        self.assertEqual(metrics['key_topics'], ['work', 'friends'])
+        self.assertEqual(metrics['well_being'], 8)
+        self.assertEqual(metrics['energy'], 10)
+
+    def test_single_line_legacy_reply(self):
+        metrics = parse_llm_response("Sentiment: Positive Mood: Good Key Topics: work, sleep, Energy drinks "
+                                     "Well-being: 6 Energy: 5 Productivity: 7")
+        self.assertEqual(metrics['key_topics'], ['work', 'sleep', 'Energy drinks'])
+        self.assertEqual((metrics['well_being'], metrics['energy'], metrics['productivity']), (6, 5, 7))
+
+    def test_legacy_reply_missing_metric(self):
+        with self.assertRaises(ParseError):
+            parse_llm_response(LEGACY_REPLY.replace("**Mood:** Good", ""))
+
+    def test_structured_batch_reply(self):
+        reply = json.dumps({"r": [{"s": 0, "m": 2, "t": ["exams"], "w": 3, "e": 2, "p": 4},
+                                  {"s": 1, "m": 3, "t": [], "w": 8}]})
+        results = parse_batch_response(reply, 3)
+        self.assertEqual(results[0]['sentiment'], 'Neutral')
+        self.assertIsNone(results[1])
+        self.assertIsNone(results[2])
+
+    def test_structured_request(self):
+        request = build_request("A long day at work")
+        self.assertEqual(request['response_format']['type'], 'json_schema')
+        self.assertTrue(request['response_format']['json_schema']['strict'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import asyncio
+import unittest
+
+from lib.utility.metrics import Metrics, Histogram, timed, format_summary
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for _ in range(90):
+            histogram.observe(0.002)
+        for _ in range(10):
+            histogram.observe(0.4)
+        self.assertLessEqual(histogram.percentile(0.5), 0.0025)
+        self.assertGreaterEqual(histogram.percentile(0.5), 0.001)
+        self.assertGreater(histogram.percentile(0.95), 0.25)
+        self.assertLessEqual(histogram.percentile(0.99), 0.4)
+        self.assertEqual(Histogram().percentile(0.5), 0.0)
+
+    def test_timed_counts_errors(self):
+        @timed("sync", registry=self.metrics)
+        def work(fail):
+            if fail:
+                raise ValueError("fail")
+            return 1
+
+        self.assertEqual(work(False), 1)
+        with self.assertRaises(ValueError):
+            work(True)
+        summary = self.metrics.summary()["sync"]
+        self.assertEqual(summary["count"], 2)
+        self.assertEqual(summary["errors"], 1)
+
+    def test_timed_coroutine(self):
+        @timed("async", registry=self.metrics)
+        async def work():
+            await asyncio.sleep(0.01)
+            return 2
+
+        self.assertEqual(asyncio.run(work()), 2)
+        summary = self.metrics.summary()["async"]
+        self.assertEqual(summary["count"], 1)
+        self.assertGreaterEqual(summary["max"], 0.01)
+
+    def test_prometheus_format(self):
+        self.metrics.observe("db.add_user", 0.003)
+        self.metrics.observe("db.add_user", 100.0, error=True)
+        self.metrics.gauge("queue_depth", lambda: 3)
+        text = self.metrics.to_prometheus()
+        self.assertIn('checkin_operation_duration_seconds_bucket{operation="db.add_user",le="0.005"} 1', text)
+        self.assertIn('checkin_operation_duration_seconds_bucket{operation="db.add_user",le="+Inf"} 2', text)
+        self.assertIn('checkin_operation_duration_seconds_count{operation="db.add_user"} 2', text)
+        self.assertIn('checkin_operation_errors_total{operation="db.add_user"} 1', text)
+        self.assertIn('checkin_queue_depth 3', text)
+
+    def test_format_summary(self):
+        self.metrics.observe("command.mydaywas", 1.5)
+        self.metrics.gauge("analysis_queue_depth", lambda: 0)
+        text = format_summary(self.metrics)
+        self.assertIn("command.mydaywas", text)
+        self.assertIn("analysis_queue_depth: 0", text)
+
+    def test_database_calls_are_timed(self):
+        from lib.database import set_database, init_database, close_connections, get_users
+        from lib.utility.metrics import metrics
+        db_name = 'tests/test_metrics.db'
+        set_database(db_name)
+        try:
+            init_database()
+            before = metrics.histogram("db.get_users").count
+            get_users()
+            self.assertEqual(metrics.histogram("db.get_users").count, before + 1)
+        finally:
+            close_connections()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_name + suffix):
+                    os.remove(db_name + suffix)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, get_last_n_records_for_user, get_incidents_for_user
+)
+from lib.database.db_connection import get_connection
+from lib.database import db_migrations
+from lib.database.db_migrations import MIGRATIONS, get_schema_version
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_migrations.db'
+
+        # Schema and rows as written before migrations existed
+        conn = sqlite3.connect(self.db_name)
+        conn.executescript("""
+            CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE records (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, date TEXT, well_being INT,
+                energy INT, productivity INT, sentiment TEXT, mood TEXT, score REAL, key_topics TEXT, message TEXT,
+                FOREIGN KEY(user_id) REFERENCES users(id));
+            CREATE TABLE incidents (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, date TEXT, incident TEXT,
+                FOREIGN KEY(user_id) REFERENCES users(id));
+            INSERT INTO users VALUES (1, 'Alice');
+        """)
+        conn.executemany("INSERT INTO records (user_id, date, message) VALUES (1, ?, ?)",
+                         [(f"2024-09-{day:02d}T21:30:00.000000", f"Day {day}") for day in range(1, 26)])
+        conn.execute("INSERT INTO records (user_id, date, message) VALUES (1, 'not a date', 'Broken')")
+        conn.execute("INSERT INTO incidents (user_id, date, incident) VALUES (1, '2024-09-03T10:00:00', 'Fell')")
+        conn.commit()
+        conn.close()
+
+        self.batch_size = db_migrations.MIGRATION_BATCH_SIZE
+        db_migrations.MIGRATION_BATCH_SIZE = 10
+        set_database(self.db_name)
+
+    def tearDown(self):
+        db_migrations.MIGRATION_BATCH_SIZE = self.batch_size
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_migrates_legacy_database(self):
+        init_database()
+        self.assertEqual(get_schema_version(), MIGRATIONS[-1][0])
+
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT COUNT(*) FROM records WHERE ts IS NULL")
+        self.assertEqual(cursor.fetchone()[0], 1)  # Only the unparseable date
+
+        latest = get_last_n_records_for_user(1, limit=1, column='message')
+        self.assertEqual(latest, [('Day 25',)])
+        self.assertIsNotNone(get_incidents_for_user(1)[0][-1])
+
+    def test_per_user_queries_use_index(self):
+        init_database()
+        cursor = get_connection().cursor()
+        for table, query in [("records", "SELECT * FROM records WHERE user_id=? ORDER BY ts DESC, id DESC LIMIT 10"),
+                             ("incidents", "SELECT * FROM incidents WHERE user_id=? ORDER BY ts, id")]:
+            cursor.execute("EXPLAIN QUERY PLAN " + query, (1,))
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+            self.assertIn(f"idx_{table}_user_ts", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_migrations_run_once(self):
+        init_database()
+        init_database()
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT COUNT(*) FROM schema_version")
+        self.assertEqual(cursor.fetchone()[0], len(MIGRATIONS))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import struct
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.database import init_database, set_database, close_connections, add_user, add_data_to_records
+from lib.plotting import plot_metric_over_time, render_metric_over_time
+from lib.plotting.plot_cache import plot_cache
+
+ANALYSIS = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+            'well_being': 8, 'energy': 6, 'productivity': 9}
+
+
+class TestPlotting(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_name = 'tests/test_plotting.db'
+        set_database(cls.db_name)
+        init_database()
+        add_user(1, 'alice')
+        add_data_to_records(1, ANALYSIS, 'First day')
+        add_data_to_records(1, ANALYSIS, 'Second day')
+
+    @classmethod
+    def tearDownClass(cls):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(cls.db_name + suffix):
+                os.remove(cls.db_name + suffix)
+
+    def test_plot_returns_png_bytes(self):
+        for metric in ['all', 'energy', 'mood', 'sentiment', 'score']:
+            image = plot_metric_over_time(1, metric)
+            self.assertTrue(image.startswith(b'\x89PNG'), metric)
+
+    def test_long_ranges_use_rollups(self):
+        image = plot_metric_over_time(1, 'all', days=365)
+        self.assertTrue(image.startswith(b'\x89PNG'))
+
+    def test_plot_cache_invalidated_by_new_records(self):
+        first = plot_metric_over_time(1, 'well_being', days=7)
+        hits = plot_cache.stats()['hits']
+        self.assertIs(plot_metric_over_time(1, 'well_being', days=7), first)
+        self.assertEqual(plot_cache.stats()['hits'], hits + 1)
+
+        add_data_to_records(1, ANALYSIS, 'Third day')
+        self.assertEqual(plot_cache.stats()['items'], 0)
+        self.assertIsNot(plot_metric_over_time(1, 'well_being', days=7), first)
+
+    def test_image_size_fits_discord(self):
+        for metric, size in [('all', (1200, 800)), ('mood', (1200, 600))]:
+            image = render_metric_over_time(1, metric)
+            self.assertEqual(struct.unpack('>II', image[16:24]), size)
+
+    def test_unknown_metric(self):
+        self.assertIsNone(render_metric_over_time(1, 'scores'))
+
+    def test_templates_are_reused_and_thread_safe(self):
+        metrics = ['all', 'mood', 'energy', 'score'] * 4
+        expected = [render_metric_over_time(1, metric) for metric in metrics]
+        # Rendering the same template again gives the same image
+        self.assertEqual(render_metric_over_time(1, 'all'), expected[0])
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            images = list(pool.map(lambda metric: render_metric_over_time(1, metric), metrics))
+        self.assertEqual(images, expected)
+
+if __name__ == '__main__':
+    unittest.main()
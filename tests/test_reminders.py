@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import datetime
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, set_reminder, get_reminder, get_users_due_for_reminder
+)
+from lib.utility.scheduler import (
+    scheduler, schedule_daily_message, schedule_reminders, parse_reminder, reminder_offset, dispatch_reminders
+)
+
+UTC = datetime.timezone.utc
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+
+class TestReminderSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_reminders.db'
+        set_database(self.db_name)
+        init_database()
+        for user_id in (1, 2, 3, 4):
+            add_user(user_id, f'user{user_id}')
+        set_reminder(2, '08:30', 'America/New_York')
+        set_reminder(3, '22:00', 'UTC')
+        set_reminder(4, '02:30', None)
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def due(self, minute):
+        return get_users_due_for_reminder(minute, '22:00', 'Europe/Oslo')
+
+    def test_set_reminder(self):
+        self.assertEqual(get_reminder(2), ('08:30', 'America/New_York'))
+        self.assertEqual(get_reminder(1), (None, None))
+        self.assertIsNone(get_reminder(5))
+        self.assertFalse(set_reminder(5, '08:00', 'UTC'))
+
+    def test_due_users_in_their_timezone(self):
+        self.assertEqual(self.due(utc(2026, 1, 15, 21, 0)), [1])   # 22:00 in Oslo, winter time
+        self.assertEqual(self.due(utc(2026, 7, 15, 20, 0)), [1])   # 22:00 in Oslo, summer time
+        self.assertEqual(self.due(utc(2026, 1, 15, 13, 30)), [2])
+        self.assertEqual(self.due(utc(2026, 1, 15, 22, 0)), [3])
+        self.assertEqual(self.due(utc(2026, 1, 15, 21, 1)), [])
+
+    def test_repeated_hour_reminds_once(self):
+        # Clocks in Oslo go back at 03:00 on 2026-10-25, so 02:30 happens at 00:30 and at 01:30 UTC
+        self.assertEqual(self.due(utc(2026, 10, 25, 0, 30)), [4])
+        self.assertEqual(self.due(utc(2026, 10, 25, 1, 30)), [])
+
+
+class TestReminderDispatch(unittest.TestCase):
+
+    def test_parse_reminder(self):
+        self.assertEqual(parse_reminder('9:05', 'Europe/Oslo'), ('09:05', 'Europe/Oslo'))
+        for time_text, timezone in [('25:00', 'UTC'), ('9pm', 'UTC'), ('21:00', 'Mars/Olympus'), ('21:00', '../x')]:
+            with self.assertRaises(ValueError):
+                parse_reminder(time_text, timezone)
+
+    def test_offsets_are_stable_and_spread(self):
+        offsets = [reminder_offset(user_id, 60) for user_id in range(1000)]
+        self.assertEqual(offsets, [reminder_offset(user_id, 60) for user_id in range(1000)])
+        self.assertTrue(all(0 <= offset < 60 for offset in offsets))
+        # 1000 users share a minute, but no second gets more than a small share of them
+        self.assertLess(max(offsets.count(second) for second in range(60)), 40)
+        self.assertEqual(reminder_offset(1, 0), 0)
+
+    def test_dispatch_spreads_a_bucket(self):
+        sent = []
+
+        async def send(user_ids):
+            sent.append((time.monotonic(), user_ids))
+
+        async def run():
+            await asyncio.gather(*dispatch_reminders(list(range(40)), send, jitter=2))
+
+        started = time.monotonic()
+        asyncio.run(run())
+        self.assertEqual(sorted(user_id for _, group in sent for user_id in group), list(range(40)))
+        self.assertEqual(len(sent), 2)
+        self.assertGreater(sent[-1][0] - started, 0.9)
+
+    def test_jobs_have_their_triggers(self):
+        async def remind():
+            pass
+
+        schedule_daily_message(22, 0, 'Europe/Oslo', remind)
+        schedule_reminders(remind, remind, jitter=60)
+        try:
+            daily, reminders = [str(job.trigger) for job in scheduler.get_jobs()]
+            self.assertIn("hour='22', minute='0'", daily)
+            # Unset fields above the second default to every value, so this fires every minute on the minute
+            self.assertEqual(reminders, "cron[second='0']")
+        finally:
+            scheduler.remove_all_jobs()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import time
+import asyncio
+import unittest
+
+from lib.database import init_database, set_database, close_connections, add_user
+from lib.plotting import RenderService, RenderQueueFull
+
+
+class TestRenderService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_name = 'tests/test_render_service.db'
+        set_database(cls.db_name)
+        init_database()
+        add_user(1, 'alice')
+        cls.renderer = RenderService(workers=2, queue_size=1, timeout=30.0)
+        cls.renderer.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.renderer.stop()
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(cls.db_name + suffix):
+                os.remove(cls.db_name + suffix)
+
+    def test_worker_reads_configured_database(self):
+        # The user exists but has no records, so the worker finds nothing to plot
+        self.assertIsNone(asyncio.run(self.renderer.plot(1, 'energy')))
+
+    def test_queue_limit(self):
+        async def scenario():
+            return await asyncio.gather(self.renderer.plot(1, 'energy'), self.renderer.plot(1, 'mood'),
+                                        return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], RenderQueueFull)
+
+    def test_timed_out_job_keeps_its_slot(self):
+        async def scenario():
+            self.renderer.timeout = 0.1
+            try:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await self.renderer._submit(time.sleep, 1.0)
+            finally:
+                self.renderer.timeout = 30.0
+            # The sleep is still running in a worker, so it still counts against the queue
+            with self.assertRaises(RenderQueueFull):
+                await self.renderer.plot(1, 'energy')
+
+        asyncio.run(scenario())
+        deadline = time.monotonic() + 5
+        while self.renderer.pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.renderer.pending, 0)
+
+if __name__ == '__main__':
+    unittest.main()
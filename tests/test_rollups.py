@@ -0,0 +1,62 @@
+import os
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records, update_record_analyses,
+    get_daily_rollups_for_user, get_rollup_fields, rebuild_daily_rollups, get_messages_after
+)
+from lib.utility.functions import calculate_composite_score
+
+GOOD = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+        'well_being': 8, 'energy': 6, 'productivity': 9}
+BAD = {'sentiment': 'Negative', 'mood': 'Very Bad', 'key_topics': ['rain'],
+       'well_being': 2, 'energy': 3, 'productivity': 1}
+
+
+class TestDailyRollups(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_rollups.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        add_data_to_records(1, GOOD, 'Good day')
+        add_data_to_records(1, BAD, 'Bad day')
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def rollup(self):
+        rows = get_daily_rollups_for_user(1, days=1)
+        self.assertEqual(len(rows), 1)
+        return dict(zip(get_rollup_fields(), rows[0]))
+
+    def test_incremental_rollup(self):
+        rollup = self.rollup()
+        self.assertEqual(rollup['count'], 2)
+        self.assertAlmostEqual(rollup['mean_well_being'], 5.0)
+        self.assertEqual(rollup['min_energy'], 3)
+        self.assertEqual(rollup['max_productivity'], 9)
+        self.assertAlmostEqual(rollup['mean_mood'], 0.375)
+        self.assertAlmostEqual(rollup['min_sentiment'], -0.5)
+        self.assertAlmostEqual(rollup['max_score'], calculate_composite_score(dict(GOOD)))
+
+    def test_rebuild_matches_incremental(self):
+        incremental = self.rollup()
+        rebuild_daily_rollups()
+        for field, value in self.rollup().items():
+            self.assertAlmostEqual(value, incremental[field], msg=field)
+
+    def test_updates_refresh_rollup(self):
+        record_ids = [record_id for record_id, _ in get_messages_after(0)]
+        update_record_analyses([(record_id, GOOD) for record_id in record_ids])
+
+        rollup = self.rollup()
+        self.assertEqual(rollup['count'], 2)
+        self.assertEqual(rollup['min_energy'], 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records,
+    get_all_records, get_daily_rollups_for_user, get_rollup_fields, get_score_weights
+)
+from lib.database.db_scoring import recompute_scores
+from lib.utility.functions import calculate_composite_score
+
+GOOD = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+        'well_being': 8, 'energy': 6, 'productivity': 9}
+BAD = {'sentiment': 'Negative', 'mood': 'Very Bad', 'key_topics': ['rain'],
+       'well_being': 2, 'energy': 3, 'productivity': 1}
+WEIGHTS = {'sentiment': 2.0, 'mood': 0.0, 'well_being': 1.0, 'energy': 1.0, 'productivity': 3.0}
+
+
+class TestRecomputeScores(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_scoring.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        for _ in range(3):
+            add_data_to_records(1, GOOD, 'Good day')
+            add_data_to_records(1, BAD, 'Bad day')
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_recompute_scores(self):
+        report = recompute_scores(WEIGHTS, chunk_size=4)
+        self.assertEqual(report['rows'], 6)
+
+        expected = {'Good day': calculate_composite_score(dict(GOOD), WEIGHTS),
+                    'Bad day': calculate_composite_score(dict(BAD), WEIGHTS)}
+        for record in get_all_records():
+            self.assertAlmostEqual(record[8], expected[record[-1]])
+
+    def test_recompute_scores_rebuilds_rollups(self):
+        recompute_scores(WEIGHTS)
+        rollup = dict(zip(get_rollup_fields(), get_daily_rollups_for_user(1, days=1)[0]))
+        self.assertAlmostEqual(rollup['max_score'], calculate_composite_score(dict(GOOD), WEIGHTS))
+
+    def test_new_records_use_the_stored_weights(self):
+        recompute_scores(WEIGHTS)
+        self.assertEqual(get_score_weights(), WEIGHTS)
+        record_id = add_data_to_records(1, BAD, 'Later day')
+        record = next(record for record in get_all_records() if record[0] == record_id)
+        self.assertAlmostEqual(record[8], calculate_composite_score(dict(BAD), WEIGHTS))
+
+        # Recomputing without weights keeps the stored ones
+        recompute_scores()
+        self.assertEqual(get_score_weights(), WEIGHTS)
+
+if __name__ == '__main__':
+    unittest.main()
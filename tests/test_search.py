@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records, update_record_analyses,
+    search_records, get_topic_counts, get_topic_count, rebuild_record_topics, transaction
+)
+
+DATA = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['Work', 'friends'],
+        'well_being': 8, 'energy': 6, 'productivity': 9}
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_search.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        add_user(2, 'bob')
+        self.first = add_data_to_records(1, DATA, 'Worked late on the project, then dinner with friends')
+        add_data_to_records(1, dict(DATA, key_topics=['work']), 'Exams are coming, studying all day')
+        add_data_to_records(1, dict(DATA, key_topics=['exams', ' Sleep ']), 'Could not sleep before the exam')
+        add_data_to_records(2, DATA, 'My project at work went well')
+
+    def tearDown(self):
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_search_is_stemmed_and_per_user(self):
+        results = search_records(1, 'exam')
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all('**' in snippet for _, _, snippet, _ in results))
+
+        self.assertEqual([row[0] for row in search_records(1, 'project work')], [self.first])
+        self.assertEqual(len(search_records(2, 'project')), 1)
+
+    def test_search_input_is_literal(self):
+        self.assertEqual(search_records(1, 'NOT "exam OR *'), [])
+        self.assertEqual(search_records(1, '  '), [])
+
+    def test_topic_counts(self):
+        self.assertEqual(get_topic_counts(1), [('work', 2), ('exams', 1), ('friends', 1), ('sleep', 1)])
+        self.assertEqual(get_topic_count(1, 'WORK'), 2)
+        self.assertEqual(get_topic_count(1, 'unknown'), 0)
+        self.assertEqual(get_topic_counts(limit=1), [('work', 3)])
+
+    def test_reanalysis_replaces_topics(self):
+        update_record_analyses([(self.first, dict(DATA, key_topics=['Family']))])
+        self.assertEqual(get_topic_count(1, 'family'), 1)
+        self.assertEqual(get_topic_count(1, 'friends'), 0)
+
+    def test_deleted_records_leave_the_index(self):
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM records WHERE id=?", (self.first,))
+        self.assertEqual(search_records(1, 'project'), [])
+        self.assertEqual(get_topic_count(1, 'friends'), 0)
+
+    def test_rebuild_record_topics(self):
+        expected = get_topic_counts(1)
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM record_topics")
+        rebuild_record_topics(batch_size=2)
+        self.assertEqual(get_topic_counts(1), expected)
+
+    def test_queries_use_indexes(self):
+        conn = sqlite3.connect(self.db_name)
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT topic_id, COUNT(*) FROM record_topics WHERE user_id=1 GROUP BY topic_id"))
+        conn.close()
+        self.assertIn("COVERING INDEX idx_record_topics_user_topic", plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import time
+import datetime
+import unittest
+
+from lib.database import (
+    init_database, set_database, close_connections, add_user, add_data_to_records, add_incident,
+    get_last_n_records_for_user, get_incidents_for_user, get_all_records, get_daily_rollups_for_user,
+    enable_write_behind, disable_write_behind
+)
+
+DATA = {'sentiment': 'Positive', 'mood': 'Good', 'key_topics': ['work'],
+        'well_being': 8, 'energy': 6, 'productivity': 9}
+
+
+class TestWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = 'tests/test_writer.db'
+        set_database(self.db_name)
+        init_database()
+        add_user(1, 'alice')
+        add_user(2, 'bob')
+        # A long delay, so only the size threshold, reads and shutdown flush during a test
+        self.buffer = enable_write_behind(max_rows=1000, max_delay=60)
+
+    def tearDown(self):
+        disable_write_behind()
+        close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_writes_are_buffered(self):
+        add_data_to_records(1, DATA, 'Good day')
+        add_incident(1, 'Fell off the bike')
+        self.assertEqual(self.buffer.pending(), 2)
+        self.assertEqual(self.buffer.flushes, 0)
+
+    def test_read_your_writes(self):
+        add_data_to_records(1, DATA, 'Good day')
+        add_incident(1, 'Fell off the bike')
+        self.assertEqual(len(get_last_n_records_for_user(1)), 1)
+        self.assertEqual(len(get_incidents_for_user(1)), 1)
+        self.assertEqual(get_daily_rollups_for_user(1, days=1)[0][1], 1)
+        self.assertEqual(self.buffer.flushes, 1)
+
+    def test_reads_of_other_users_do_not_flush(self):
+        add_data_to_records(1, DATA, 'Good day')
+        self.assertEqual(get_last_n_records_for_user(2), [])
+        self.assertEqual(self.buffer.pending(), 1)
+
+    def test_size_threshold(self):
+        self.buffer.max_rows = 10
+        for _ in range(10):
+            add_data_to_records(2, DATA, 'Good day')
+        deadline = time.monotonic() + 2
+        while self.buffer.rows_written < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(self.buffer.rows_written, 10)
+
+    def test_flush_on_disable(self):
+        for user_id in (1, 2):
+            add_data_to_records(user_id, DATA, 'Good day')
+        disable_write_behind()
+        self.assertEqual(len(get_all_records()), 2)
+        self.assertEqual(get_daily_rollups_for_user(2, days=1)[0][1], 1)
+
+    def test_malformed_record_fails_at_the_caller(self):
+        with self.assertRaises(KeyError):
+            add_data_to_records(1, {key: value for key, value in DATA.items() if key != 'mood'}, 'Good day')
+        self.assertEqual(self.buffer.pending(), 0)
+
+    def test_failing_row_is_dropped(self):
+        add_data_to_records(1, DATA, 'Good day')
+        # Queued without the checks of add_data_to_records, so only the flush finds the missing mood
+        self.buffer.add_record((1, {key: value for key, value in DATA.items() if key != 'mood'}, 'Bad row',
+                                datetime.datetime.now(), False))
+        add_incident(1, 'Fell off the bike')
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(len(get_last_n_records_for_user(1)), 1)
+        self.assertEqual(len(get_incidents_for_user(1)), 1)
+        self.assertEqual(self.buffer.stats()['rows_dropped'], 1)
+        self.assertEqual(self.buffer.pending(), 0)
+
+if __name__ == '__main__':
+    unittest.main()